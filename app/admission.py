@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from app.config import (
+    REDIS_URL,
+    AUTOSCALE_INTERVAL_SECONDS,
+    ADMISSION_ENABLED,
+    ADMISSION_SLO_SECONDS,
+    ADMISSION_WORKER_CONCURRENCY,
+    ADMISSION_CACHE_SECONDS,
+    ADMISSION_DEFAULT_TASK_SECONDS,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Workers push each task's run time here (capped list, newest first)
+TASK_LATENCY_KEY = "reply:task_latency"
+TASK_LATENCY_SAMPLES = 50
+# ...and count upstream 429s into short buckets, for the autoscaler
+THROTTLE_KEY = "reply:upstream_throttled"
+THROTTLE_BUCKET_SECONDS = 10
+
+# Autoscaling workers per consumed queue (sorted sets scored by last report)
+# and each one's last decision (see app.autoscaler)
+AUTOSCALERS_KEY = "reply:autoscalers:{}"
+AUTOSCALER_STATE_KEY = "reply:autoscaler:{}"
+
+def throttle_bucket(now: Optional[float] = None) -> str:
+    return f"{THROTTLE_KEY}:{int((now or time.time()) // THROTTLE_BUCKET_SECONDS)}"
+
+@dataclass
+class QueueStats:
+    depth: int
+    avg_task_seconds: float
+    fetched_at: float
+    concurrency: Optional[int] = None  # live pool size, when known
+
+@dataclass
+class Decision:
+    admit: bool
+    estimated_wait: float
+    retry_after: int = 0
+
+def estimate_wait(depth: int, avg_task_seconds: float, concurrency: int) -> float:
+    """Seconds a newly enqueued task waits before a worker picks it up."""
+    return depth * avg_task_seconds / max(1, concurrency)
+
+def average_latency(samples: List) -> float:
+    values = [float(s) for s in samples]
+    return sum(values) / len(values) if values else ADMISSION_DEFAULT_TASK_SECONDS
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+class AdmissionController:
+    """
+    Decide whether a new reply job can still finish within the SLO.
+
+    Queue depth and recent task latency come from Redis in one pipelined
+    round-trip, cached for `cache_seconds` and shared by concurrent callers,
+    so admission does not add a Redis call to every request. In-process
+    executors pass their own `fetch` instead.
+
+    Autoscaled workers resize their pools at runtime, so the live pool size
+    is read from the state they publish; without any, `max_concurrency` is
+    assumed (the pools are sized up before the backlog nears the SLO).
+    """
+
+    def __init__(self, queues: List[str], slo_seconds: float = ADMISSION_SLO_SECONDS,
+                 concurrency: int = ADMISSION_WORKER_CONCURRENCY,
+                 max_concurrency: Optional[int] = None,
+                 cache_seconds: float = ADMISSION_CACHE_SECONDS,
+                 fetch: Optional[Callable[[], Awaitable[QueueStats]]] = None):
+        self.queues = queues
+        # Gauges are per controller, so lanes don't overwrite each other's
+        self.name = "_".join(queues)
+        self.slo_seconds = slo_seconds
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or concurrency
+        self.cache_seconds = cache_seconds
+        self._stats: Optional[QueueStats] = None
+        self._refreshing: Optional[asyncio.Future] = None
+        self._unavailable_until = 0.0
+        self._client = None
+        if fetch is not None:
+            self._fetch = fetch
+
+    def _redis(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis.from_url(
+                REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5,
+            )
+        return self._client
+
+    async def _fetch(self) -> QueueStats:
+        client = self._redis()
+        live_since = time.time() - 3 * max(AUTOSCALE_INTERVAL_SECONDS, 1)
+        pipe = client.pipeline(transaction=False)
+        for queue in self.queues:
+            pipe.llen(queue)
+            pipe.zrangebyscore(AUTOSCALERS_KEY.format(queue), live_since, "+inf")
+        pipe.lrange(TASK_LATENCY_KEY, 0, TASK_LATENCY_SAMPLES - 1)
+        *per_queue, samples = await pipe.execute()
+        depths, hosts = per_queue[0::2], {h for hs in per_queue[1::2] for h in hs}
+        concurrency = None
+        if hosts:
+            # Second round trip only when workers autoscale
+            pipe = client.pipeline(transaction=False)
+            for host in hosts:
+                pipe.hget(AUTOSCALER_STATE_KEY.format(_text(host)), "target")
+            targets = [int(float(t)) for t in await pipe.execute() if t is not None]
+            concurrency = sum(targets) if targets else None
+        return QueueStats(sum(depths), average_latency(samples), time.monotonic(), concurrency)
+
+    async def stats(self) -> Optional[QueueStats]:
+        """Cached queue stats; None if Redis cannot be reached."""
+        now = time.monotonic()
+        if self._stats and now - self._stats.fetched_at < self.cache_seconds:
+            return self._stats
+        if now < self._unavailable_until:
+            return None
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._fetch())
+        refreshing = self._refreshing
+        try:
+            self._stats = await asyncio.shield(refreshing)
+        except Exception as e:
+            logger.warning(f"Admission stats unavailable, admitting: {e}")
+            self._unavailable_until = time.monotonic() + self.cache_seconds
+            return None
+        finally:
+            if self._refreshing is refreshing:
+                self._refreshing = None
+        metrics.gauge(f"queue_depth_{self.name}", self._stats.depth)
+        metrics.gauge(f"avg_task_seconds_{self.name}", self._stats.avg_task_seconds)
+        return self._stats
+
+    async def check(self) -> Decision:
+        if not ADMISSION_ENABLED:
+            return Decision(admit=True, estimated_wait=0.0)
+        stats = await self.stats()
+        if stats is None:
+            return Decision(admit=True, estimated_wait=0.0)
+        concurrency = stats.concurrency or self.max_concurrency
+        wait = estimate_wait(stats.depth, stats.avg_task_seconds, concurrency)
+        metrics.gauge(f"admission_concurrency_{self.name}", concurrency)
+        metrics.gauge(f"estimated_wait_seconds_{self.name}", wait)
+        if wait <= self.slo_seconds:
+            metrics.incr("admission_admitted")
+            return Decision(admit=True, estimated_wait=wait)
+        metrics.incr("admission_shed")
+        # Come back once the excess backlog should have drained
+        retry_after = max(1, math.ceil(wait - self.slo_seconds))
+        return Decision(admit=False, estimated_wait=wait, retry_after=retry_after)
+
+_sync_client = None
+
+def record_task_latency(seconds: float, throttled: int = 0) -> None:
+    """
+    Called by workers after each reply task; feeds the latency estimate and
+    counts the upstream 429s (`throttled`) the task ran into.
+    """
+    global _sync_client
+    try:
+        if _sync_client is None:
+            import redis
+            _sync_client = redis.Redis.from_url(
+                REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5,
+            )
+        pipe = _sync_client.pipeline(transaction=False)
+        pipe.lpush(TASK_LATENCY_KEY, f"{seconds:.3f}")
+        pipe.ltrim(TASK_LATENCY_KEY, 0, TASK_LATENCY_SAMPLES - 1)
+        if throttled:
+            bucket = throttle_bucket()
+            pipe.incrby(bucket, throttled)
+            pipe.expire(bucket, 10 * THROTTLE_BUCKET_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Could not record task latency: {e}")
@@ -1,55 +1,147 @@
+import asyncio
+import hmac
 import logging
 import json
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from celery.result import AsyncResult
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from celery_app import celery_app
-from app.celery_tasks import generate_reply_task
+from app.admission import AdmissionController
+from app.executors import ExecutorFull, get_executor
+from app.config import ADMIN_TOKEN, ADMISSION_SHED_MODE, REPLY_LANES
+from app.models import ProfilerSettings, ReplyRequest
 from app.services.reply import sanitize_log_message
+from app.services.pool import classify_topic, reply_pool
+from app.metrics import metrics
+from app.profiler import profiler
+from app.warmup import readiness, resolve_upstream, run_checks, warm_text_pipeline_async
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-
-class ReplyRequest(BaseModel):
-    original: dict
-    target:   dict
-    history:  list = []
+# Celery, in-process asyncio or local process pool, per EXECUTOR_BACKEND
+executor = get_executor()
+# Each lane is admitted against its own queue, worker pool size and SLO
+admission = {
+    lane: AdmissionController([lane], slo_seconds=cfg["slo_seconds"],
+                              concurrency=cfg["concurrency"],
+                              max_concurrency=cfg["max_concurrency"],
+                              fetch=executor.stats_fetcher(lane))
+    for lane, cfg in REPLY_LANES.items()
+}
 
 @router.post("/generate-reply")
 async def enqueue_reply(request: ReplyRequest):
     """
     Enqueue a reply job and return a task_id immediately.
+    When the backlog would blow the latency SLO, shed the request instead.
     """
-    logger.info("Enqueuing generate-reply task")
-    safe = sanitize_log_message(request.dict())
-    logger.debug("Sanitized request:\n%s", json.dumps(safe, indent=2))
+    decision = await admission[request.priority].check()
+    if not decision.admit:
+        if ADMISSION_SHED_MODE == "degraded":
+            topic = classify_topic(f"{request.original.text} {request.target.text}")
+            reply = await asyncio.to_thread(reply_pool.take, topic)
+            if reply:
+                logger.warning("Queue over SLO → answered from reply pool")
+                return {"status": "done", "reply": reply, "degraded": True}
+        logger.warning(
+            f"Queue over SLO (est. wait {decision.estimated_wait:.1f}s) → rejecting"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail="Reply queue is overloaded, retry later",
+            headers={"Retry-After": str(decision.retry_after)},
+        )
 
-    payload = {
-        "original": request.original,
-        "target":   request.target,
-        "history":  request.history,
-        "postId":   "system-generated"
-    }
+    logger.info("Enqueuing generate-reply task")
+    # The validated model is dumped once and that dict is what gets enqueued
+    payload = request.payload()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sanitized request:\n%s",
+                     json.dumps(sanitize_log_message(payload), indent=2))
 
-    task = generate_reply_task.delay(payload)
-    return {"task_id": task.id}
+    try:
+        task_id = await executor.submit(payload, request.priority, request.fetch_result)
+    except ExecutorFull as e:
+        logger.warning(f"{e} → rejecting")
+        raise HTTPException(status_code=503, detail="Reply queue is full, retry later",
+                            headers={"Retry-After": "1"})
+    return {"task_id": task_id}
 
 @router.get("/generate-reply/{task_id}")
 async def get_reply(task_id: str):
     """
     Poll for the status and result of a previously enqueued task.
+    A finished result is handed out once and then deleted.
+    """
+    return await executor.status(task_id)
+
+@router.get("/metrics")
+async def get_metrics():
     """
-    res = AsyncResult(task_id, app=celery_app)
-    state = res.state
+    In-process counters, gauges and timings for this API process,
+    plus the executor's backlog and result storage.
+    """
+    await executor.collect_metrics()
+    return metrics.snapshot()
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz():
+    """Readiness: 503 until this process has finished its startup warmup."""
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+def require_admin(x_admin_token: str = Header("")) -> None:
+    """Admin endpoints need ADMIN_TOKEN; without one configured they don't exist."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
-    if state == "PENDING":
-        return {"status": "pending"}
-    if state == "SUCCESS":
-        return {"status": "done", "reply": res.result}
-    if state == "FAILURE":
-        return {"status": "failure", "error": str(res.result)}
+@router.get("/admin/profiler", dependencies=[Depends(require_admin)])
+async def profiler_status():
+    """Sampling profiler settings and the newest captures on this host."""
+    return await asyncio.to_thread(profiler.status)
+
+@router.post("/admin/profiler", dependencies=[Depends(require_admin)])
+async def configure_profiler(settings: ProfilerSettings):
+    """
+    Turn the sampling profiler on/off or change its threshold. The settings
+    are shared through PROFILER_DIR, so every API and Celery process on this
+    host follows within a second.
+    """
+    return await asyncio.to_thread(profiler.configure, settings.enabled,
+                                   settings.threshold_seconds)
+
+@router.get("/admin/profiler/captures/{name}", dependencies=[Depends(require_admin)])
+async def get_profile(name: str):
+    """One capture as collapsed stacks (flamegraph.pl / speedscope input)."""
+    folded = await asyncio.to_thread(profiler.read, name)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="No such capture")
+    return PlainTextResponse(folded)
+
+_warmup_task = None
+
+@router.on_event("startup")
+async def start_warmup():
+    """
+    Warm this worker in the background once it has forked: the executor's
+    connections must come up; DNS and admission stats are best effort.
+    """
+    global _warmup_task
+    checks = {"text_pipeline": (warm_text_pipeline_async, True),
+              "dns": (resolve_upstream, False)}
+    checks.update({name: (fn, True) for name, fn in executor.warmup_checks().items()})
+    checks.update({f"admission_{lane}": (controller.stats, False)
+                   for lane, controller in admission.items()})
+    _warmup_task = asyncio.create_task(run_checks(checks))
 
-    # Covers states like RETRY
-    return {"status": state}
+@router.on_event("shutdown")
+async def shutdown_executor():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    await executor.shutdown()
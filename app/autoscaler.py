@@ -0,0 +1,254 @@
+import logging
+import math
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from celery.worker.autoscale import Autoscaler
+
+from app.admission import (
+    AUTOSCALER_STATE_KEY,
+    AUTOSCALERS_KEY,
+    TASK_LATENCY_KEY,
+    TASK_LATENCY_SAMPLES,
+    THROTTLE_BUCKET_SECONDS,
+    average_latency,
+    throttle_bucket,
+)
+from app.config import (
+    AUTOSCALE_DOWN_DELAY_SECONDS,
+    AUTOSCALE_INTERVAL_SECONDS,
+    AUTOSCALE_TARGET_WAIT_FRACTION,
+    AUTOSCALE_THROTTLE_BACKOFF,
+    AUTOSCALE_THROTTLE_COOLDOWN_SECONDS,
+    AUTOSCALE_THROTTLE_WINDOW_SECONDS,
+    REDIS_URL,
+    REPLY_LANES,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ScaleSignals:
+    depths: Dict[str, int]   # tasks waiting, per queue this worker consumes
+    reserved: int            # tasks this worker holds (running or prefetched)
+    avg_task_seconds: float  # recent task run time across workers
+    throttled: int           # upstream 429s in the throttle window
+    workers: Dict[str, int] = field(default_factory=dict)  # autoscalers per queue
+
+    @property
+    def depth(self) -> int:
+        return sum(self.depths.values())
+
+    @property
+    def share(self) -> float:
+        """This worker's part of the backlog: each queue split among its consumers."""
+        return sum(n / max(1, self.workers.get(q, 1)) for q, n in self.depths.items())
+
+class ScalingPolicy:
+    """
+    Target pool size from queue depth, task latency and upstream throttling.
+
+    Each worker takes its share of the backlog and sizes its pool so that
+    share drains within `target_wait` at the current task latency, plus a
+    process per task it already holds; so slower upstream calls mean more
+    concurrent calls for the same throughput. Upstream 429s win over
+    everything: the pool shrinks by `throttle_backoff` and stays from
+    growing for `throttle_cooldown` seconds. The 429 signal covers a window
+    longer than the decision interval, so a burst only backs off once; 429s
+    still seen once the cooldown is over back off again. Growth is immediate, but the
+    pool only shrinks once the target has been lower for `down_delay`
+    seconds, and then by half the difference at a time.
+    """
+
+    def __init__(self, min_concurrency: int, max_concurrency: int, target_wait: float,
+                 down_delay: float = AUTOSCALE_DOWN_DELAY_SECONDS,
+                 throttle_backoff: float = AUTOSCALE_THROTTLE_BACKOFF,
+                 throttle_cooldown: float = AUTOSCALE_THROTTLE_COOLDOWN_SECONDS):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_wait = target_wait
+        self.down_delay = down_delay
+        self.throttle_backoff = throttle_backoff
+        self.throttle_cooldown = throttle_cooldown
+        self._below_since: Optional[float] = None
+        self._cooldown_until = 0.0
+
+    def _clamp(self, n: int) -> int:
+        return max(self.min_concurrency, min(self.max_concurrency, n))
+
+    def wanted(self, s: ScaleSignals) -> int:
+        """Pool size the signals call for, before hysteresis."""
+        backlog = math.ceil(s.share * s.avg_task_seconds / max(self.target_wait, 1e-3))
+        return self._clamp(s.reserved + backlog)
+
+    def decide(self, current: int, s: ScaleSignals, now: float) -> Tuple[int, str]:
+        """(target pool size, reason) for a pool of `current` processes."""
+        if s.throttled:
+            self._below_since = None
+            if now < self._cooldown_until:
+                return current, "cooldown"  # already backed off for these 429s
+            self._cooldown_until = now + self.throttle_cooldown
+            return self._clamp(math.floor(current * self.throttle_backoff)), "throttled"
+        wanted = self.wanted(s)
+        if wanted > current:
+            self._below_since = None
+            if now < self._cooldown_until:
+                return current, "cooldown"
+            return wanted, "backlog"
+        if wanted == current:
+            self._below_since = None
+            return current, "steady"
+        if self._below_since is None:
+            self._below_since = now
+        if now - self._below_since < self.down_delay:
+            return current, "hysteresis"
+        self._below_since = now  # the next step down waits another down_delay
+        return max(wanted, current - max(1, (current - wanted) // 2)), "idle"
+
+class ReplyAutoscaler(Autoscaler):
+    """
+    Celery autoscaler driven by ScalingPolicy instead of the reserved-task
+    count. Enable with `celery worker --autoscale=MAX,MIN` (the autoscaler
+    class is set in celery_app). Signals come from Redis in one pipelined
+    round trip at most every AUTOSCALE_INTERVAL_SECONDS; if Redis is down
+    the stock reserved-count behaviour takes over. Decisions are counted in
+    the worker's metrics, returned by `celery inspect stats` and published
+    to Redis for the API's /metrics.
+    """
+
+    def __init__(self, pool, max_concurrency, min_concurrency=0, worker=None,
+                 keepalive=AUTOSCALE_INTERVAL_SECONDS, mutex=None):
+        super().__init__(pool, max_concurrency, min_concurrency, worker=worker,
+                         keepalive=keepalive, mutex=mutex)
+        self.hostname = getattr(worker, "hostname", None) or socket.gethostname()
+        self.policy = ScalingPolicy(min_concurrency, max_concurrency, 0.0)
+        self.last: Dict = {}
+        self._queues: Optional[List[str]] = None
+        self._next_decision = 0.0
+        self._client = None
+
+    def queues(self) -> List[str]:
+        if self._queues is None:
+            try:
+                names = list(self.worker.app.amqp.queues.consume_from)
+            except Exception:
+                names = []
+            self._queues = [q for q in names if q in REPLY_LANES] or list(REPLY_LANES)
+            # Aim well inside the strictest SLO, so admission control never sheds
+            slo = min(REPLY_LANES[q]["slo_seconds"] for q in self._queues)
+            self.policy.target_wait = slo * AUTOSCALE_TARGET_WAIT_FRACTION
+        return self._queues
+
+    def _redis(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(
+                REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5,
+            )
+        return self._client
+
+    def signals(self) -> ScaleSignals:
+        now = time.time()
+        queues = self.queues()
+        buckets = [throttle_bucket(now - i * THROTTLE_BUCKET_SECONDS)
+                   for i in range(max(1, int(AUTOSCALE_THROTTLE_WINDOW_SECONDS
+                                             // THROTTLE_BUCKET_SECONDS)))]
+        pipe = self._redis().pipeline(transaction=False)
+        for queue in queues:
+            key = AUTOSCALERS_KEY.format(queue)
+            pipe.zadd(key, {self.hostname: now})
+            pipe.zremrangebyscore(key, "-inf", now - 3 * max(self.keepalive, 1))
+            pipe.zcard(key)
+            pipe.llen(queue)
+        pipe.lrange(TASK_LATENCY_KEY, 0, TASK_LATENCY_SAMPLES - 1)
+        pipe.mget(buckets)
+        *per_queue, samples, throttled = pipe.execute()
+        workers = {q: max(1, per_queue[4 * i + 2]) for i, q in enumerate(queues)}
+        depths = {q: per_queue[4 * i + 3] for i, q in enumerate(queues)}
+        return ScaleSignals(
+            depths=depths, reserved=self.qty, avg_task_seconds=average_latency(samples),
+            throttled=sum(int(n) for n in throttled if n), workers=workers,
+        )
+
+    def _maybe_scale(self, req=None):
+        now = time.monotonic()
+        if now < self._next_decision:  # also called for every task message
+            return False
+        self._next_decision = now + self.keepalive
+        try:
+            signals = self.signals()
+        except Exception as e:
+            logger.warning(f"Autoscaler signals unavailable, scaling on reserved tasks: {e}")
+            return super()._maybe_scale(req)
+        procs = self.processes
+        target, reason = self.policy.decide(procs, signals, now)
+        self._record(procs, target, reason, signals)
+        if target > procs:
+            self.scale_up(target - procs)
+            return True
+        if target < procs:
+            self._shrink(procs - target)
+            return True
+        return False
+
+    def _record(self, procs: int, target: int, reason: str, signals: ScaleSignals) -> None:
+        action = "up" if target > procs else "down" if target < procs else "hold"
+        metrics.incr(f"autoscale_{action}")
+        metrics.incr(f"autoscale_reason_{reason}")
+        metrics.gauge("autoscale_processes", target)
+        metrics.gauge("autoscale_wanted", self.policy.wanted(signals))
+        self.last = {"processes": procs, "target": target, "action": action,
+                     "reason": reason, "at": time.time(), "depth": signals.depth,
+                     "share": signals.share, "reserved": signals.reserved,
+                     "avg_task_seconds": signals.avg_task_seconds,
+                     "throttled": signals.throttled, "workers": signals.workers}
+        if action != "hold":
+            logger.info(f"Autoscale {procs} → {target} ({reason}: {signals})")
+        try:
+            key = AUTOSCALER_STATE_KEY.format(self.hostname)
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.hset(key, mapping={k: str(v) for k, v in self.last.items()})
+            pipe.expire(key, int(3 * max(self.keepalive, 1)) + 1)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Could not publish autoscaler state: {e}")
+
+    def update(self, max=None, min=None):
+        result = super().update(max, min)
+        self.policy.max_concurrency, self.policy.min_concurrency = \
+            self.max_concurrency, self.min_concurrency
+        return result
+
+    def info(self):
+        return {**super().info(), "last_decision": self.last,
+                "target_wait_seconds": self.policy.target_wait}
+
+_async_client = None
+
+async def collect_autoscaler_metrics(client=None) -> None:
+    """Copy every live autoscaler's last decision into this process's gauges."""
+    global _async_client
+    if client is None:
+        if _async_client is None:
+            import redis.asyncio as aioredis
+            _async_client = aioredis.Redis.from_url(
+                REDIS_URL, decode_responses=True,
+                socket_timeout=0.5, socket_connect_timeout=0.5,
+            )
+        client = _async_client
+    pipe = client.pipeline(transaction=False)
+    for lane in REPLY_LANES:
+        pipe.zrange(AUTOSCALERS_KEY.format(lane), 0, -1)
+    hosts = sorted({host for lane_hosts in await pipe.execute() for host in lane_hosts})
+    if not hosts:
+        return
+    pipe = client.pipeline(transaction=False)
+    for host in hosts:
+        pipe.hgetall(AUTOSCALER_STATE_KEY.format(host))
+    for host, state in zip(hosts, await pipe.execute()):
+        for name in ("processes", "target", "depth", "share", "avg_task_seconds", "throttled"):
+            if name in state:
+                metrics.gauge(f"autoscaler_{host}_{name}", float(state[name]))
@@ -0,0 +1,297 @@
+"""
+Offline batch replies: stream a JSONL file of threads (one /generate-reply
+request body per line) through make_reply and write one JSON result per line.
+
+    python -m app.batch threads.jsonl replies.jsonl [-c 8] [--rate 5] [--limit N]
+
+Results are written in input order, so progress is a single watermark (input
+and output byte offsets) saved to `<output>.ckpt`; rerunning the same command
+resumes after the last written line. At most a fixed window of lines is in
+memory at a time, whatever the input size.
+
+Replies are generated without the canned fallbacks the API serves: a line
+the upstream could not answer (error, outage) stops the run before that
+line, so rerunning retries it; other lines without a reply get an error
+record.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from app.config import (
+    BATCH_CHECKPOINT_SECONDS,
+    BATCH_CONCURRENCY,
+    BATCH_RATE_PER_SECOND,
+)
+from app.models import ReplyRequest
+
+logger = logging.getLogger(__name__)
+
+ReplyFn = Callable[[Dict], Awaitable[str]]
+
+class UpstreamUnavailable(Exception):
+    """A line failed retryably; the run stopped before it."""
+
+# Stands in for a line's output when it must be retried on the next run
+_RETRY = object()
+
+class RateLimiter:
+    """Token bucket: `rate` acquisitions per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+@dataclass
+class Checkpoint:
+    """Everything before `input_offset` has its result before `output_offset`."""
+    input: str = ""
+    input_offset: int = 0
+    output_offset: int = 0
+    lines: int = 0
+    ok: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)  # atomic: a crash leaves the old or the new one
+
+class Progress:
+    """Throughput and ETA from input bytes consumed, printed every `every` seconds."""
+
+    def __init__(self, total_bytes: int, start: Checkpoint, every: float, out: TextIO):
+        self.total = total_bytes
+        self.start_offset = start.input_offset
+        self.start_lines = start.lines
+        self.every = every
+        self.out = out
+        self.started = self.last = time.monotonic()
+
+    def maybe_report(self, state: Checkpoint, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last < self.every:
+            return
+        self.last = now
+        elapsed = max(now - self.started, 1e-9)
+        done = state.input_offset - self.start_offset
+        rate = done / elapsed
+        eta = (self.total - state.input_offset) / rate if rate else float("inf")
+        pct = state.input_offset / self.total if self.total else 1.0
+        lines = state.lines - self.start_lines
+        print(f"[batch] {state.lines} lines ({state.ok} ok, {state.failed} failed) "
+              f"{pct:.1%}  {lines / elapsed:.1f} lines/s  ETA {_duration(eta)}",
+              file=self.out, flush=True)
+
+def _duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+async def _reply_record(line_no: int, raw: bytes, reply_fn: ReplyFn,
+                        running: asyncio.Semaphore, limiter: RateLimiter) -> Dict:
+    try:
+        payload = ReplyRequest.model_validate_json(raw).payload()
+    except ValidationError as e:
+        return {"line": line_no, "error": f"invalid request: {e.error_count()} error(s)",
+                "details": e.errors(include_url=False, include_context=False)}
+    async with running:
+        await limiter.acquire()
+        try:
+            reply = await reply_fn(payload)
+        except Exception as e:
+            if getattr(e, "retryable", False):
+                raise
+            logger.error(f"Line {line_no} failed: {e}")
+            return {"line": line_no, "postId": payload["postId"], "error": str(e)}
+    return {"line": line_no, "postId": payload["postId"], "reply": reply}
+
+async def run_batch(input_path: str, output_path: str,
+                    concurrency: int = BATCH_CONCURRENCY,
+                    rate: float = BATCH_RATE_PER_SECOND,
+                    checkpoint_path: Optional[str] = None,
+                    checkpoint_seconds: float = BATCH_CHECKPOINT_SECONDS,
+                    limit: Optional[int] = None, resume: bool = True,
+                    reply_fn: Optional[ReplyFn] = None,
+                    progress_seconds: float = 5.0,
+                    out: TextIO = sys.stderr) -> Checkpoint:
+    """
+    Generate replies for every line of `input_path` into `output_path` and
+    return the final checkpoint. At most `concurrency` replies run at once,
+    started at no more than `rate` per second (0 = unlimited); `limit` stops
+    after that many lines in this run. Raises UpstreamUnavailable (after
+    checkpointing) when a line failed retryably.
+    """
+    if reply_fn is None:
+        from app.services.reply import make_reply
+
+        async def reply_fn(payload: Dict) -> str:
+            return await make_reply(payload, allow_fallback=False)
+    checkpoint_path = checkpoint_path or f"{output_path}.ckpt"
+    input_id = os.path.abspath(input_path)
+
+    state = Checkpoint.load(checkpoint_path) if resume else None
+    if state is not None and state.input != input_id:
+        raise ValueError(f"{checkpoint_path} belongs to {state.input}, not {input_id}")
+    state = state or Checkpoint(input=input_id)
+    if state.lines:
+        print(f"[batch] resuming after line {state.lines}", file=out, flush=True)
+
+    running = asyncio.Semaphore(concurrency)
+    # Lines read but not yet written: bounds memory and the reorder buffer
+    window = asyncio.Semaphore(concurrency * 4)
+    limiter = RateLimiter(rate)
+    finished: Dict[int, Tuple[int, object, object]] = {}
+    tasks = set()
+    stopped: Optional[str] = None
+    last_saved = time.monotonic()
+    progress = Progress(os.path.getsize(input_path), state, progress_seconds, out)
+
+    fin = open(input_path, "rb")
+    fout = open(output_path, "r+b" if os.path.exists(output_path) else "wb")
+
+    def save() -> None:
+        nonlocal last_saved
+        fout.flush()
+        os.fsync(fout.fileno())
+        state.save(checkpoint_path)
+        last_saved = time.monotonic()
+
+    def write_ready() -> None:
+        """Write finished lines in input order and advance the watermark."""
+        nonlocal stopped
+        while state.lines + 1 in finished and not stopped:
+            if finished[state.lines + 1][1] is _RETRY:
+                stopped = finished[state.lines + 1][2]
+                window.release()  # wake the reader so it sees the stop
+                break
+            end_offset, data, failed = finished.pop(state.lines + 1)
+            if data is not None:
+                fout.write(data)
+                if failed:
+                    state.failed += 1
+                else:
+                    state.ok += 1
+            state.lines += 1
+            state.input_offset = end_offset
+            state.output_offset = fout.tell()
+            window.release()
+        if time.monotonic() - last_saved >= checkpoint_seconds:
+            save()
+        progress.maybe_report(state)
+
+    async def handle(line_no: int, raw: bytes, end_offset: int) -> None:
+        data, failed = None, False
+        if raw.strip():  # blank lines only advance the watermark
+            try:
+                record = await _reply_record(line_no, raw, reply_fn, running, limiter)
+            except Exception as e:  # retryable: keep the watermark before this line
+                logger.error(f"Line {line_no} failed, will retry on resume: {e}")
+                finished[line_no] = (end_offset, _RETRY, f"line {line_no} ({e})")
+                write_ready()
+                return
+            failed = "error" in record
+            data = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        finished[line_no] = (end_offset, data, failed)
+        write_ready()
+
+    try:
+        fin.seek(state.input_offset)
+        # Anything past the watermark was written after the last checkpoint
+        fout.truncate(state.output_offset)
+        fout.seek(state.output_offset)
+
+        line_no, started = state.lines, 0
+        while (limit is None or started < limit) and not stopped:
+            raw = fin.readline()
+            if not raw:
+                break
+            line_no += 1
+            started += 1
+            await window.acquire()
+            if stopped:
+                break
+            task = asyncio.create_task(handle(line_no, raw, fin.tell()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if stopped:
+            for task in tasks:
+                task.cancel()  # nothing past the failed line can be written
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=bool(stopped))
+    finally:
+        for task in tasks:
+            task.cancel()
+        save()
+        fin.close()
+        fout.close()
+        progress.maybe_report(state, force=True)
+    if stopped:
+        raise UpstreamUnavailable(stopped)
+    return state
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Generate replies for a JSONL file of threads")
+    parser.add_argument("input", help="JSONL file, one /generate-reply request body per line")
+    parser.add_argument("output", help="JSONL file of results (appended to on resume)")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Replies generated at once")
+    parser.add_argument("--rate", type=float, default=BATCH_RATE_PER_SECOND,
+                        help="Max replies started per second (0 = unlimited)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.ckpt)")
+    parser.add_argument("--limit", type=int, help="Stop after this many lines")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore an existing checkpoint and start from the top")
+    args = parser.parse_args(argv)
+    try:
+        state = asyncio.run(run_batch(
+            args.input, args.output, concurrency=args.concurrency, rate=args.rate,
+            checkpoint_path=args.checkpoint, limit=args.limit, resume=not args.restart,
+        ))
+    except KeyboardInterrupt:
+        sys.exit("[batch] interrupted; rerun the same command to resume")
+    except UpstreamUnavailable as e:
+        sys.exit(f"[batch] upstream unavailable at {e}; rerun the same command to resume")
+    except ValueError as e:
+        sys.exit(f"[batch] {e}")
+    sys.exit(1 if state.failed else 0)
+
+if __name__ == "__main__":
+    main()
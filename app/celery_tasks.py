@@ -1,11 +1,100 @@
 import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from celery.signals import task_postrun, task_prerun, worker_process_init
+from celery.utils.serialization import strtobool
+from celery.worker.control import control_command, inspect_command
+
 from celery_app import celery_app
-from app.services.reply import make_reply
+from app.admission import record_task_latency
+from app.config import REPLY_POOL_QUIET_QUEUE_DEPTH
+from app.metrics import metrics
+from app.profiler import profiler
+from app.results import result_store
+from app.services.pool import reply_pool
+from app.services.reply import make_reply, refill_reply_pool
+from app.warmup import warm_up_worker
 
-@celery_app.task(name="generate_reply")
-def generate_reply_task(payload: dict) -> str:
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name="generate_reply", bind=True, ignore_result=True)
+def generate_reply_task(self, payload: dict, store_result: bool = True) -> str:
     """
     Celery wrapper around the async make_reply.
-    Runs in a separate worker process.
+    Runs in a separate worker process. The reply goes to the compact result
+    store (not Celery's backend), and only if the client will fetch it.
     """
-    return asyncio.run(make_reply(payload)) 
\ No newline at end of file
+    started = time.monotonic()
+    throttled = metrics.counter("upstream_throttled")
+    try:
+        reply = asyncio.run(make_reply(payload))
+    except Exception as e:
+        if store_result:
+            result_store.save(self.request.id, error=str(e))
+        raise
+    finally:
+        record_task_latency(time.monotonic() - started,
+                            int(metrics.counter("upstream_throttled") - throttled))
+    if store_result:
+        result_store.save(self.request.id, reply)
+    return reply
+
+@celery_app.task(name="refill_reply_pool", ignore_result=True)
+def refill_reply_pool_task(topics: Optional[List[str]] = None, scheduled: bool = False) -> None:
+    """
+    Top up the pre-generated reply pool. Scheduled (periodic) refills only run
+    while the reply queue is quiet; low-watermark refills always run.
+    """
+    if scheduled:
+        with celery_app.connection_for_read() as conn:
+            depth = conn.default_channel.client.llen(celery_app.conf.task_default_queue)
+        if depth > REPLY_POOL_QUIET_QUEUE_DEPTH:
+            logger.info(f"Skipping scheduled reply pool refill, queue depth {depth}")
+            return
+    asyncio.run(refill_reply_pool(topics))
+
+# Pool consumers anywhere in the cluster schedule a refill for the drained topic
+reply_pool.on_low_watermark = lambda topic: refill_reply_pool_task.delay([topic])
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs) -> None:
+    """Open connections and warm caches in each forked child before it takes tasks."""
+    warm_up_worker()
+
+# Slow tasks are profiled in the child that ran them (while the profiler is on)
+_profiled = {}
+
+@task_prerun.connect
+def start_task_profile(task_id=None, **kwargs) -> None:
+    token = profiler.begin()
+    if token is not None:
+        _profiled[task_id] = token
+
+@task_postrun.connect
+def finish_task_profile(task_id=None, task=None, **kwargs) -> None:
+    token = _profiled.pop(task_id, None)
+    if token is not None:
+        profiler.finish(token, "task", task.name)
+
+# Remote control, handled by the worker's main process. The settings file and
+# captures live in PROFILER_DIR, which its pool children share.
+@control_command(
+    args=[("enabled", strtobool), ("threshold_seconds", float)],
+    signature="[enabled] [threshold_seconds]",
+)
+def profiler_configure(state, enabled=None, threshold_seconds=None, **kwargs):
+    """Turn the slow-task sampling profiler on/off or change its threshold."""
+    return {"ok": profiler.configure(enabled, threshold_seconds, sample_here=False)}
+
+@inspect_command()
+def profiler_captures(state, **kwargs):
+    """Sampling profiler settings and the newest captures on this worker's host."""
+    return profiler.status()
+
+@inspect_command(args=[("name", str)], signature="<name>")
+def profiler_capture(state, name, **kwargs):
+    """One capture as collapsed stacks."""
+    folded = profiler.read(name)
+    return {"ok": folded} if folded is not None else {"error": f"No capture {name}"}
@@ -13,6 +13,186 @@ DEEPSEEK_VISION_URL = "https://api.deepseek.com/v1/chat/completions"
 CHAT_MODEL   = "deepseek-chat"
 VISION_MODEL = "deepseek-vision"
 
+# Image captioning for replies: at most VISION_MAX_IMAGES per thread, each
+# capped at VISION_IMAGE_TIMEOUT_SECONDS and all within the total budget
+VISION_MAX_IMAGES            = int(os.getenv("VISION_MAX_IMAGES", "4"))
+VISION_IMAGE_TIMEOUT_SECONDS = float(os.getenv("VISION_IMAGE_TIMEOUT_SECONDS", "4"))
+VISION_TOTAL_BUDGET_SECONDS  = float(os.getenv("VISION_TOTAL_BUDGET_SECONDS", "5"))
+# Images packed into one vision request (1 = one request per image)
+VISION_BATCH_SIZE            = int(os.getenv("VISION_BATCH_SIZE", "4"))
+
+# Upstream call timeout and retry policy
+CHAT_TIMEOUT_SECONDS    = float(os.getenv("CHAT_TIMEOUT_SECONDS", "60"))
+CHAT_MAX_ATTEMPTS       = int(os.getenv("CHAT_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_BASE      = float(os.getenv("RETRY_BACKOFF_BASE", "1.0"))
+RETRY_BACKOFF_MAX       = float(os.getenv("RETRY_BACKOFF_MAX", "10.0"))
+# Retry budget: every first attempt deposits RETRY_BUDGET_RATIO tokens,
+# every retry withdraws one, so retries stay a fraction of total traffic.
+RETRY_BUDGET_RATIO      = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))
+
+# Prompt input budgets (estimated tokens); a 12-word reply needs little context
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "400"))
+PROMPT_ORIGINAL_TOKENS  = int(os.getenv("PROMPT_ORIGINAL_TOKENS", "160"))
+PROMPT_TARGET_TOKENS    = int(os.getenv("PROMPT_TARGET_TOKENS", "120"))
+PROMPT_HISTORY_TOKENS   = int(os.getenv("PROMPT_HISTORY_TOKENS", "40"))
+PROMPT_MAX_HISTORY      = int(os.getenv("PROMPT_MAX_HISTORY", "3"))
+PROMPT_HISTORY_BUDGET   = int(os.getenv("PROMPT_HISTORY_BUDGET", "120"))
+# History is ranked by BM25 relevance to the target (0..1) plus this weight
+# times a recency term that halves every HISTORY_RECENCY_HALF_LIFE replies
+HISTORY_RECENCY_WEIGHT    = float(os.getenv("HISTORY_RECENCY_WEIGHT", "0.3"))
+HISTORY_RECENCY_HALF_LIFE = float(os.getenv("HISTORY_RECENCY_HALF_LIFE", "10"))
+
+# Per-thread context (keyed by postId): the last THREAD_RECENT_REPLIES replies
+# are kept pre-fitted, older ones only as a one-line rolling summary. Threads
+# idle for THREAD_IDLE_SECONDS are dropped; at most THREAD_MAX_ACTIVE are kept.
+THREAD_RECENT_REPLIES = int(os.getenv("THREAD_RECENT_REPLIES", "50"))
+THREAD_IDLE_SECONDS   = float(os.getenv("THREAD_IDLE_SECONDS", "1800"))
+THREAD_MAX_ACTIVE     = int(os.getenv("THREAD_MAX_ACTIVE", "10000"))
+
+# Multi-candidate generation: ask for several replies per upstream call and
+# pick the best locally. Mode "list" asks for a numbered list in one
+# completion, "n" uses the `n` request parameter. 1 disables it.
+REPLY_CANDIDATES      = int(os.getenv("REPLY_CANDIDATES", "1"))
+REPLY_CANDIDATE_MODE  = os.getenv("REPLY_CANDIDATE_MODE", "list")
+
+# Posted replies: at most REPLY_MAX_CHARS characters (cut at grapheme
+# boundaries), exactly one emoji, from REPLY_EMOJIS if the model added none
+REPLY_MAX_CHARS = int(os.getenv("REPLY_MAX_CHARS", "80"))
+REPLY_EMOJIS    = ["✨", "🔥", "🙌", "👍", "😊", "💯", "🌟", "❤️"]
+
+# Near-duplicate detection over the last DEDUP_WINDOW replies of a process:
+# word-shingle Jaccard >= DEDUP_THRESHOLD counts as a repeat (MinHash + LSH).
+# Memory is roughly 0.8 KB per remembered reply.
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+DEDUP_WINDOW    = int(os.getenv("DEDUP_WINDOW", "20000"))
+DEDUP_NUM_PERM  = int(os.getenv("DEDUP_NUM_PERM", "32"))
+
+# Redis shared with Celery (same defaults as celery_app.py)
+REDIS_URL = os.getenv(
+    "CELERY_BROKER_URL",
+    "redis://{}:{}/{}".format(
+        os.getenv("REDIS_HOST", "localhost"),
+        os.getenv("REDIS_PORT", "6379"),
+        os.getenv("REDIS_DB", "0"),
+    ),
+)
+
+# Admission control: shed new reply jobs when the estimated queue wait
+# (depth × avg task time ÷ worker concurrency) exceeds the SLO.
+# ADMISSION_SHED_MODE "reject" answers 503 + Retry-After, "degraded" answers
+# from the reply pool when it can and rejects otherwise.
+ADMISSION_ENABLED              = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_SLO_SECONDS          = float(os.getenv("ADMISSION_SLO_SECONDS", "30"))
+ADMISSION_WORKER_CONCURRENCY   = int(os.getenv("ADMISSION_WORKER_CONCURRENCY", "4"))
+ADMISSION_CACHE_SECONDS        = float(os.getenv("ADMISSION_CACHE_SECONDS", "1.0"))
+ADMISSION_DEFAULT_TASK_SECONDS = float(os.getenv("ADMISSION_DEFAULT_TASK_SECONDS", "3.0"))
+ADMISSION_SHED_MODE            = os.getenv("ADMISSION_SHED_MODE", "reject")
+
+# Priority lanes: each is its own Celery queue served by its own worker pool
+# (see Procfile), so bulk backfills never sit in front of interactive work.
+# `concurrency` must match the pool's -c (or the MIN of --autoscale=MAX,MIN)
+# and `max_concurrency` the MAX; admission control uses the autoscaled pool
+# size the workers publish, or MAX when there is none (without --autoscale,
+# set the *_MAX_CONCURRENCY variables to the -c values too).
+DEFAULT_LANE = "interactive"
+REPLY_LANES = {
+    "interactive": {
+        "concurrency": int(os.getenv("INTERACTIVE_CONCURRENCY", str(ADMISSION_WORKER_CONCURRENCY))),
+        "max_concurrency": int(os.getenv("INTERACTIVE_MAX_CONCURRENCY", "16")),
+        "slo_seconds": float(os.getenv("INTERACTIVE_SLO_SECONDS", str(ADMISSION_SLO_SECONDS))),
+    },
+    "bulk": {
+        "concurrency": int(os.getenv("BULK_CONCURRENCY", "2")),
+        "max_concurrency": int(os.getenv("BULK_MAX_CONCURRENCY", "8")),
+        "slo_seconds": float(os.getenv("BULK_SLO_SECONDS", "3600")),
+    },
+}
+
+# Worker autoscaling (celery worker --autoscale=MAX,MIN, see app.autoscaler):
+# pools are sized every AUTOSCALE_INTERVAL_SECONDS so the backlog drains within
+# AUTOSCALE_TARGET_WAIT_FRACTION of the lane SLO, shrink only after the target
+# has stayed lower for AUTOSCALE_DOWN_DELAY_SECONDS, and on upstream 429s (seen
+# in the last AUTOSCALE_THROTTLE_WINDOW_SECONDS) shrink by
+# AUTOSCALE_THROTTLE_BACKOFF and stop growing for the cooldown.
+AUTOSCALE_INTERVAL_SECONDS          = float(os.getenv("AUTOSCALE_INTERVAL_SECONDS", "5"))
+AUTOSCALE_TARGET_WAIT_FRACTION      = float(os.getenv("AUTOSCALE_TARGET_WAIT_FRACTION", "0.5"))
+AUTOSCALE_DOWN_DELAY_SECONDS        = float(os.getenv("AUTOSCALE_DOWN_DELAY_SECONDS", "60"))
+AUTOSCALE_THROTTLE_BACKOFF          = float(os.getenv("AUTOSCALE_THROTTLE_BACKOFF", "0.75"))
+AUTOSCALE_THROTTLE_WINDOW_SECONDS   = float(os.getenv("AUTOSCALE_THROTTLE_WINDOW_SECONDS", "30"))
+AUTOSCALE_THROTTLE_COOLDOWN_SECONDS = float(os.getenv("AUTOSCALE_THROTTLE_COOLDOWN_SECONDS", "60"))
+
+# Request limits for /generate-reply: bodies over MAX_BODY_BYTES are refused
+# before they are read in full; posts and history are capped when validated
+MAX_BODY_BYTES        = int(os.getenv("MAX_BODY_BYTES", str(64 * 1024)))
+POST_MAX_TEXT_CHARS   = int(os.getenv("POST_MAX_TEXT_CHARS", "4000"))
+POST_MAX_USERNAME     = int(os.getenv("POST_MAX_USERNAME", "64"))
+POST_MAX_MEDIA_ITEMS  = int(os.getenv("POST_MAX_MEDIA_ITEMS", "10"))
+REQUEST_MAX_HISTORY   = int(os.getenv("REQUEST_MAX_HISTORY", "50"))
+
+# Access log: one line per request. Successful responses are sampled at
+# ACCESS_LOG_SAMPLE_RATE (0..1); errors and slow requests are always logged.
+ACCESS_LOG_SAMPLE_RATE  = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.1"))
+ACCESS_LOG_SLOW_SECONDS = float(os.getenv("ACCESS_LOG_SLOW_SECONDS", "1.0"))
+
+# Sampling profiler for slow requests and Celery tasks (off unless enabled here
+# or at runtime): stacks are sampled every PROFILER_INTERVAL_SECONDS and work
+# slower than PROFILER_THRESHOLD_SECONDS is saved to PROFILER_DIR as collapsed
+# stacks for flame graphs, keeping the newest PROFILER_MAX_CAPTURES
+PROFILER_ENABLED           = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_THRESHOLD_SECONDS = float(os.getenv("PROFILER_THRESHOLD_SECONDS", "2.0"))
+PROFILER_INTERVAL_SECONDS  = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.005"))
+PROFILER_WINDOW_SECONDS    = float(os.getenv("PROFILER_WINDOW_SECONDS", "60"))
+PROFILER_MAX_CAPTURES      = int(os.getenv("PROFILER_MAX_CAPTURES", "50"))
+PROFILER_DIR               = os.getenv("PROFILER_DIR", "logs/profiles")
+
+# Token for the /admin endpoints (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Startup warmup: each check gets WARMUP_TIMEOUT_SECONDS; failed required
+# checks are retried every WARMUP_RETRY_SECONDS and /readyz stays 503 meanwhile
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "3"))
+WARMUP_RETRY_SECONDS   = float(os.getenv("WARMUP_RETRY_SECONDS", "2"))
+
+# Offline batch runs (python -m app.batch): replies generated at once, max
+# replies started per second (0 = unlimited) and how often progress is saved
+BATCH_CONCURRENCY        = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_RATE_PER_SECOND    = float(os.getenv("BATCH_RATE_PER_SECOND", "5"))
+BATCH_CHECKPOINT_SECONDS = float(os.getenv("BATCH_CHECKPOINT_SECONDS", "5"))
+
+# Celery wire format for task messages: "json" or "msgpack" (compact binary,
+# needs the msgpack package). Workers accept both; switch to msgpack only once
+# every worker runs this version, since older ones only accept JSON.
+CELERY_SERIALIZER = os.getenv("CELERY_SERIALIZER", "json")
+
+# Where /generate-reply jobs run: "celery" (Redis + worker processes),
+# "asyncio" (bounded worker coroutines in the API process) or "process"
+# (local process pool). Lane concurrency sizes the local pools too.
+EXECUTOR_BACKEND    = os.getenv("EXECUTOR_BACKEND", "celery")
+LOCAL_QUEUE_MAXSIZE = int(os.getenv("LOCAL_QUEUE_MAXSIZE", "1000"))
+
+# Task results: the compact reply string only, expired after RESULT_TTL_SECONDS
+# and (with RESULT_READ_ONCE) deleted as soon as the client has read it
+RESULT_REDIS_URL   = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
+RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", "300"))
+RESULT_READ_ONCE   = os.getenv("RESULT_READ_ONCE", "true").lower() == "true"
+# Finished results each API process keeps in memory from the workers'
+# completion notifications, so polls rarely reach Redis (0 = always ask Redis)
+RESULT_CACHE_ENTRIES = int(os.getenv("RESULT_CACHE_ENTRIES", "10000"))
+
+# Pre-generated reply pool served when shedding load or the upstream is down.
+# "redis" shares it across processes; "local" only suits single-process runs
+# and is the default for the in-process executors, which run without Redis
+# (the pool is read synchronously, so a Redis pool would block their loop).
+REPLY_POOL_BACKEND        = os.getenv(
+    "REPLY_POOL_BACKEND", "redis" if EXECUTOR_BACKEND == "celery" else "local"
+)
+REPLY_POOL_TARGET_SIZE    = int(os.getenv("REPLY_POOL_TARGET_SIZE", "50"))
+REPLY_POOL_LOW_WATERMARK  = int(os.getenv("REPLY_POOL_LOW_WATERMARK", "10"))
+REPLY_POOL_REFILL_SECONDS = int(os.getenv("REPLY_POOL_REFILL_SECONDS", "300"))
+# Periodic refills are skipped while the task queue is busier than this
+REPLY_POOL_QUIET_QUEUE_DEPTH = int(os.getenv("REPLY_POOL_QUIET_QUEUE_DEPTH", "5"))
+
 FALLBACK_COMMENTS = [
     "Main-character energy ✨", "Love this vibe 😍", "Absolute fire 🔥",
     "Gym goals! 💪", "Chef's kiss 😘", "Instant mood-boost 💯"
@@ -21,6 +201,3 @@ FALLBACK_COMMENTS = [
 EVENT_FALLBACK_COMMENTS = [
     # ... same as before ...
 ]
-
-# session-level duplicate prevention
-POSTED_COMMENTS = {}
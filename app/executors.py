@@ -0,0 +1,267 @@
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.admission import QueueStats
+from app.config import (
+    ADMISSION_DEFAULT_TASK_SECONDS,
+    EXECUTOR_BACKEND,
+    LOCAL_QUEUE_MAXSIZE,
+    REPLY_LANES,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class ExecutorFull(Exception):
+    """The executor cannot take more work right now."""
+
+class ReplyExecutor:
+    """
+    Where /generate-reply jobs run. Every backend hands out opaque task ids
+    and answers `status()` with the same payloads: pending / done / failure,
+    with finished results consumed on read.
+    """
+
+    name = "base"
+
+    async def submit(self, payload: Dict, lane: str, store_result: bool = True) -> str:
+        raise NotImplementedError
+
+    async def status(self, task_id: str) -> Dict:
+        raise NotImplementedError
+
+    def stats_fetcher(self, lane: str) -> Optional[Callable[[], Awaitable[QueueStats]]]:
+        """Queue stats source for admission control; None means Redis."""
+        return None
+
+    def warmup_checks(self) -> Dict[str, Callable[[], Awaitable]]:
+        """Connections this backend needs before the process is ready."""
+        return {}
+
+    async def collect_metrics(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+class CeleryExecutor(ReplyExecutor):
+    """Jobs go to the Celery lane queues; results come from the Redis store."""
+
+    name = "celery"
+
+    def __init__(self):
+        # Imported here so the in-process backends work without Celery/Redis
+        from app.celery_tasks import generate_reply_task
+        from app.results import result_store
+        self.task = generate_reply_task
+        self.results = result_store
+
+    async def submit(self, payload: Dict, lane: str, store_result: bool = True) -> str:
+        task = self.task.apply_async(
+            (payload,), {"store_result": store_result}, queue=lane
+        )
+        return task.id
+
+    async def status(self, task_id: str) -> Dict:
+        return await self.results.fetch(task_id)
+
+    def _connect_broker(self) -> None:
+        with self.task.app.producer_pool.acquire(block=True) as producer:
+            producer.connection.ensure_connection(max_retries=1, interval_start=0)
+
+    def warmup_checks(self) -> Dict[str, Callable[[], Awaitable]]:
+        return {
+            "broker": lambda: asyncio.to_thread(self._connect_broker),
+            "result_store": self.results.ping_async,
+            "result_notifications": self.results.listen,
+        }
+
+    async def collect_metrics(self) -> None:
+        from app.autoscaler import collect_autoscaler_metrics
+        await self.results.memory_usage()
+        try:
+            await collect_autoscaler_metrics()
+        except Exception as e:
+            logger.warning(f"Could not read autoscaler state: {e}")
+
+    async def shutdown(self) -> None:
+        await self.results.stop()
+
+class _LocalExecutor(ReplyExecutor):
+    """Shared bookkeeping for executors that run jobs from this process."""
+
+    def __init__(self):
+        from app.results import LocalResultStore
+        self.results = LocalResultStore()
+        self.pending = {lane: 0 for lane in REPLY_LANES}
+        # Exponentially weighted average task time, for admission control
+        self.avg_task_seconds = None
+        self.loop = None
+
+    def _bind_loop(self) -> None:
+        """
+        Remember the API event loop and refill the reply pool on it, since
+        there is no Celery beat/worker to do that for local backends.
+        """
+        from app.services.pool import reply_pool
+        from app.services.reply import refill_reply_pool
+        self.loop = loop = asyncio.get_running_loop()
+        reply_pool.on_low_watermark = lambda topic: loop.call_soon_threadsafe(
+            lambda: loop.create_task(refill_reply_pool([topic]))
+        )
+
+    def _record(self, task_id: str, store_result: bool, elapsed: float,
+                reply: Optional[str] = None, error: Optional[str] = None) -> None:
+        self.avg_task_seconds = (elapsed if self.avg_task_seconds is None
+                                 else 0.8 * self.avg_task_seconds + 0.2 * elapsed)
+        metrics.observe("task_seconds", elapsed)
+        if store_result:
+            self.results.save(task_id, reply, error)
+
+    def stats_fetcher(self, lane: str) -> Callable[[], Awaitable[QueueStats]]:
+        async def fetch() -> QueueStats:
+            return QueueStats(self.pending[lane],
+                              self.avg_task_seconds or ADMISSION_DEFAULT_TASK_SECONDS,
+                              time.monotonic(), REPLY_LANES[lane]["concurrency"])
+        return fetch
+
+    async def status(self, task_id: str) -> Dict:
+        return await self.results.fetch(task_id)
+
+    async def collect_metrics(self) -> None:
+        for lane, n in self.pending.items():
+            metrics.gauge(f"executor_pending_{lane}", n)
+        await self.results.memory_usage()
+
+class AsyncioExecutor(_LocalExecutor):
+    """
+    Bounded asyncio worker pool inside the API process: one queue per lane,
+    served by as many coroutines as the lane's configured concurrency.
+    Good for small deployments (no Redis, no worker processes).
+    """
+
+    name = "asyncio"
+
+    def __init__(self, maxsize: int = LOCAL_QUEUE_MAXSIZE):
+        super().__init__()
+        self.maxsize = maxsize
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.workers = []
+
+    def _start(self) -> None:
+        self._bind_loop()
+        for lane, cfg in REPLY_LANES.items():
+            self.queues[lane] = asyncio.Queue(self.maxsize)
+            for _ in range(cfg["concurrency"]):
+                # Fresh context: workers outlive the request that started them
+                self.workers.append(asyncio.create_task(self._work(lane),
+                                                        context=contextvars.Context()))
+        logger.info(f"Started asyncio executor with {len(self.workers)} workers")
+
+    async def _work(self, lane: str) -> None:
+        from app.services.reply import make_reply
+        queue = self.queues[lane]
+        while True:
+            task_id, payload, store_result = await queue.get()
+            started = time.monotonic()
+            try:
+                reply = await make_reply(payload)
+                self._record(task_id, store_result, time.monotonic() - started, reply=reply)
+            except Exception as e:
+                logger.error(f"Task {task_id} failed: {e}")
+                self._record(task_id, store_result, time.monotonic() - started, error=str(e))
+            finally:
+                self.pending[lane] -= 1
+                queue.task_done()
+
+    async def submit(self, payload: Dict, lane: str, store_result: bool = True) -> str:
+        if not self.workers:
+            self._start()
+        task_id = str(uuid.uuid4())
+        try:
+            self.queues[lane].put_nowait((task_id, payload, store_result))
+        except asyncio.QueueFull:
+            raise ExecutorFull(f"{lane} queue is full")
+        self.pending[lane] += 1
+        return task_id
+
+    async def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+def _run_reply(payload: Dict) -> Tuple[str, float]:
+    """Entry point in process-pool children; returns (reply, run seconds)."""
+    from app.services.reply import make_reply
+    started = time.monotonic()
+    reply = asyncio.run(make_reply(payload))
+    return reply, time.monotonic() - started
+
+class ProcessExecutor(_LocalExecutor):
+    """
+    Local process pool: jobs run in child processes (sized by the lanes'
+    total concurrency) so CPU-heavy work stays off the API event loop,
+    without needing Redis or Celery. The pool is created on the first job,
+    so with gunicorn's preload_app every worker gets its own after the fork
+    instead of sharing the master's pipes.
+    """
+
+    name = "process"
+
+    def __init__(self, maxsize: int = LOCAL_QUEUE_MAXSIZE):
+        super().__init__()
+        self.maxsize = maxsize
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    async def submit(self, payload: Dict, lane: str, store_result: bool = True) -> str:
+        if self.loop is None:
+            self._bind_loop()
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=sum(cfg["concurrency"] for cfg in REPLY_LANES.values())
+            )
+        if sum(self.pending.values()) >= self.maxsize:
+            raise ExecutorFull("process pool backlog is full")
+        task_id = str(uuid.uuid4())
+        started = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(self.pool, _run_reply, payload)
+        self.pending[lane] += 1
+
+        def done(f: asyncio.Future) -> None:
+            self.pending[lane] -= 1
+            if f.cancelled():
+                self._record(task_id, store_result, time.monotonic() - started,
+                             error="cancelled")
+            elif f.exception() is not None:
+                logger.error(f"Task {task_id} failed: {f.exception()}")
+                self._record(task_id, store_result, time.monotonic() - started,
+                             error=str(f.exception()))
+            else:
+                reply, elapsed = f.result()
+                self._record(task_id, store_result, elapsed, reply=reply)
+
+        future.add_done_callback(done)
+        return task_id
+
+    async def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+EXECUTORS = {
+    "celery": CeleryExecutor,
+    "asyncio": AsyncioExecutor,
+    "process": ProcessExecutor,
+}
+
+def get_executor(name: str = EXECUTOR_BACKEND) -> ReplyExecutor:
+    try:
+        return EXECUTORS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown EXECUTOR_BACKEND {name!r}; use one of {list(EXECUTORS)}")
@@ -1,8 +1,19 @@
 import logging
 import os
 import sys
+from contextvars import ContextVar
 from logging.handlers import RotatingFileHandler
 
+# Set per HTTP request by the access-log middleware, "-" outside requests
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+class RequestIdFilter(logging.Filter):
+    """Stamp every record with the current request id."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
 def setup_logging():
     # Create logs directory if it doesn't exist
     os.makedirs('logs', exist_ok=True)
@@ -25,9 +36,15 @@ def setup_logging():
         encoding='utf-8'  # Explicitly set encoding to utf-8
     )
     file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_format = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(request_id)s - %(message)s'
+    )
     file_handler.setFormatter(file_format)
     
+    request_ids = RequestIdFilter()
+    console_handler.addFilter(request_ids)
+    file_handler.addFilter(request_ids)
+
     # Add handlers to logger
     logger.addHandler(console_handler)
     logger.addHandler(file_handler)
@@ -1,18 +1,27 @@
 import uvicorn
 import logging
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .api import router  # Relative import within app package
+from .middleware import AccessLogMiddleware, BodySizeLimitMiddleware, SlowRequestProfilerMiddleware
 from .logging_config import setup_logging
 
 # Setup logging
 logger = setup_logging()
 
+try:
+    import orjson  # noqa: F401
+    # orjson encodes responses several times faster than the stdlib encoder
+    default_response_class = ORJSONResponse
+except ImportError:
+    default_response_class = JSONResponse
+
 app = FastAPI(
     title="Ava Reply Engine",
     version="1.0.0",
-    description="Thread reply generation service with DeepSeek"
+    description="Thread reply generation service with DeepSeek",
+    default_response_class=default_response_class,
 )
 
 # Add CORS middleware
@@ -24,17 +33,16 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Oversized bodies are refused before they are read, parsed or validated
+app.add_middleware(BodySizeLimitMiddleware)
+# Profiles requests over the threshold while the sampling profiler is on
+app.add_middleware(SlowRequestProfilerMiddleware)
+# Outermost, so every request gets a request id and one access-log line
+app.add_middleware(AccessLogMiddleware)
+
 # register your router from app/api.py
 app.include_router(router)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Log all requests and responses"""
-    logger.info(f"Request: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"Response: {response.status_code}")
-    return response
-
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler to log all errors"""
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import ACCESS_LOG_SAMPLE_RATE, ACCESS_LOG_SLOW_SECONDS, MAX_BODY_BYTES
+from app.logging_config import request_id_var
+from app.metrics import metrics
+from app.profiler import SamplingProfiler, profiler
+
+access_logger = logging.getLogger("app.access")
+
+class BodyTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="Request body too large")
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse request bodies over `max_bytes` with 413 before they are read in
+    full: straight from Content-Length when the client sends one, otherwise
+    as soon as the streamed chunks add up to more than the limit.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int = MAX_BODY_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(scope, receive, send)
+                return
+
+        received = 0
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise BodyTooLarge()
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge:
+            # FastAPI normally turns this into a 413 itself; this covers the rest
+            if started:
+                raise
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse({"detail": "Request body too large"}, status_code=413)
+        await response(scope, receive, send)
+
+class AccessLogMiddleware:
+    """
+    One structured line per request, logged after the response is sent:
+
+        method=POST path=/generate-reply status=200 duration_ms=4.1 bytes=52 request_id=...
+
+    Successful responses are logged with probability `sample_rate`. 4xx and
+    5xx responses, exceptions and requests slower than `slow_seconds` are
+    always logged.
+    The request id comes from X-Request-ID (or is generated), is set for
+    every log record during the request and is echoed in the response.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float = ACCESS_LOG_SAMPLE_RATE,
+                 slow_seconds: float = ACCESS_LOG_SLOW_SECONDS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def logged_send(message: Message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()),
+                                      (b"x-request-id", request_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, logged_send)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.observe("http_request_seconds", duration)
+            self._log(scope, status, duration, sent, request_id)
+            request_id_var.reset(token)
+
+    def _log(self, scope: Scope, status: int, duration: float, sent: int,
+             request_id: str) -> None:
+        slow = duration >= self.slow_seconds
+        if status >= 500:
+            level = logging.ERROR
+        elif status >= 400 or slow:
+            level = logging.WARNING
+        elif random.random() < self.sample_rate:
+            level = logging.INFO
+        else:
+            return
+        if not access_logger.isEnabledFor(level):
+            return
+        client = scope.get("client")
+        access_logger.log(
+            level,
+            "method=%s path=%s status=%d duration_ms=%.1f bytes=%d client=%s "
+            "request_id=%s%s",
+            scope["method"], scope["path"], status, duration * 1000, sent,
+            client[0] if client else "-", request_id, " slow=1" if slow else "",
+        )
+
+class SlowRequestProfilerMiddleware:
+    """
+    Hand requests to the sampling profiler, which saves a profile of those
+    slower than its threshold. A no-op (one settings check a second) while
+    the profiler is disabled.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self.profiler.begin()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ended = time.monotonic()
+            if self.profiler.is_slow(token, ended):
+                # Writing and pruning captures must not stall the loop
+                await asyncio.to_thread(self.profiler.finish, token, "request",
+                                        f"{scope['method']} {scope['path']}", ended)
@@ -0,0 +1,62 @@
+from typing import Annotated, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, StrictStr
+
+from app.config import (
+    DEFAULT_LANE,
+    POST_MAX_MEDIA_ITEMS,
+    POST_MAX_TEXT_CHARS,
+    POST_MAX_USERNAME,
+    REQUEST_MAX_HISTORY,
+)
+
+class MediaItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    url: StrictStr = Field(max_length=2048)
+
+URL = Annotated[StrictStr, Field(max_length=2048)]
+# An attachment is a bare URL or {"url": ...}, alone or in a short list
+Media = Union[URL, MediaItem,
+              Annotated[List[Union[URL, MediaItem]], Field(max_length=POST_MAX_MEDIA_ITEMS)]]
+
+class Post(BaseModel):
+    """
+    One post or reply in a thread. Unknown fields are dropped, so only what
+    the prompt and image captioning read travels on to the worker.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    username: StrictStr = Field("unknown", max_length=POST_MAX_USERNAME)
+    text:     StrictStr = Field("", max_length=POST_MAX_TEXT_CHARS)
+    image:     Optional[Media] = None
+    image_url: Optional[Media] = None
+    images:    Optional[Media] = None
+    media:     Optional[Media] = None
+    photos:    Optional[Media] = None
+
+class ReplyRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    # Thread id; replies within one thread share context between calls
+    post_id:  Optional[StrictStr] = Field(None, alias="postId", max_length=128)
+    original: Post
+    target:   Post
+    history:  List[Post] = Field(default_factory=list, max_length=REQUEST_MAX_HISTORY)
+    # "interactive" for user-facing requests, "bulk" for backfills
+    priority: Literal["interactive", "bulk"] = DEFAULT_LANE
+    # False for fire-and-forget jobs: the worker then stores no result at all
+    fetch_result: bool = True
+
+    def payload(self) -> Dict:
+        """The job payload for the executor, dumped once from the validated model."""
+        payload = self.model_dump(include={"original", "target", "history"},
+                                  exclude_none=True)
+        payload["postId"] = self.post_id or "system-generated"
+        return payload
+
+class ProfilerSettings(BaseModel):
+    """Runtime sampling-profiler settings; omitted fields stay as they are."""
+    enabled: Optional[bool] = None
+    threshold_seconds: Optional[float] = Field(None, gt=0)
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    PROFILER_DIR,
+    PROFILER_ENABLED,
+    PROFILER_INTERVAL_SECONDS,
+    PROFILER_MAX_CAPTURES,
+    PROFILER_THRESHOLD_SECONDS,
+    PROFILER_WINDOW_SECONDS,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settings shared by every process on the host (API workers, Celery children)
+SETTINGS_FILE = "settings.json"
+_CAPTURE_RE = re.compile(r"[\w.-]+\.folded")
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+
+class SamplingProfiler:
+    """
+    Opt-in stack sampler for slow requests and tasks.
+
+    While enabled, a daemon thread records every other thread's Python stack
+    each `interval` seconds into a ring covering the last `window` seconds.
+    Work wrapped in begin()/finish() that takes at least `threshold` seconds
+    gets the process's samples over its lifetime written to `directory` as
+    collapsed stacks ("thread;frame;frame count" lines, the input format of
+    flamegraph.pl and speedscope); the newest `keep` captures are kept.
+
+    Every thread is included, rooted at its name, since work for a request
+    may run in the event loop, a thread pool or both; on a busy loop the
+    capture also shows whatever else ran meanwhile.
+
+    Enable/threshold changes go through a settings file in `directory`, so
+    every process on the host picks them up within a second.
+    """
+
+    def __init__(self, directory: str = PROFILER_DIR, enabled: bool = PROFILER_ENABLED,
+                 threshold: float = PROFILER_THRESHOLD_SECONDS,
+                 interval: float = PROFILER_INTERVAL_SECONDS,
+                 window: float = PROFILER_WINDOW_SECONDS, keep: int = PROFILER_MAX_CAPTURES):
+        self.directory = directory
+        self.enabled = enabled
+        self.threshold = threshold
+        self.interval = interval
+        self.window = window
+        self.keep = keep
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque()
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._pid = os.getpid()
+        self._settings_mtime = 0.0
+        self._next_sync = 0.0
+
+    # -- settings -----------------------------------------------------------
+
+    @property
+    def settings_path(self) -> str:
+        return os.path.join(self.directory, SETTINGS_FILE)
+
+    def configure(self, enabled: Optional[bool] = None, threshold: Optional[float] = None,
+                  sample_here: bool = True) -> Dict:
+        """
+        Change the settings for every process on this host; returns the status.
+        `sample_here=False` only writes them, for processes that run no work.
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        if threshold is not None:
+            self.threshold = threshold
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.settings_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"enabled": self.enabled, "threshold": self.threshold}, f)
+        os.replace(tmp, self.settings_path)
+        self._settings_mtime = os.stat(self.settings_path).st_mtime
+        if sample_here:
+            self._apply()
+        return self.status()
+
+    def sync(self) -> None:
+        """Pick up settings written by other processes, at most once a second."""
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + 1.0
+        if self._pid != os.getpid():  # forked: the sampler thread stayed behind
+            self._pid, self._thread = os.getpid(), None
+            self._samples.clear()
+        try:
+            mtime = os.stat(self.settings_path).st_mtime
+            if mtime != self._settings_mtime:
+                with open(self.settings_path) as f:
+                    settings = json.load(f)
+                self._settings_mtime = mtime
+                self.enabled = bool(settings.get("enabled", self.enabled))
+                self.threshold = float(settings.get("threshold", self.threshold))
+        except (OSError, ValueError):
+            pass
+        self._apply()
+
+    def _apply(self) -> None:
+        running = self._thread is not None and self._thread.is_alive()
+        if self.enabled and not running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler",
+                                            daemon=True)
+            self._thread.start()
+            logger.info(f"Sampling profiler on (threshold {self.threshold}s)")
+        elif not self.enabled and running:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._samples.clear()
+            logger.info("Sampling profiler off")
+
+    # -- sampling -----------------------------------------------------------
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        now = time.monotonic()
+        samples = []
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            if tid not in self._thread_names:
+                self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(self._thread_names.get(tid, f"thread-{tid}"))
+            samples.append((now, tuple(reversed(stack))))
+        cutoff = now - self.window
+        with self._lock:
+            self._samples.extend(samples)
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:  # never take the process down
+                logger.warning(f"Profiler sample failed: {e}")
+
+    # -- captures -----------------------------------------------------------
+
+    def begin(self) -> Optional[float]:
+        """Start timing a piece of work; None while disabled."""
+        self.sync()
+        if not self.enabled:
+            return None
+        return time.monotonic()
+
+    def is_slow(self, started: Optional[float], ended: float) -> bool:
+        return started is not None and ended - started >= self.threshold
+
+    def finish(self, started: Optional[float], kind: str, name: str,
+               ended: Optional[float] = None) -> Optional[str]:
+        """
+        Capture the samples taken between `started` and `ended` (default now)
+        if the work was slow; returns the file name. Writes to disk, so
+        callers on an event loop should check is_slow() and run it in a thread.
+        """
+        ended = time.monotonic() if ended is None else ended
+        if not self.is_slow(started, ended):
+            return None
+        duration = ended - started
+        with self._lock:
+            stacks = Counter(stack for t, stack in self._samples if started <= t <= ended)
+        if not stacks:
+            return None
+        filename = "{}-{}-{}-{}-{}ms.folded".format(
+            time.strftime("%Y%m%d-%H%M%S"), os.getpid(), kind,
+            _UNSAFE_RE.sub("_", name).strip("_")[:60], int(duration * 1000))
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        metrics.incr("profiles_captured")
+        logger.warning(f"Slow {kind} {name} ({duration:.2f}s) profiled → {filename}")
+        self._prune()
+        return filename
+
+    def _prune(self) -> None:
+        captures = self.captures()
+        for old in captures[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, old["name"]))
+            except OSError:
+                pass
+
+    def captures(self) -> List[Dict]:
+        """Captures on disk, newest first."""
+        try:
+            names = [n for n in os.listdir(self.directory) if _CAPTURE_RE.fullmatch(n)]
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            out.append({"name": name, "bytes": st.st_size, "created": st.st_mtime})
+        return sorted(out, key=lambda c: c["created"], reverse=True)
+
+    def read(self, name: str) -> Optional[str]:
+        """The collapsed stacks of one capture, or None if there is no such capture."""
+        if not _CAPTURE_RE.fullmatch(name):
+            return None
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "threshold_seconds": self.threshold,
+            "interval_seconds": self.interval,
+            "pid": os.getpid(),
+            "samples": len(self._samples),
+            "captures": self.captures()[:10],
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from app.config import (
+    RESULT_CACHE_ENTRIES,
+    RESULT_REDIS_URL,
+    RESULT_READ_ONCE,
+    RESULT_TTL_SECONDS,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Replies are stored as "<flag>:<text>" under one short-lived key per task
+# instead of Celery's JSON meta blob: "1:" for a reply, "0:" for an error.
+_KEY = "reply:result:{}".format
+_OK, _ERR = "1:", "0:"
+# Workers also publish "+<task id> <value>" here when a result is saved, and
+# API processes publish "-<task id>" once they have handed a result out
+_CHANNEL = "reply:results"
+# Pending entries are rechecked in Redis this often anyway, in case a
+# notification was lost without the subscription dropping
+_PENDING_RECHECK_SECONDS = 30
+
+def encode_result(reply: Optional[str] = None, error: Optional[str] = None) -> str:
+    return _ERR + error if error is not None else _OK + (reply or "")
+
+def decode_result(value: Optional[str]) -> Dict:
+    """Map a stored value onto the status payload served by the API."""
+    if value is None:
+        return {"status": "pending"}
+    if value.startswith(_ERR):
+        return {"status": "failure", "error": value[len(_ERR):]}
+    return {"status": "done", "reply": value[len(_OK):]}
+
+class ResultStore:
+    """
+    Compact reply results in Redis with a short TTL and read-once semantics.
+
+    Workers write with the sync client; the API reads with redis.asyncio so
+    polling never blocks the event loop. With RESULT_READ_ONCE a successful
+    read deletes the key (GETDEL) so results do not pile up until the TTL.
+
+    Each API process also keeps one pub/sub subscription (see listen()) that
+    copies finished results into a bounded in-memory cache, so most polls are
+    answered without Redis: a finished result comes from the cache, and a
+    task already seen pending while subscribed stays pending until its
+    notification arrives. Only the first poll per task, and polls after the
+    subscription dropped, go to Redis. With RESULT_READ_ONCE, serving a
+    cached result still deletes the key first, so across API processes only
+    the one whose delete succeeds returns it.
+    """
+
+    def __init__(self, url: str = RESULT_REDIS_URL, ttl: int = RESULT_TTL_SECONDS,
+                 read_once: bool = RESULT_READ_ONCE, cache_entries: int = RESULT_CACHE_ENTRIES):
+        self.url = url
+        self.ttl = ttl
+        self.read_once = read_once
+        self.cache_entries = cache_entries
+        self._sync = None
+        self._async = None
+        # task id -> (stored value, or None for pending, subscription generation, expiry)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # Read-once results already handed out (task id -> expiry), so a late
+        # notification cannot bring them back
+        self._consumed: "OrderedDict[str, float]" = OrderedDict()
+        # Bumped on every (re)subscription; pending entries of older ones are stale
+        self._generation = 0
+        self._subscribed = None
+        self._listener: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    def _sync_client(self):
+        if self._sync is None:
+            import redis
+            self._sync = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._sync
+
+    def _async_client(self):
+        if self._async is None:
+            import redis.asyncio as aioredis
+            self._async = aioredis.Redis.from_url(self.url, decode_responses=True)
+        return self._async
+
+    def save(self, task_id: str, reply: Optional[str] = None,
+             error: Optional[str] = None) -> None:
+        """Called by the worker once a task finishes; also notifies the API processes."""
+        value = encode_result(reply, error)
+        pipe = self._sync_client().pipeline(transaction=False)
+        pipe.set(_KEY(task_id), value, ex=self.ttl)
+        pipe.publish(_CHANNEL, f"+{task_id} {value}")
+        pipe.execute()
+
+    def ping(self) -> None:
+        """Open the worker-side connection ahead of the first result."""
+        self._sync_client().ping()
+
+    async def ping_async(self) -> None:
+        """Open the API-side connection ahead of the first poll."""
+        await self._async_client().ping()
+
+    async def fetch(self, task_id: str) -> Dict:
+        """Status payload for `task_id`; consumes a finished result if read-once."""
+        if self.cache_entries:
+            self._ensure_listener()
+            cached = self._cached(task_id)
+            if cached is not None:
+                metrics.incr("result_cache_hits")
+                if self.read_once and cached["status"] != "pending":
+                    return await self._claim(task_id, cached)
+                return cached
+            metrics.incr("result_cache_misses")
+        generation = self._generation if self.listening else None
+        client = self._async_client()
+        key = _KEY(task_id)
+        value = await (client.getdel(key) if self.read_once else client.get(key))
+        if value is None and generation is not None and generation == self._generation:
+            # Subscribed since before the read: the notification cannot be missed
+            self._remember(task_id, None, generation, keep_result=True)
+        elif value is not None and self.read_once and self.cache_entries:
+            # GETDEL already deleted it; the worker's notification may still be on its way
+            self._mark_consumed(task_id)
+            self._spawn(self._consume(task_id))
+        return decode_result(value)
+
+    # -- completion notifications -------------------------------------------
+
+    @property
+    def listening(self) -> bool:
+        return self._subscribed is not None and self._subscribed.is_set()
+
+    def _cached(self, task_id: str) -> Optional[Dict]:
+        entry = self._cache.get(task_id)
+        if entry is None:
+            return None
+        value, generation, expires = entry
+        if expires < time.monotonic():
+            del self._cache[task_id]
+            return None
+        if value is None:
+            if generation != self._generation or not self.listening:
+                return None
+            return {"status": "pending"}
+        return decode_result(value)
+
+    def _mark_consumed(self, task_id: str) -> None:
+        self._cache.pop(task_id, None)
+        self._consumed[task_id] = time.monotonic() + self.ttl
+        self._consumed.move_to_end(task_id)
+        while len(self._consumed) > self.cache_entries:
+            self._consumed.popitem(last=False)
+
+    def _was_consumed(self, task_id: str) -> bool:
+        expires = self._consumed.get(task_id)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._consumed[task_id]
+            return False
+        return True
+
+    def _remember(self, task_id: str, value: Optional[str], generation: int,
+                  keep_result: bool = False) -> None:
+        if keep_result and self._cache.get(task_id, (None,))[0] is not None:
+            return  # the notification won the race with our read
+        lifetime = self.ttl if value is not None else min(self.ttl, _PENDING_RECHECK_SECONDS)
+        self._cache[task_id] = (value, generation, time.monotonic() + lifetime)
+        self._cache.move_to_end(task_id)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    def _handle(self, data: str) -> None:
+        """Apply one notification from the results channel."""
+        if data.startswith("+"):
+            task_id, _, value = data[1:].partition(" ")
+            if not self._was_consumed(task_id):
+                self._remember(task_id, value, self._generation)
+        elif data.startswith("-"):
+            # The "-" can overtake the worker's "+" when a poll lands in between
+            self._mark_consumed(data[1:])
+
+    async def _claim(self, task_id: str, result: Dict) -> Dict:
+        """Read-once from the cache: serve only if this process deletes the key.
+
+        Another API process may hold the same notification; whichever one
+        deletes the key in Redis wins, the others report the task as pending.
+        """
+        self._mark_consumed(task_id)
+        pipe = self._async_client().pipeline(transaction=False)
+        pipe.unlink(_KEY(task_id))
+        pipe.publish(_CHANNEL, f"-{task_id}")
+        deleted, _ = await pipe.execute()
+        return result if deleted else {"status": "pending"}
+
+    async def _consume(self, task_id: str) -> None:
+        """Read-once: drop an already deleted result from every process's cache."""
+        try:
+            await self._async_client().publish(_CHANNEL, f"-{task_id}")
+        except Exception as e:
+            logger.warning(f"Could not consume result {task_id}: {e}")
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _ensure_listener(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._subscribed = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self, retry_seconds: float = 1.0) -> None:
+        """Keep one subscription to the results channel, resubscribing after errors."""
+        while True:
+            pubsub = self._async_client().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(_CHANNEL)
+                self._generation += 1
+                self._subscribed.set()
+                metrics.incr("result_listener_subscribed")
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._handle(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Result notifications interrupted, resubscribing: {e}")
+            finally:
+                # Pending entries are only exact while subscribed
+                self._subscribed.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(retry_seconds)
+
+    async def listen(self) -> None:
+        """Start this process's subscription and wait until it is live."""
+        if self.cache_entries:
+            self._ensure_listener()
+            await self._subscribed.wait()
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def memory_usage(self) -> Optional[int]:
+        """Bytes used by the Redis result backend (INFO memory)."""
+        try:
+            info = await self._async_client().info("memory")
+        except Exception as e:
+            logger.warning(f"Could not read result backend memory: {e}")
+            return None
+        used = info.get("used_memory")
+        if used is not None:
+            metrics.gauge("result_backend_used_memory_bytes", used)
+        metrics.gauge("result_cache_entries", len(self._cache))
+        return used
+
+class LocalResultStore:
+    """
+    Same contract as ResultStore, kept in this process for the in-process
+    executors: bounded to `max_entries`, expired after `ttl`, read-once.
+    """
+
+    def __init__(self, ttl: int = RESULT_TTL_SECONDS, read_once: bool = RESULT_READ_ONCE,
+                 max_entries: int = 10000):
+        self.ttl = ttl
+        self.read_once = read_once
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, task_id: str, reply: Optional[str] = None,
+             error: Optional[str] = None) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._results[task_id] = (encode_result(reply, error), expires)
+            self._results.move_to_end(task_id)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    async def fetch(self, task_id: str) -> Dict:
+        with self._lock:
+            entry = (self._results.pop(task_id, None) if self.read_once
+                     else self._results.get(task_id))
+        if entry is None or entry[1] < time.monotonic():
+            return decode_result(None)
+        return decode_result(entry[0])
+
+    async def memory_usage(self) -> Optional[int]:
+        metrics.gauge("local_results_stored", len(self._results))
+        return None
+
+result_store = ResultStore()
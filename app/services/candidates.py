@@ -0,0 +1,72 @@
+import re
+from typing import Container, Dict, Iterable, List, Optional
+
+from app.config import REPLY_MAX_CHARS
+from app.services.emoji import count_emoji
+
+# "1. foo", "2) foo", "- foo", "• foo"
+_LIST_PREFIX_RE = re.compile(r"^\s*(?:\d+\s*[.):-]|[-*•])\s*")
+
+LIST_INSTRUCTION = (
+    "\n\nWrite {k} different replies as a numbered list, one per line. "
+    "Output ONLY the list."
+).format
+
+def candidate_request(body: Dict, k: int, mode: str) -> Dict:
+    """
+    Turn a single-reply chat request body into one asking for `k` candidates:
+    either `n` completions ("n" mode) or a numbered list in one completion
+    ("list" mode, for APIs that ignore `n`).
+    """
+    if k <= 1:
+        return body
+    if mode == "n":
+        return {**body, "n": k}
+    messages = [dict(m) for m in body["messages"]]
+    messages[-1]["content"] += LIST_INSTRUCTION(k=k)
+    return {**body, "messages": messages,
+            "max_tokens": body.get("max_tokens", 100) * k}
+
+def parse_candidates(js: Dict, mode: str) -> List[str]:
+    """Extract raw candidate strings from a chat completion response."""
+    contents = [
+        (c.get("message") or {}).get("content") or ""
+        for c in js.get("choices", [])
+    ]
+    if mode == "list":
+        contents = [line for text in contents[:1] for line in text.splitlines()]
+        contents = [_LIST_PREFIX_RE.sub("", line) for line in contents]
+    return [c.strip().strip('"\'') for c in contents if c.strip()]
+
+def score_candidate(text: str, posted: Container[str] = ()) -> float:
+    """
+    Higher is better. Rewards the house style (≤12 words, exactly one emoji,
+    short enough to post untruncated) and heavily penalizes repeats.
+    """
+    words = len(text.split())
+    score = 10.0
+    if words > 12:
+        score -= 2 * (words - 12)
+    if len(text) > REPLY_MAX_CHARS:
+        score -= 5
+    if count_emoji(text) != 1:
+        score -= 3
+    if text in posted:
+        score -= 100
+    # Mild preference for punchier replies
+    return score - 0.1 * words
+
+def select_best(candidates: Iterable[Optional[str]],
+                posted: Container[str] = ()) -> Optional[str]:
+    """
+    Pick the best cleaned candidate; None entries (failed cleaning) are
+    skipped. `posted` is anything supporting `in`, e.g. a near-duplicate index.
+    """
+    best, best_score = None, float("-inf")
+    for text in candidates:
+        if not text:
+            continue
+        score = score_candidate(text, posted)
+        if score > best_score:
+            best, best_score = text, score
+    return best
@@ -0,0 +1,130 @@
+import hashlib
+import random
+import re
+import threading
+from collections import deque
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.config import DEDUP_NUM_PERM, DEDUP_THRESHOLD, DEDUP_WINDOW
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def shingles(text: str) -> FrozenSet[str]:
+    """
+    Lowercased words and word pairs, ignoring emoji and punctuation, so
+    replies that only differ by an emoji collapse to the same set.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return frozenset([text.strip()])
+    return frozenset(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm whose LSH S-curve midpoint
+    (1/bands)^(1/rows) sits just below `threshold`, so pairs at the threshold
+    are likely to share a bucket; candidates are then checked exactly.
+    """
+    target = max(0.05, threshold - 0.1)
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - target))
+
+class NearDuplicateIndex:
+    """
+    The last `capacity` replies, indexed for near-duplicate lookups.
+
+    Each reply is shingled and MinHashed (`num_perm` 64-bit mins, one XOR
+    mask per permutation over a blake2b hash of each shingle). The signature
+    is cut into LSH bands, and a reply is a near duplicate if it shares a band
+    with a stored reply whose exact shingle Jaccard is >= `threshold`. Only
+    the reply texts and band buckets are kept, in a ring of `capacity`
+    entries, so memory stays bounded; `in` is an alias for a lookup.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, capacity: int = DEDUP_WINDOW,
+                 num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = random.Random(seed)
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self._tables: List[Dict[int, object]] = [{} for _ in range(self.bands)]
+        self._texts: Dict[int, str] = {}
+        self._order: deque = deque()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __contains__(self, text: str) -> bool:
+        return self.query(text) is not None
+
+    def signature(self, text: str) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+                  for s in shingles(text)]
+        return [min(map(mask.__xor__, hashes)) for mask in self._masks]
+
+    def _band_keys(self, text: str) -> List[int]:
+        sig, r = self.signature(text), self.rows
+        return [hash(tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def query(self, text: str) -> Optional[Tuple[str, float]]:
+        """The most similar stored reply at or above the threshold, with its similarity."""
+        keys = self._band_keys(text)
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, keys):
+                bucket = table.get(key)
+                if bucket is None:
+                    continue
+                if isinstance(bucket, list):
+                    candidates.update(bucket)
+                else:
+                    candidates.add(bucket)
+            texts = [self._texts[i] for i in candidates if i in self._texts]
+        best = None
+        mine = shingles(text)
+        for other in texts:
+            similarity = jaccard(mine, shingles(other))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (other, similarity)
+        return best
+
+    def add(self, text: str) -> None:
+        keys = self._band_keys(text)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._texts[entry_id] = text
+            self._order.append(entry_id)
+            for table, key in zip(self._tables, keys):
+                bucket = table.get(key)
+                if bucket is None:
+                    table[key] = entry_id  # most buckets hold one entry
+                elif isinstance(bucket, list):
+                    bucket.append(entry_id)
+                else:
+                    table[key] = [bucket, entry_id]
+            evicted = self._order.popleft() if len(self._order) > self.capacity else None
+            evicted_text = self._texts.pop(evicted) if evicted is not None else None
+        if evicted is not None:
+            # Band keys are recomputed rather than kept per entry, to save memory
+            self._remove(evicted, self._band_keys(evicted_text))
+
+    def _remove(self, entry_id: int, keys: List[int]) -> None:
+        with self._lock:
+            for table, key in zip(self._tables, keys):
+                bucket = table.get(key)
+                if isinstance(bucket, list):
+                    bucket.remove(entry_id)
+                    if len(bucket) == 1:
+                        table[key] = bucket[0]
+                elif bucket == entry_id:
+                    del table[key]
+
+# Replies recently posted by this process
+recent_replies = NearDuplicateIndex()
@@ -0,0 +1,171 @@
+import random
+import re
+import unicodedata
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+# Extended_Pictographic code point ranges (Unicode 15 emoji-data.txt), merged
+# and sorted so a code point is classified with one binary search.
+_PICTOGRAPHIC_RANGES = [
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049),
+    (0x2122, 0x2122), (0x2139, 0x2139), (0x2194, 0x2199), (0x21A9, 0x21AA),
+    (0x231A, 0x231B), (0x2328, 0x2328), (0x2388, 0x2388), (0x23CF, 0x23CF),
+    (0x23E9, 0x23F3), (0x23F8, 0x23FA), (0x24C2, 0x24C2), (0x25AA, 0x25AB),
+    (0x25B6, 0x25B6), (0x25C0, 0x25C0), (0x25FB, 0x25FE), (0x2600, 0x2605),
+    (0x2607, 0x2612), (0x2614, 0x2685), (0x2690, 0x2705), (0x2708, 0x2712),
+    (0x2714, 0x2714), (0x2716, 0x2716), (0x271D, 0x271D), (0x2721, 0x2721),
+    (0x2728, 0x2728), (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747),
+    (0x274C, 0x274C), (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757),
+    (0x2763, 0x2767), (0x2795, 0x2797), (0x27A1, 0x27A1), (0x27B0, 0x27B0),
+    (0x27BF, 0x27BF), (0x2934, 0x2935), (0x2B05, 0x2B07), (0x2B1B, 0x2B1C),
+    (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x3030, 0x3030), (0x303D, 0x303D),
+    (0x3297, 0x3297), (0x3299, 0x3299), (0x1F000, 0x1F0FF), (0x1F10D, 0x1F10F),
+    (0x1F12F, 0x1F12F), (0x1F16C, 0x1F171), (0x1F17E, 0x1F17F), (0x1F18E, 0x1F18E),
+    (0x1F191, 0x1F19A), (0x1F1AD, 0x1F1E5), (0x1F201, 0x1F20F), (0x1F21A, 0x1F21A),
+    (0x1F22F, 0x1F22F), (0x1F232, 0x1F23A), (0x1F23C, 0x1F23F), (0x1F249, 0x1F3FA),
+    (0x1F400, 0x1F53D), (0x1F546, 0x1F64F), (0x1F680, 0x1F6FF), (0x1F774, 0x1F77F),
+    (0x1F7D5, 0x1F7FF), (0x1F80C, 0x1F80F), (0x1F848, 0x1F84F), (0x1F85A, 0x1F85F),
+    (0x1F888, 0x1F88F), (0x1F8AE, 0x1F8FF), (0x1F90C, 0x1F93A), (0x1F93C, 0x1F945),
+    (0x1F947, 0x1FAFF), (0x1FC00, 0x1FFFD),
+]
+_STARTS = [start for start, _ in _PICTOGRAPHIC_RANGES]
+_ENDS = [end for _, end in _PICTOGRAPHIC_RANGES]
+
+# Pictographs that render as plain text unless followed by VS16 (U+FE0F)
+_TEXT_DEFAULT = frozenset([0x00A9, 0x00AE, 0x203C, 0x2049, 0x2122, 0x2139,
+                           *range(0x2194, 0x219A), 0x21A9, 0x21AA])
+
+ZWJ = 0x200D
+VS16 = 0xFE0F
+KEYCAP = 0x20E3
+
+# The same table as a regex class, so whole emoji sequences (modifiers, VS16,
+# tags, ZWJ chains, keycaps, flag pairs) are found by the C regex engine.
+_PICT = "".join(f"{re.escape(chr(a))}-{re.escape(chr(b))}" if a != b else re.escape(chr(a))
+                for a, b in _PICTOGRAPHIC_RANGES)
+_MODS = "\ufe0f\U0001F3FB-\U0001F3FF"
+_EMOJI_RE = re.compile(
+    "[\U0001F1E6-\U0001F1FF]{2}"
+    "|[0-9#*]\ufe0f?\u20e3"
+    f"|[{_PICT}][{_MODS}]?[\U000E0020-\U000E007F]*(?:\u200d[{_PICT}][{_MODS}]?)*"
+)
+
+def is_pictographic(cp: int) -> bool:
+    """Extended_Pictographic lookup by binary search over the range table."""
+    if cp < 0xA9:
+        return False
+    i = bisect_right(_STARTS, cp) - 1
+    return i >= 0 and cp <= _ENDS[i]
+
+def _is_regional(cp: int) -> bool:
+    return 0x1F1E6 <= cp <= 0x1F1FF
+
+def _is_extend(ch: str, cp: int) -> bool:
+    """Code points that never start a grapheme cluster (UAX #29 Extend/ZWJ/SpacingMark)."""
+    return cp >= 0x300 and (
+        cp == ZWJ or 0xFE00 <= cp <= 0xFE0F or 0x1F3FB <= cp <= 0x1F3FF
+        or 0xE0020 <= cp <= 0xE007F
+        or unicodedata.category(ch) in ("Mn", "Me", "Mc")
+    )
+
+def graphemes(text: str) -> List[str]:
+    """
+    Split `text` into user-perceived characters: base + combining marks,
+    emoji + modifiers/VS16/keycap, ZWJ sequences and flag pairs stay whole.
+    Covers the UAX #29 rules that matter for reply text (no Hangul jamo or
+    Indic conjunct rules).
+    """
+    if text.isascii():
+        return list(text) if "\r\n" not in text else re.findall(r"\r\n|.", text, re.S)
+    clusters = []
+    current = ""
+    prev = -1
+    pictographic = False  # current cluster started with a pictograph
+    regional = 0          # regional indicators in the current cluster
+    for ch in text:
+        cp = ord(ch)
+        if current and (
+            (_is_extend(ch, cp) and prev not in (0x0A, 0x0D))
+            or (prev == 0x0D and cp == 0x0A)
+            or (prev == ZWJ and pictographic and is_pictographic(cp))
+            or (_is_regional(cp) and regional == 1)
+        ):
+            current += ch
+            if _is_regional(cp):
+                regional += 1
+        else:
+            if current:
+                clusters.append(current)
+            current = ch
+            pictographic = is_pictographic(cp)
+            regional = 1 if _is_regional(cp) else 0
+        prev = cp
+    if current:
+        clusters.append(current)
+    return clusters
+
+def is_emoji(cluster: str) -> bool:
+    """Whether one grapheme cluster displays as an emoji."""
+    cp = ord(cluster[0])
+    if len(cluster) > 1 and ord(cluster[-1]) == KEYCAP:
+        return True
+    if _is_regional(cp):
+        return len(cluster) == 2
+    if not is_pictographic(cp):
+        return False
+    return cp not in _TEXT_DEFAULT or chr(VS16) in cluster
+
+def _emoji_spans(text: str) -> List[Tuple[int, int]]:
+    if text.isascii():
+        return []
+    return [m.span() for m in _EMOJI_RE.finditer(text) if is_emoji(m.group())]
+
+def emoji_in(text: str) -> List[str]:
+    """The emoji in `text`, one entry per emoji sequence."""
+    return [text[a:b] for a, b in _emoji_spans(text)]
+
+def count_emoji(text: str) -> int:
+    return len(emoji_in(text))
+
+def truncate_graphemes(text: str, max_chars: int) -> str:
+    """Longest prefix of whole grapheme clusters within `max_chars` code points."""
+    if len(text) <= max_chars:
+        return text
+    out, used = [], 0
+    for cluster in graphemes(text):
+        used += len(cluster)
+        if used > max_chars:
+            break
+        out.append(cluster)
+    return "".join(out).rstrip()
+
+_SPACES_RE = re.compile(r"\s{2,}")
+
+def fit_reply(text: str, max_chars: int, choices: Sequence[str],
+              rng: Optional[random.Random] = None) -> str:
+    """
+    Make `text` carry exactly one emoji and fit in `max_chars`: extra emoji
+    are dropped (the first one stays where it is), a missing one is picked
+    from `choices`, and truncation never splits a cluster or loses the emoji.
+    """
+    spans = _emoji_spans(text)
+    if spans:
+        emoji = text[spans[0][0]:spans[0][1]]
+        for a, b in reversed(spans[1:]):
+            text = text[:a] + text[b:]
+        text = _SPACES_RE.sub(" ", text).strip()
+    else:
+        emoji = (rng or random).choice(choices)
+        text = f"{text.rstrip()} {emoji}"
+    if len(text) <= max_chars:
+        return text
+    cut = truncate_graphemes(text, max_chars)
+    if emoji in cut:
+        return cut
+    # The emoji fell past the cut: shorten the words and end with it instead
+    rest = _SPACES_RE.sub(" ", text.replace(emoji, "", 1)).strip()
+    room = max_chars - len(emoji) - 1
+    short = truncate_graphemes(rest, room)
+    if len(short) < len(rest) and not rest[len(short)].isspace() and " " in short:
+        short = short.rsplit(" ", 1)[0]  # don't leave half a word
+    return f"{short.rstrip()} {emoji}" if short else emoji
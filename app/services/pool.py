@@ -0,0 +1,164 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from app.config import (
+    REDIS_URL,
+    REPLY_POOL_BACKEND,
+    REPLY_POOL_LOW_WATERMARK,
+    REPLY_POOL_TARGET_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Coarse topics for pre-generated replies; "general" catches everything else.
+TOPIC_KEYWORDS = {
+    "fitness": {"gym", "run", "running", "workout", "marathon", "lift", "training",
+                "yoga", "fitness", "10k", "cardio", "hike", "hiking", "trail"},
+    "food": {"food", "pasta", "dinner", "lunch", "breakfast", "recipe", "cook",
+             "cooking", "coffee", "pizza", "sushi", "delicious", "baking", "chef"},
+    "travel": {"travel", "trip", "flight", "landed", "beach", "vacation", "city",
+               "tokyo", "paris", "hotel", "explore", "adventure", "rooftop"},
+    "nightlife": {"party", "club", "drinks", "cocktail", "bar", "speakeasy",
+                  "tonight", "concert", "festival", "dance"},
+    "style": {"outfit", "dress", "style", "fashion", "hair", "makeup", "nails",
+              "shoes", "fit", "look"},
+    "pets": {"dog", "cat", "puppy", "kitten", "pet", "pup"},
+}
+TOPICS = list(TOPIC_KEYWORDS) + ["general"]
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def classify_topic(text: str) -> str:
+    """Pick the coarse topic with the most keyword hits in `text`."""
+    words = set(_WORD_RE.findall(text.lower()))
+    best, hits = "general", 0
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        n = len(words & keywords)
+        if n > hits:
+            best, hits = topic, n
+    return best
+
+class LocalPoolStore:
+    """In-process pool; only useful when replies are generated in this process."""
+
+    def __init__(self):
+        self._pools: Dict[str, deque] = {}
+        self._claims: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def pop(self, topic: str) -> Tuple[Optional[str], int]:
+        """Pop one reply; returns (reply or None, replies left)."""
+        pool = self._pools.get(topic)
+        if not pool:
+            return None, 0
+        try:
+            return pool.popleft(), len(pool)
+        except IndexError:
+            return None, 0
+
+    def add(self, topic: str, replies: Iterable[str]) -> None:
+        self._pools.setdefault(topic, deque()).extend(replies)
+
+    def size(self, topic: str) -> int:
+        return len(self._pools.get(topic, ()))
+
+    def claim_refill(self, topic: str, ttl: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._claims.get(topic, 0) > now:
+                return False
+            self._claims[topic] = now + ttl
+            return True
+
+class RedisPoolStore:
+    """Pool shared by every API/worker process, one Redis list per topic."""
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=0.2, socket_connect_timeout=0.2,
+            decode_responses=True,
+        )
+
+    @staticmethod
+    def _key(topic: str) -> str:
+        return f"reply_pool:{topic}"
+
+    def pop(self, topic: str) -> Tuple[Optional[str], int]:
+        """Pop one reply; returns (reply or None, replies left) in one round-trip."""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpop(self._key(topic))
+        pipe.llen(self._key(topic))
+        reply, left = pipe.execute()
+        return reply, left
+
+    def add(self, topic: str, replies: Iterable[str]) -> None:
+        replies = list(replies)
+        if replies:
+            self.client.rpush(self._key(topic), *replies)
+
+    def size(self, topic: str) -> int:
+        return self.client.llen(self._key(topic))
+
+    def claim_refill(self, topic: str, ttl: int) -> bool:
+        return bool(self.client.set(f"reply_pool:refilling:{topic}", "1", nx=True, ex=ttl))
+
+class ReplyPool:
+    """
+    Pre-generated replies grouped by topic, served in O(1) and consumed on use.
+
+    `take()` pops one reply (falling back to the "general" topic). When a topic
+    drops below the low watermark, `on_low_watermark(topic)` is called at most
+    once per `refill_claim_ttl` seconds so a refill can be scheduled.
+    """
+
+    refill_claim_ttl = 60
+
+    def __init__(self, store, low_watermark: int = REPLY_POOL_LOW_WATERMARK,
+                 target_size: int = REPLY_POOL_TARGET_SIZE):
+        self.store = store
+        self.low_watermark = low_watermark
+        self.target_size = target_size
+        self.on_low_watermark: Optional[Callable[[str], None]] = None
+
+    def take(self, topic: str = "general") -> Optional[str]:
+        for t in (topic, "general") if topic != "general" else ("general",):
+            try:
+                reply, left = self.store.pop(t)
+                if left < self.low_watermark:
+                    self._request_refill(t)
+            except Exception as e:
+                logger.warning(f"Reply pool unavailable: {e}")
+                return None
+            if reply:
+                return reply
+        return None
+
+    def add(self, topic: str, replies: Iterable[str]) -> None:
+        self.store.add(topic, replies)
+
+    def deficits(self, topics: Iterable[str] = TOPICS) -> Dict[str, int]:
+        """How many replies each topic needs to get back to the target size."""
+        return {t: max(0, self.target_size - self.store.size(t)) for t in topics}
+
+    def _request_refill(self, topic: str) -> None:
+        if self.on_low_watermark and self.store.claim_refill(topic, self.refill_claim_ttl):
+            logger.info(f"Reply pool '{topic}' below low watermark → refill requested")
+            try:
+                self.on_low_watermark(topic)
+            except Exception as e:
+                logger.warning(f"Could not schedule reply pool refill: {e}")
+
+def _make_store():
+    if REPLY_POOL_BACKEND == "redis":
+        try:
+            return RedisPoolStore(REDIS_URL)
+        except ImportError:
+            logger.warning("redis package not installed → using local reply pool")
+    return LocalPoolStore()
+
+reply_pool = ReplyPool(_make_store())
@@ -0,0 +1,205 @@
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from app.config import (
+    PROMPT_MAX_INPUT_TOKENS,
+    PROMPT_ORIGINAL_TOKENS,
+    PROMPT_TARGET_TOKENS,
+    PROMPT_HISTORY_TOKENS,
+)
+from app.services.relevance import select_history, term_counts
+
+if TYPE_CHECKING:
+    from app.services.threads import ThreadState
+
+# Words, numbers and single punctuation marks are each roughly one BPE token;
+# long words get split into several, which the per-piece length term covers.
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_ELLIPSIS = " … "
+
+# Static prefix: persona and instructions never change between requests, so
+# they go first and upstream prefix/context caching can reuse them. Anything
+# request-specific must stay out of SYSTEM_PROMPT.
+SYSTEM_PROMPT = (
+    "You are Ava, a witty 20-something woman replying on Threads. "
+    "Never reveal you are an AI or mention AI capabilities.\n\n"
+    "INSTRUCTIONS:\n"
+    "You will be shown a thread, some other replies and a TARGET reply. "
+    "Write ONE casual reply (≤12 words) that addresses the TARGET author, "
+    "adds a fresh perspective, and includes exactly ONE emoji.\n"
+    "IMPORTANT: Output ONLY the reply text. "
+    "DO NOT mention being an AI or any model names."
+)
+
+# Templates are bound once at import; building a prompt is just str.format calls.
+# Variable thread data goes in the user message, least-changing parts first.
+_THREAD = 'THREAD by @{username} (ID {post_id}):\n  Text: "{text}"\n\n'.format
+_HISTORY_HEADER = "OTHER REPLIES:\n"
+_HISTORY_LINE = '  @{username}: "{text}"\n'.format
+_SUMMARY_LINE = "  ({summary})\n".format
+_IMAGES_HEADER = "IMAGES:\n"
+_IMAGE_LINE = "  in {where}: {caption}\n".format
+_TARGET = 'TARGET by @{username}: "{text}"\n\nReply to @{username}.'.format
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate (within ~15% of BPE counts for chat text)."""
+    if not text:
+        return 0
+    return sum(1 + len(piece) // 8 for piece in _PIECE_RE.findall(text))
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """
+    Shorten text to roughly `budget` tokens on word boundaries, keeping the
+    opening two thirds and the closing third (where posts usually put the
+    question or punchline) joined by an ellipsis.
+    """
+    if budget <= 0:
+        return ""
+    if len(text) <= budget:  # every token covers at least one character
+        return text
+    spans = [(m.end(), 1 + len(m.group()) // 8) for m in _PIECE_RE.finditer(text)]
+    if sum(cost for _, cost in spans) <= budget:
+        return text
+
+    budget -= 1  # the ellipsis
+    head_budget = max(1, (budget * 2) // 3)
+    tail_budget = budget - head_budget
+
+    used, head_end = 0, 0
+    for end, cost in spans:
+        if used + cost > head_budget:
+            break
+        used += cost
+        head_end = end
+
+    used, tail_start = 0, len(text)
+    for m in reversed(list(_PIECE_RE.finditer(text, head_end))):
+        cost = 1 + len(m.group()) // 8
+        if used + cost > tail_budget:
+            break
+        used += cost
+        tail_start = m.start()
+
+    head = text[:head_end].rstrip()
+    tail = text[tail_start:].lstrip() if tail_start < len(text) else ""
+    return (head + _ELLIPSIS + tail).strip()
+
+_SYSTEM_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+@dataclass
+class PromptBuild:
+    """The chat messages plus the token accounting that produced it."""
+    context: str
+    target: str
+    system: str = SYSTEM_PROMPT
+    images: str = ""
+    tokens: Dict[str, int] = field(default_factory=dict)
+    total_tokens: int = 0
+    truncated: List[str] = field(default_factory=list)
+
+    @property
+    def prompt(self) -> str:
+        return self.context + self.images + self.target
+
+    def add_images(self, captions: List[Tuple[str, str]]) -> None:
+        """Insert (where, caption) image descriptions ahead of the target."""
+        if not captions:
+            return
+        self.images = _IMAGES_HEADER + "".join(
+            _IMAGE_LINE(where=where, caption=caption) for where, caption in captions
+        ) + "\n"
+        self.tokens["images"] = estimate_tokens(self.images)
+        self.total_tokens += self.tokens["images"]
+
+    def messages(self) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user",   "content": self.prompt},
+        ]
+
+def build_prompt(p: Dict, max_tokens: int = PROMPT_MAX_INPUT_TOKENS,
+                 thread: Optional["ThreadState"] = None) -> PromptBuild:
+    """
+    Build the reply prompt for payload `p` within a total input token budget.
+
+    Every field is first capped at its own budget. History entries are
+    picked by relevance to the target and recency (at most
+    PROMPT_MAX_HISTORY within PROMPT_HISTORY_BUDGET tokens) and sent oldest
+    first. If the whole prompt still exceeds `max_tokens`, the oldest
+    history lines are dropped and then the original post is shrunk further,
+    since the target matters most.
+
+    With a `thread` state the original post and replies come pre-fitted and
+    pre-tokenized from it, and replies beyond its window only appear
+    through the thread's rolling summary.
+    """
+    original, target = p.get("original", {}), p.get("target", {})
+    target_user = target.get("username", "unknown")
+    truncated = []
+
+    def fit(name: str, text: str, budget: int) -> str:
+        short = truncate_to_tokens(text, budget)
+        if short is not text and name not in truncated:
+            truncated.append(name)
+        return short
+
+    targ = fit("target", target.get("text", ""), PROMPT_TARGET_TOKENS)
+    if thread is not None:
+        orig = thread.original_text
+        if orig != thread.original_raw:
+            truncated.append("original")
+        entries = thread.history(target_user, target.get("text", ""))
+        picked = select_history(target.get("text", ""), [e.terms for e in entries],
+                                [e.tokens for e in entries],
+                                lengths=[e.length for e in entries])
+        hist = [(entries[i].username, entries[i].text) for i in picked]
+        summary = thread.summary()
+    else:
+        orig = fit("original", original.get("text", ""), PROMPT_ORIGINAL_TOKENS)
+        history = p.get("history", [])
+        texts = [h.get("text", "") for h in history]
+        picked = select_history(target.get("text", ""), [term_counts(t) for t in texts],
+                                [min(estimate_tokens(t), PROMPT_HISTORY_TOKENS) for t in texts])
+        hist = [(history[i].get("username", "unknown"),
+                 fit(f"history[{i}]", texts[i], PROMPT_HISTORY_TOKENS)) for i in picked]
+        summary = ""
+
+    thread_part = _THREAD(username=original.get("username", "unknown"),
+                          post_id=p.get("postId", "0"), text=orig)
+    target_part = _TARGET(username=target_user, text=targ)
+    lines = [_HISTORY_LINE(username=u, text=t) for u, t in hist]
+    if summary:
+        lines.insert(0, _SUMMARY_LINE(summary=summary))
+
+    tokens = {
+        "original": estimate_tokens(thread_part),
+        "target": estimate_tokens(target_part),
+        "history": sum(estimate_tokens(line) for line in lines),
+        "system": _SYSTEM_TOKENS,
+    }
+    total = sum(tokens.values())
+
+    while lines and total > max_tokens:
+        # Lines are oldest first (summary, then replies): drop from the top
+        dropped = estimate_tokens(lines.pop(0))
+        tokens["history"] -= dropped
+        total -= dropped
+        if "history" not in truncated:
+            truncated.append("history")
+
+    if total > max_tokens:
+        room = estimate_tokens(orig) - (total - max_tokens)
+        orig = fit("original", orig, max(room, 8))
+        thread_part = _THREAD(username=original.get("username", "unknown"),
+                              post_id=p.get("postId", "0"), text=orig)
+        total -= tokens["original"]
+        tokens["original"] = estimate_tokens(thread_part)
+        total += tokens["original"]
+
+    context = thread_part
+    if lines:
+        context += _HISTORY_HEADER + "".join(lines) + "\n"
+
+    return PromptBuild(context=context, target=target_part, tokens=tokens,
+                       total_tokens=total, truncated=truncated)
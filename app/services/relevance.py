@@ -0,0 +1,90 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from app.config import (
+    HISTORY_RECENCY_HALF_LIFE,
+    HISTORY_RECENCY_WEIGHT,
+    PROMPT_HISTORY_BUDGET,
+    PROMPT_MAX_HISTORY,
+)
+
+_TERM_RE = re.compile(r"[a-z0-9][a-z0-9']+")
+STOPWORDS = frozenset(
+    "the and for you your are but not was this that with have just what when "
+    "like from they them then than there their were been will would could "
+    "should about into over really very much more some here also only even "
+    "still it's that's i'm you're don't can't its our out all get got who how "
+    "too lol omg".split()
+)
+
+# BM25 parameters: term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Lowercased terms of `text` without stopwords, with their counts."""
+    return Counter(t for t in _TERM_RE.findall(text.lower()) if t not in STOPWORDS)
+
+def bm25_scores(query: Sequence[str], docs: Sequence[Dict[str, int]],
+                lengths: Optional[Sequence[int]] = None) -> Dict[int, float]:
+    """
+    BM25 scores {doc index: score} of the docs (term counts) matching any
+    query term, with document frequencies taken from `docs` themselves (the
+    thread is the corpus). Docs without a match are left out.
+    """
+    n = len(docs)
+    terms = set(query)
+    if not n or not terms:
+        return {}
+    if lengths is None:
+        lengths = [sum(d.values()) for d in docs]
+    matches = [(i, d.keys() & terms) for i, d in enumerate(docs)
+               if not terms.isdisjoint(d)]
+    if not matches:
+        return {}
+    df = Counter(t for _, m in matches for t in m)
+    idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+    avg_len = (sum(lengths) / n) or 1.0
+    scores = {}
+    for i, matched in matches:
+        d = docs[i]
+        norm = K1 * (1 - B + B * lengths[i] / avg_len)
+        scores[i] = sum(idf[t] * d[t] * (K1 + 1) / (d[t] + norm) for t in matched)
+    return scores
+
+def select_history(query: str, docs: Sequence[Dict[str, int]], tokens: Sequence[int],
+                   k: int = PROMPT_MAX_HISTORY, budget: int = PROMPT_HISTORY_BUDGET,
+                   recency_weight: float = HISTORY_RECENCY_WEIGHT,
+                   half_life: float = HISTORY_RECENCY_HALF_LIFE,
+                   lengths: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    Indices of the (oldest-first) history entries worth sending: ranked by
+    BM25 relevance to `query` (scaled to 0..1) plus `recency_weight` times a
+    recency term halving every `half_life` replies, then taken greedily
+    while their `tokens` fit `budget`, at most `k`. Returned oldest first.
+    """
+    n = len(docs)
+    if not n or k <= 0:
+        return []
+    # Recency, newest = recency_weight, built backwards by repeated halving steps
+    step = 0.5 ** (1 / max(half_life, 1e-9))
+    score = [0.0] * n
+    weight = recency_weight
+    for i in range(n - 1, -1, -1):
+        score[i] = weight
+        weight *= step
+    relevance = bm25_scores(list(term_counts(query)), docs, lengths)
+    if relevance:
+        top = max(relevance.values()) or 1.0
+        for i, r in relevance.items():
+            score[i] += r / top
+    picked, used = [], 0
+    for i in sorted(range(n), key=score.__getitem__, reverse=True):
+        if used + tokens[i] <= budget:
+            picked.append(i)
+            used += tokens[i]
+            if len(picked) == k:
+                break
+    return sorted(picked)
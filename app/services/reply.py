@@ -1,20 +1,50 @@
 import random
-import asyncio
 import json
 import logging
 import re
+import time
 from typing import Dict, List, Optional
 
 import aiohttp
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import before_sleep_log, retry, stop_after_attempt
 
 from app.config import (
     DEEPSEEK_API_KEY,
     DEEPSEEK_CHAT_URL,
     CHAT_MODEL,
+    CHAT_TIMEOUT_SECONDS,
+    CHAT_MAX_ATTEMPTS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MAX_TOKENS,
+    REPLY_CANDIDATES,
+    REPLY_CANDIDATE_MODE,
+    REPLY_MAX_CHARS,
+    REPLY_EMOJIS,
     FALLBACK_COMMENTS,
-    POSTED_COMMENTS,
 )
+from app.services.retry import (
+    RetryBudget,
+    UpstreamError,
+    classify_exception,
+    error_for_status,
+    retry_if_budget,
+    wait_retry_after,
+)
+from app.services.prompt import SYSTEM_PROMPT, build_prompt
+from app.services.candidates import candidate_request, parse_candidates, select_best
+from app.services.dedup import recent_replies
+from app.services.emoji import count_emoji, fit_reply
+from app.services.pool import TOPICS, classify_topic, reply_pool
+from app.services.threads import thread_store
+from app.services.vision import (
+    cancel_captioning,
+    collect_captions,
+    find_image_urls,
+    start_captioning,
+)
+from app.metrics import metrics
 
 # Get a logger for this module
 logger = logging.getLogger(__name__)
@@ -41,6 +71,25 @@ def sanitize_log_message(obj):
         return [sanitize_log_message(item) for item in obj]
     return obj
 
+# Compiled once at import, so preloaded web workers share them copy-on-write
+_CLEAN_PATTERNS = [(re.compile(pattern), repl) for pattern, repl in [
+    (r'(?i)deepseek', ''), (r'(?i)deep\s*seek', ''), (r'(?i)deep-seek', ''),
+    (r'(?i)as\s*an?\s*ai', ''), (r'(?i)i\'m\s*an?\s*ai', ''), (r'(?i)ai\s*assistant', ''),
+    (r'(?i)ai\s*model', ''), (r'(?i)language\s*model', ''), (r'(?i)llm', ''),
+    (r'(?i)gpt', ''), (r'(?i)artificial\s*intelligence', ''),
+    (r'(?i)i\s*don\'?t\s*have\s*personal', ''), (r'(?i)i\s*cannot', ''),
+    (r'(?i)i\'m\s*not\s*able\s*to', ''), (r'(?i)i\s*don\'?t\s*have\s*access\s*to', ''),
+    (r'(?i)i\s*don\'?t\s*have\s*the\s*ability', ''), (r'(?i)as\s*a[n]?\s*language\s*model', ''),
+    (r'(?i)assistant[:\s]', ''), (r'(?i)system[:\s]', ''), (r'(?i)ai[:\s]', ''),
+    (r'^[\'"]', ''), (r'[\'"]$', ''), (r'(?i)the\s*ai', 'it'),
+    (r'(?i)\bai\b', ''), (r'(?i)powered\s*by', 'made with'),
+    (r'(?i)technology', 'tech'), (r'(?i)trained\s*on', 'based on'),
+    (r'(?i)generate\s*responses', 'create replies'), (r'(?i)chatbot', 'app'),
+]]
+_SPACES_RE = re.compile(r'\s+')
+_LEADING_I_RE = re.compile(r'^I\s+(?!\')', re.IGNORECASE)
+_STRIP_I_RE = re.compile(r'^I\s+', re.IGNORECASE)
+
 def clean_reply(text: str) -> Optional[str]:
     """
     Clean the reply text to remove any references to DeepSeek, AI assistants,
@@ -49,132 +98,244 @@ def clean_reply(text: str) -> Optional[str]:
     if not text:
         return None
 
-    patterns = [
-        (r'(?i)deepseek', ''), (r'(?i)deep\s*seek', ''), (r'(?i)deep-seek', ''),
-        (r'(?i)as\s*an?\s*ai', ''), (r'(?i)i\'m\s*an?\s*ai', ''), (r'(?i)ai\s*assistant', ''),
-        (r'(?i)ai\s*model', ''), (r'(?i)language\s*model', ''), (r'(?i)llm', ''),
-        (r'(?i)gpt', ''), (r'(?i)artificial\s*intelligence', ''),
-        (r'(?i)i\s*don\'?t\s*have\s*personal', ''), (r'(?i)i\s*cannot', ''),
-        (r'(?i)i\'m\s*not\s*able\s*to', ''), (r'(?i)i\s*don\'?t\s*have\s*access\s*to', ''),
-        (r'(?i)i\s*don\'?t\s*have\s*the\s*ability', ''), (r'(?i)as\s*a[n]?\s*language\s*model', ''),
-        (r'(?i)assistant[:\s]', ''), (r'(?i)system[:\s]', ''), (r'(?i)ai[:\s]', ''),
-        (r'^[\'"]', ''), (r'[\'"]$', ''), (r'(?i)the\s*ai', 'it'),
-        (r'(?i)\bai\b', ''), (r'(?i)powered\s*by', 'made with'),
-        (r'(?i)technology', 'tech'), (r'(?i)trained\s*on', 'based on'),
-        (r'(?i)generate\s*responses', 'create replies'), (r'(?i)chatbot', 'app'),
-    ]
-
     cleaned = text
-    for pattern, repl in patterns:
-        cleaned = re.sub(pattern, repl, cleaned)
+    for pattern, repl in _CLEAN_PATTERNS:
+        cleaned = pattern.sub(repl, cleaned)
 
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-    if re.match(r'^I\s+(?!\')', cleaned, re.IGNORECASE):
-        cleaned = re.sub(r'^I\s+', '', cleaned, flags=re.IGNORECASE)
+    cleaned = _SPACES_RE.sub(' ', cleaned).strip()
+    if _LEADING_I_RE.match(cleaned):
+        cleaned = _STRIP_I_RE.sub('', cleaned)
 
     # Final guard: if it dropped to too few chars, fallback
     if len(cleaned) < 5:
         return None
     return cleaned
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-async def make_reply(p: Dict) -> str:
+# Shared by every make_reply call in this process
+RETRY_BUDGET = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX_TOKENS)
+
+@retry(
+    stop=stop_after_attempt(CHAT_MAX_ATTEMPTS),
+    wait=wait_retry_after(RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX),
+    retry=retry_if_budget(RETRY_BUDGET, CHAT_MAX_ATTEMPTS),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+async def post_chat(body: Dict) -> Dict:
+    """
+    POST one chat completion request and return the decoded JSON.
+    Raises RetryableUpstreamError / TerminalUpstreamError; retryable ones
+    are retried with jittered backoff, Retry-After and the retry budget.
+    """
+    try:
+        async with aiohttp.ClientSession() as session:
+            resp = await session.post(
+                DEEPSEEK_CHAT_URL,
+                headers={
+                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+                    "Content-Type": "application/json",
+                },
+                json=body,
+                timeout=CHAT_TIMEOUT_SECONDS,
+            )
+            if resp.status != 200:
+                if resp.status == 429:
+                    metrics.incr("upstream_throttled")  # feeds the worker autoscaler
+                raise error_for_status(
+                    resp.status, await resp.text(), resp.headers.get("Retry-After")
+                )
+            return await resp.json()
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise classify_exception(e) from e
+
+def record_cache_usage(usage: Dict) -> Optional[float]:
+    """
+    Account prompt-cache hits from the response `usage` block and return the
+    hit ratio for this call. DeepSeek reports prompt_cache_hit_tokens /
+    prompt_cache_miss_tokens; OpenAI-style APIs report
+    prompt_tokens_details.cached_tokens out of prompt_tokens.
+    """
+    if "prompt_cache_hit_tokens" in usage:
+        hit = usage.get("prompt_cache_hit_tokens") or 0
+        miss = usage.get("prompt_cache_miss_tokens") or 0
+    elif "prompt_tokens_details" in usage:
+        hit = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        miss = max(0, (usage.get("prompt_tokens") or 0) - hit)
+    else:
+        return None
+
+    metrics.incr("prompt_cache_hit_tokens", hit)
+    metrics.incr("prompt_cache_miss_tokens", miss)
+    total_hit = metrics.counter("prompt_cache_hit_tokens")
+    total = total_hit + metrics.counter("prompt_cache_miss_tokens")
+    if total:
+        metrics.gauge("prompt_cache_hit_ratio", total_hit / total)
+
+    ratio = hit / (hit + miss) if hit + miss else 0.0
+    logger.debug(f"Prompt cache: hit={hit} miss={miss} ratio={ratio:.2f}")
+    return ratio
+
+def fallback_reply(p: Dict) -> str:
+    """
+    Reply without calling the upstream: a pre-generated reply for the thread's
+    topic if the pool has one, else a static fallback comment.
+    """
+    text = f'{p.get("original", {}).get("text", "")} {p.get("target", {}).get("text", "")}'
+    reply = reply_pool.take(classify_topic(text))
+    if reply:
+        metrics.incr("reply_pool_served")
+        return reply
+    metrics.incr("static_fallback_served")
+    return random.choice(FALLBACK_COMMENTS)
+
+async def generate_pool_replies(topic: str, k: int) -> List[str]:
+    """Ask the upstream for `k` generic, reusable replies about `topic`."""
+    subject = "anything" if topic == "general" else topic
+    js = await post_chat({
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": (
+                f"Write {k} different replies that would fit almost any Threads "
+                f"post about {subject}. No @mentions, no specifics from a post. "
+                "Output ONLY a numbered list, one reply per line."
+            )},
+        ],
+        "max_tokens": 30 * k,
+        "temperature": 1.0,
+    })
+    seen, replies = set(), []
+    for raw in parse_candidates(js, "list"):
+        cleaned = clean_reply(raw)
+        if (cleaned and cleaned not in seen and len(cleaned) <= REPLY_MAX_CHARS
+                and count_emoji(cleaned) == 1):
+            seen.add(cleaned)
+            replies.append(cleaned)
+    return replies
+
+async def refill_reply_pool(topics: Optional[List[str]] = None, batch: int = 10) -> Dict[str, int]:
+    """Top up the reply pool for `topics` (default: all); returns replies added."""
+    added = {}
+    for topic, missing in reply_pool.deficits(topics or TOPICS).items():
+        added[topic] = 0
+        while missing > 0:
+            RETRY_BUDGET.record_request()
+            try:
+                replies = await generate_pool_replies(topic, min(batch, missing))
+            except UpstreamError as e:
+                logger.warning(f"Reply pool refill for '{topic}' failed: {e}")
+                break
+            if not replies:
+                break
+            reply_pool.add(topic, replies)
+            added[topic] += len(replies)
+            missing -= len(replies)
+    logger.info(f"Reply pool refilled: {added}")
+    return added
+
+class NoReply(Exception):
+    """
+    make_reply(allow_fallback=False) could not generate a reply. `retryable`
+    is set when the upstream was the problem (error, outage, no API key).
+    """
+
+    def __init__(self, reason: str, retryable: bool = False):
+        super().__init__(reason)
+        self.retryable = retryable
+
+async def make_reply(p: Dict, allow_fallback: bool = True) -> str:
     """
     Generate a reply using DeepSeek-Chat API or fallback to predefined comments.
-    Expects keys: original, target, history, postId.
+    Expects keys: original, target, history, postId. With `allow_fallback`
+    false, NoReply is raised wherever a fallback would have been served.
     """
     logger.debug(f"Starting make_reply (postId={p.get('postId')})")
 
+    def fallback(reason: str, retryable: bool = False) -> str:
+        if not allow_fallback:
+            raise NoReply(reason, retryable)
+        return fallback_reply(p)
+
     try:
         orig = p.get("original", {}).get("text", "")
         targ = p.get("target", {}).get("text", "")
         if not orig or not targ:
             logger.warning("Missing original or target text → falling back")
-            return random.choice(FALLBACK_COMMENTS)
+            return fallback("missing original or target text")
 
-        # Build the prompt
-        prompt = (
-            f'THREAD by @{p["original"].get("username","unknown")} (ID {p.get("postId","0")}):\n'
-            f'  Text: "{orig}"\n\n'
-            f'TARGET by @{p["target"]["username"]}: "{targ}"\n\n'
-        )
-        hist = p.get("history", [])[:3]
-        if hist:
-            prompt += "OTHER REPLIES:\n"
-            for h in hist:
-                prompt += f'  @{h["username"]}: "{h["text"]}"\n'
-            prompt += "\n"
-        prompt += (
-            "INSTRUCTIONS:\n"
-            "Write ONE casual reply (≤12 words) that addresses "
-            f"@{p['target']['username']}, adds a fresh perspective, "
-            "and includes exactly ONE emoji.\n"
-            "IMPORTANT: Output ONLY the reply text. "
-            "DO NOT mention being an AI or any model names."
-        )
+        # Caption any images concurrently with prompt building
+        vision_started = time.monotonic()
+        captioning = start_captioning(find_image_urls(p)) if DEEPSEEK_API_KEY else []
 
-        sys_prompt = (
-            "You are Ava, a witty 20-something woman replying on Threads. "
-            "Never reveal you are an AI or mention AI capabilities."
+        # Build the prompt within the input token budget, reusing what is
+        # already known about this thread from earlier calls
+        try:
+            built = build_prompt(p, thread=thread_store.observe(p))
+            built.add_images(await collect_captions(captioning, vision_started))
+        finally:
+            cancel_captioning(captioning)  # no-op unless something above raised
+        logger.debug(
+            f"Prompt tokens: total={built.total_tokens} {built.tokens} "
+            f"truncated={built.truncated}"
         )
 
         if not DEEPSEEK_API_KEY:
             logger.error("No DEEPSEEK_API_KEY → falling back")
-            return random.choice(FALLBACK_COMMENTS)
+            return fallback("no DEEPSEEK_API_KEY", retryable=True)
 
-        async with aiohttp.ClientSession() as session:
-            resp = await session.post(
-                DEEPSEEK_CHAT_URL,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": CHAT_MODEL,
-                    "messages": [
-                        {"role": "system",  "content": sys_prompt},
-                        {"role": "user",    "content": prompt},
-                    ],
-                    "max_tokens": 100,
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "frequency_penalty": 0.5,
-                    "presence_penalty": 0.5,
-                },
-                timeout=60,
-            )
-            
-            if resp.status != 200:
-                logger.error(f"DeepSeek API error: {resp.status} {await resp.text()}")
-                return random.choice(FALLBACK_COMMENTS)
-                
-            js = await resp.json()
-            
-        # Parse & clean
-        choices = js.get("choices", [])
-        if not choices:
+        RETRY_BUDGET.record_request()
+        chat_started = time.monotonic()
+        try:
+            js = await post_chat(candidate_request({
+                "model": CHAT_MODEL,
+                "messages": built.messages(),
+                "max_tokens": 100,
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "frequency_penalty": 0.5,
+                "presence_penalty": 0.5,
+            }, REPLY_CANDIDATES, REPLY_CANDIDATE_MODE))
+        except UpstreamError as e:
+            logger.error(f"{e} → falling back")
+            return fallback(str(e), retryable=True)
+        finally:
+            metrics.observe("chat_seconds", time.monotonic() - chat_started)
+
+        record_cache_usage(js.get("usage") or {})
+
+        # Parse, clean and pick the best candidate
+        mode = REPLY_CANDIDATE_MODE if REPLY_CANDIDATES > 1 else "n"
+        raws = parse_candidates(js, mode)
+        if not raws:
             logger.warning("Empty choices → falling back")
-            return random.choice(FALLBACK_COMMENTS)
+            return fallback("upstream returned no choices")
 
-        raw = choices[0].get("message", {}).get("content", "").strip().strip('"\'')
-        cleaned = clean_reply(raw) or random.choice(FALLBACK_COMMENTS)
+        cleaned = select_best(
+            (clean_reply(raw) for raw in raws), recent_replies
+        ) or fallback("no usable candidate")
+        logger.debug(f"Picked {cleaned!r} from {len(raws)} candidate(s)")
 
-        # Ensure one emoji
-        if not any(ord(c) > 127 for c in cleaned):
-            cleaned += " " + random.choice(["✨", "🔥", "🙌", "👍", "😊", "💯", "🌟", "❤️"])
+        # Exactly one emoji, within the length limit
+        cleaned = fit_reply(cleaned, REPLY_MAX_CHARS, REPLY_EMOJIS)
 
-        # De-dup
-        if cleaned in POSTED_COMMENTS.values():
-            cleaned += random.choice([" ✨", " 🔥", " 🙌"])
-        POSTED_COMMENTS[p["postId"]] = cleaned
+        # Near-duplicates of recent replies are replaced by a fallback reply
+        duplicate = recent_replies.query(cleaned)
+        if duplicate:
+            metrics.incr("near_duplicate_replies")
+            logger.info(f"{cleaned!r} repeats {duplicate[0]!r} "
+                        f"(similarity {duplicate[1]:.2f}) → falling back")
+            cleaned = fit_reply(fallback("near-duplicate of a recent reply"),
+                                REPLY_MAX_CHARS, REPLY_EMOJIS)
+        recent_replies.add(cleaned)
 
-        return cleaned[:80]
+        return cleaned
         
-    except asyncio.TimeoutError:
-        logger.error("DeepSeek API timeout → falling back")
-        return random.choice(FALLBACK_COMMENTS)
+    except NoReply:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in make_reply: {str(e)}")
-        return random.choice(FALLBACK_COMMENTS)
+        return fallback(f"unexpected error: {e}", retryable=True)
 
 # Note: The Celery task registration is moved to a separate file to avoid circular imports
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+import aiohttp
+from tenacity import RetryCallState, wait_random_exponential
+
+logger = logging.getLogger(__name__)
+
+class UpstreamError(Exception):
+    """A failed call to the DeepSeek API."""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class RetryableUpstreamError(UpstreamError):
+    """Transient failure (connect error, timeout, 429, 5xx) worth retrying."""
+
+class TerminalUpstreamError(UpstreamError):
+    """Failure that will not go away by retrying (4xx, bad payload, ...)."""
+
+def is_retryable_status(status: int) -> bool:
+    """429, 408 and every 5xx are transient; everything else is terminal."""
+    return status in (408, 429) or 500 <= status <= 599
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delta-seconds or HTTP-date) into seconds.
+    Returns None when the header is missing or unparseable.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+def error_for_status(status: int, body: str = "",
+                     retry_after: Optional[str] = None) -> UpstreamError:
+    """Build the classified error for a non-200 upstream response."""
+    message = f"DeepSeek API error: {status} {body[:200]}"
+    if is_retryable_status(status):
+        return RetryableUpstreamError(message, status, parse_retry_after(retry_after))
+    return TerminalUpstreamError(message, status)
+
+def classify_exception(exc: BaseException) -> UpstreamError:
+    """Map a transport exception onto the retryable/terminal hierarchy."""
+    if isinstance(exc, UpstreamError):
+        return exc
+    if isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+        return RetryableUpstreamError(f"{type(exc).__name__}: {exc}")
+    return TerminalUpstreamError(f"{type(exc).__name__}: {exc}")
+
+class RetryBudget:
+    """
+    Token-bucket retry budget shared by all calls in a process.
+
+    Each original request deposits `ratio` tokens (capped at `max_tokens`)
+    and each retry withdraws a whole token, so during an outage retries are
+    limited to roughly `ratio` of the request rate instead of multiplying it.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+def retry_if_budget(budget: RetryBudget, max_attempts: int) -> Callable[[RetryCallState], bool]:
+    """
+    tenacity `retry=` predicate: retry only retryable errors, only while
+    attempts remain, and only if the budget has a token to spend.
+    """
+    def predicate(retry_state: RetryCallState) -> bool:
+        outcome = retry_state.outcome
+        if outcome is None or not outcome.failed:
+            return False
+        if not isinstance(outcome.exception(), RetryableUpstreamError):
+            return False
+        if retry_state.attempt_number >= max_attempts:
+            return False
+        if not budget.try_withdraw():
+            logger.warning("Retry budget exhausted → not retrying")
+            return False
+        return True
+    return predicate
+
+def wait_retry_after(base: float, maximum: float) -> Callable[[RetryCallState], float]:
+    """
+    tenacity `wait=` strategy: honor the upstream Retry-After when present
+    (capped at `maximum`), otherwise full-jitter exponential backoff.
+    """
+    jittered = wait_random_exponential(multiplier=base, max=maximum)
+
+    def wait(retry_state: RetryCallState) -> float:
+        outcome = retry_state.outcome
+        exc = outcome.exception() if outcome is not None and outcome.failed else None
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, maximum)
+        return jittered(retry_state)
+    return wait
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Set
+
+from app.config import (
+    PROMPT_HISTORY_TOKENS,
+    PROMPT_ORIGINAL_TOKENS,
+    THREAD_IDLE_SECONDS,
+    THREAD_MAX_ACTIVE,
+    THREAD_RECENT_REPLIES,
+)
+from app.services.prompt import estimate_tokens, truncate_to_tokens
+from app.services.relevance import term_counts
+
+# Posts without a real thread id share this placeholder; they get no state
+NO_THREAD = "system-generated"
+
+def reply_key(username: str, text: str) -> int:
+    return hash((username, text))
+
+@dataclass
+class HistoryEntry:
+    """One reply in a thread, fitted to the history budget and tokenized once."""
+    username: str
+    text: str
+    tokens: int
+    key: int
+    terms: Dict[str, int]
+    length: int = 0
+
+@dataclass
+class ThreadState:
+    """
+    Normalized context for one thread: the original post fitted once, the
+    latest replies, and a rolling summary of the replies that scrolled out.
+    """
+    post_id: str
+    original_username: str = "unknown"
+    original_raw: str = ""
+    original_text: str = ""
+    recent: Deque[HistoryEntry] = field(default_factory=deque)
+    seen: Set[int] = field(default_factory=set)
+    earlier_count: int = 0
+    earlier_users: Counter = field(default_factory=Counter)
+    earlier_words: Counter = field(default_factory=Counter)
+    _summary: Optional[str] = None
+    last_seen: float = 0.0
+
+    def set_original(self, username: str, text: str) -> None:
+        if text != self.original_raw:
+            self.original_raw = text
+            self.original_text = truncate_to_tokens(text, PROMPT_ORIGINAL_TOKENS)
+        self.original_username = username
+
+    def add(self, username: str, text: str, keep: int = THREAD_RECENT_REPLIES) -> bool:
+        """Append a reply unless it was already seen; returns whether it was new."""
+        key = reply_key(username, text)
+        if key in self.seen or not text:
+            return False
+        self.seen.add(key)
+        short = truncate_to_tokens(text, PROMPT_HISTORY_TOKENS)
+        terms = term_counts(text)
+        self.recent.append(HistoryEntry(username, short, estimate_tokens(short), key,
+                                        terms, sum(terms.values())))
+        while len(self.recent) > keep:
+            self._roll_up(self.recent.popleft())
+        return True
+
+    def _roll_up(self, entry: HistoryEntry) -> None:
+        self.earlier_count += 1
+        self.earlier_users[entry.username] += 1
+        self.earlier_words.update({t: n for t, n in entry.terms.items()
+                                   if len(t) > 3 and not t.isdigit()})
+        if len(self.earlier_words) > 200:  # keep the counter small
+            self.earlier_words = Counter(dict(self.earlier_words.most_common(50)))
+        self._summary = None
+
+    def summary(self) -> str:
+        """One compact line about the replies no longer kept verbatim."""
+        if not self.earlier_count:
+            return ""
+        if self._summary is None:
+            users = [f"@{u}" for u, _ in self.earlier_users.most_common(3)]
+            more = len(self.earlier_users) - len(users)
+            text = f"{self.earlier_count} earlier replies from {', '.join(users)}"
+            if more > 0:
+                text += f" +{more}"
+            words = [w for w, _ in self.earlier_words.most_common(5)]
+            if words:
+                text += f"; about {', '.join(words)}"
+            self._summary = text
+        return self._summary
+
+    def history(self, target_username: str = "", target_text: str = "") -> List[HistoryEntry]:
+        """Kept replies, oldest first, without the target being replied to."""
+        exclude = reply_key(target_username, target_text)
+        return [e for e in self.recent if e.key != exclude]
+
+class ThreadContextStore:
+    """
+    Per-process thread states keyed by postId. Each call only normalizes the
+    replies it has not seen before; threads idle for `idle_seconds` are
+    evicted, and at most `max_threads` are kept (least recently used first).
+    """
+
+    def __init__(self, idle_seconds: float = THREAD_IDLE_SECONDS,
+                 max_threads: int = THREAD_MAX_ACTIVE):
+        self.idle_seconds = idle_seconds
+        self.max_threads = max_threads
+        self._threads: "OrderedDict[str, ThreadState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def observe(self, p: Dict) -> Optional[ThreadState]:
+        """
+        Fold payload `p` into its thread's state and return it, or None when
+        the payload has no thread id. History is taken oldest first; the
+        target is appended too, so later calls see it as an earlier reply.
+        """
+        post_id = p.get("postId")
+        if not post_id or post_id == NO_THREAD:
+            return None
+        original, target = p.get("original") or {}, p.get("target") or {}
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            state = self._threads.get(post_id)
+            if state is None:
+                state = self._threads[post_id] = ThreadState(post_id)
+                if len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+            else:
+                self._threads.move_to_end(post_id)
+            state.last_seen = now
+            state.set_original(original.get("username", "unknown"), original.get("text", ""))
+            for h in p.get("history") or []:
+                state.add(h.get("username", "unknown"), h.get("text", ""))
+            state.add(target.get("username", "unknown"), target.get("text", ""))
+        return state
+
+    def _evict(self, now: float) -> None:
+        """Drop idle threads; they are ordered by last use, oldest first."""
+        while self._threads:
+            post_id, state = next(iter(self._threads.items()))
+            if now - state.last_seen < self.idle_seconds:
+                break
+            del self._threads[post_id]
+
+thread_store = ThreadContextStore()
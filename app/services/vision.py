@@ -1,5 +1,49 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
 import aiohttp
-from app.config import DEEPSEEK_API_KEY, DEEPSEEK_VISION_URL, VISION_MODEL
+from app.config import (
+    DEEPSEEK_API_KEY,
+    DEEPSEEK_VISION_URL,
+    VISION_MODEL,
+    VISION_MAX_IMAGES,
+    VISION_BATCH_SIZE,
+    VISION_IMAGE_TIMEOUT_SECONDS,
+    VISION_TOTAL_BUDGET_SECONDS,
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Keys a post dict may carry media under: a URL string, a list of URL
+# strings, or dicts with a "url" key
+_MEDIA_KEYS = ("image", "image_url", "images", "media", "photos")
+_IMAGE_URL_RE = re.compile(r"https?://\S+?\.(?:jpe?g|png|gif|webp)(?:\?\S*)?", re.IGNORECASE)
+
+# "1. caption", "2) caption", ...
+_NUMBERED_RE = re.compile(r"^\s*(\d+)\s*[.):-]\s*(.+?)\s*$")
+
+async def _vision_call(content: List[Dict], max_tokens: int) -> str:
+    """POST one vision request and return the raw reply text."""
+    async with aiohttp.ClientSession() as s:
+        r = await s.post(
+            DEEPSEEK_VISION_URL,
+            headers={
+                "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": VISION_MODEL,
+                "messages": [{"role": "user", "content": content}],
+                "max_tokens": max_tokens,
+            },
+            timeout=45,
+        )
+        js = await r.json()
+        return js["choices"][0]["message"]["content"]
 
 async def describe_image(url: str) -> str:
     """
@@ -7,30 +51,148 @@ async def describe_image(url: str) -> str:
     """
     if not (DEEPSEEK_API_KEY and url.startswith(("http://", "https://"))):
         return ""
-    payload = {
-        "model": VISION_MODEL,
-        "messages": [{
-            "role": "user",
-            "content": [
-                {"type": "text",
-                 "text": "Describe this image in one concise sentence."},
-                {"type": "image_url", "image_url": {"url": url}},
-            ],
-        }],
-        "max_tokens": 60,
-    }
     try:
-        async with aiohttp.ClientSession() as s:
-            r = await s.post(
-                DEEPSEEK_VISION_URL,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json=payload, timeout=45
-            )
-            js = await r.json()
-            return (js["choices"][0]["message"]["content"]
-                      .strip().replace("\n", " "))[:200]
+        text = await _vision_call([
+            {"type": "text",
+             "text": "Describe this image in one concise sentence."},
+            {"type": "image_url", "image_url": {"url": url}},
+        ], 60)
+        return text.strip().replace("\n", " ")[:200]
     except Exception:
         return ""
+
+def parse_numbered_captions(text: str, count: int) -> Optional[List[str]]:
+    """
+    Parse "1. ..." lines into exactly `count` captions in order; None if
+    any number is missing, duplicated or out of range.
+    """
+    captions: Dict[int, str] = {}
+    for line in text.splitlines():
+        m = _NUMBERED_RE.match(line)
+        if not m:
+            continue
+        n = int(m.group(1))
+        if not 1 <= n <= count or n in captions:
+            return None
+        captions[n] = m.group(2)[:200]
+    if len(captions) != count:
+        return None
+    return [captions[n] for n in range(1, count + 1)]
+
+async def _describe_batch(urls: List[str]) -> List[str]:
+    """Caption several images in one vision call, or per image if that fails."""
+    if len(urls) == 1:
+        return [await describe_image(urls[0])]
+    try:
+        text = await _vision_call(
+            [{"type": "text",
+              "text": (f"Describe each of these {len(urls)} images in one concise "
+                       "sentence. Answer ONLY with a numbered list, one line per "
+                       "image, in the order given.")}]
+            + [{"type": "image_url", "image_url": {"url": url}} for url in urls],
+            60 * len(urls),
+        )
+        captions = parse_numbered_captions(text, len(urls))
+    except Exception as e:
+        logger.warning(f"Batch vision call failed: {e}")
+        captions = None
+    if captions is not None:
+        metrics.incr("vision_batch_calls")
+        return captions
+    metrics.incr("vision_batch_fallbacks")
+    logger.debug("Malformed batch caption response → captioning per image")
+    return list(await asyncio.gather(*(describe_image(url) for url in urls)))
+
+async def describe_images(urls: List[str], batch_size: int = VISION_BATCH_SIZE) -> List[str]:
+    """
+    One caption per URL ("" where captioning failed), packing up to
+    `batch_size` images into each vision request; batches run concurrently.
+    """
+    urls = [u for u in urls if u.startswith(("http://", "https://"))] if DEEPSEEK_API_KEY else []
+    if not urls:
+        return []
+    batches = [urls[i:i + max(1, batch_size)] for i in range(0, len(urls), max(1, batch_size))]
+    results = await asyncio.gather(*(_describe_batch(b) for b in batches))
+    return [caption for batch in results for caption in batch]
+
+def _urls_in(post: Dict) -> List[str]:
+    urls = []
+    for key in _MEDIA_KEYS:
+        value = post.get(key)
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            url = item.get("url") if isinstance(item, dict) else item
+            if isinstance(url, str) and url.startswith(("http://", "https://")):
+                urls.append(url)
+    urls.extend(_IMAGE_URL_RE.findall(post.get("text") or ""))
+    return urls
+
+def find_image_urls(p: Dict, limit: int = VISION_MAX_IMAGES) -> List[Tuple[str, str]]:
+    """
+    (where, url) pairs for images attached to or linked from the target,
+    the original post and the history, in that order of relevance.
+    """
+    posts = [("target reply", p.get("target") or {}),
+             ("original post", p.get("original") or {})]
+    posts += [(f"reply by @{h.get('username', 'unknown')}", h)
+              for h in p.get("history") or [] if isinstance(h, dict)]
+    found, seen = [], set()
+    for where, post in posts:
+        for url in _urls_in(post):
+            if url not in seen:
+                seen.add(url)
+                found.append((where, url))
+                if len(found) >= limit:
+                    return found
+    return found
+
+def start_captioning(images: List[Tuple[str, str]],
+                     batch_size: int = VISION_BATCH_SIZE) -> List[Tuple[List[str], asyncio.Task]]:
+    """
+    Kick off caption requests, packing up to `batch_size` images per call and
+    capping each call at the per-image timeout, so they run while the caller
+    builds the prompt.
+    """
+    size = max(1, batch_size)
+    started = []
+    for i in range(0, len(images), size):
+        chunk = images[i:i + size]
+        task = asyncio.ensure_future(asyncio.wait_for(
+            describe_images([url for _, url in chunk], size),
+            VISION_IMAGE_TIMEOUT_SECONDS,
+        ))
+        started.append(([where for where, _ in chunk], task))
+    return started
+
+def cancel_captioning(pending: List[Tuple[List[str], asyncio.Task]]) -> None:
+    """Stop caption tasks nobody will collect, and retrieve failed ones so they are not logged."""
+    for _, task in pending:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
+async def collect_captions(pending: List[Tuple[List[str], asyncio.Task]], started: float,
+                           budget: float = VISION_TOTAL_BUDGET_SECONDS) -> List[Tuple[str, str]]:
+    """
+    Wait for the caption tasks until the total budget (counted from `started`)
+    runs out. Late or failed captions are dropped, never waited for.
+    """
+    if not pending:
+        return []
+    remaining = max(0.0, budget - (time.monotonic() - started))
+    done, late = await asyncio.wait([t for _, t in pending], timeout=remaining)
+    for task in late:
+        task.cancel()
+
+    captions, requested = [], 0
+    for wheres, task in pending:
+        requested += len(wheres)
+        if task in done and not task.cancelled() and task.exception() is None:
+            captions.extend((w, c) for w, c in zip(wheres, task.result()) if c)
+    elapsed = time.monotonic() - started
+    metrics.observe("vision_seconds", elapsed)
+    metrics.incr("vision_captions_used", len(captions))
+    metrics.incr("vision_captions_skipped", requested - len(captions))
+    logger.debug(f"Captioned {len(captions)}/{requested} images in {elapsed:.2f}s")
+    return captions
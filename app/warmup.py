@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+from urllib.parse import urlparse
+
+from app.config import DEEPSEEK_CHAT_URL, WARMUP_RETRY_SECONDS, WARMUP_TIMEOUT_SECONDS
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_HOST = urlparse(DEEPSEEK_CHAT_URL).hostname
+
+class Readiness:
+    """
+    Warmup state of this process. It turns ready once every required check
+    has passed; optional checks (DNS, admission stats) are only reported.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.checks: Dict[str, str] = {}
+
+    def snapshot(self) -> Dict:
+        return {"status": "ready" if self.ready else "warming", "checks": dict(self.checks)}
+
+readiness = Readiness()
+
+def warm_text_pipeline() -> None:
+    """Run the prompt builder and reply cleaner once so their lazy setup is done."""
+    from app.services.prompt import build_prompt
+    from app.services.reply import clean_reply
+    build_prompt({"original": {"text": "Warming up"}, "target": {"text": "Warming up"}})
+    clean_reply("Warming up the reply cleaner 🔥")
+
+async def warm_text_pipeline_async() -> None:
+    warm_text_pipeline()
+
+async def resolve_upstream() -> None:
+    """Resolve the upstream host so the first chat call skips a cold DNS lookup."""
+    await asyncio.get_running_loop().getaddrinfo(UPSTREAM_HOST, 443, type=socket.SOCK_STREAM)
+
+async def _attempt(fn: Callable[[], Awaitable], timeout: float) -> str:
+    try:
+        await asyncio.wait_for(fn(), timeout)
+        return "ok"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+
+async def run_checks(checks: Dict[str, Tuple[Callable[[], Awaitable], bool]],
+                     state: Readiness = readiness,
+                     timeout: float = WARMUP_TIMEOUT_SECONDS,
+                     retry_seconds: float = WARMUP_RETRY_SECONDS) -> None:
+    """
+    Run `checks` ({name: (async fn, required)}) concurrently, retrying the
+    failed required ones until they pass, then mark `state` ready.
+    """
+    started = time.monotonic()
+    pending = dict(checks)
+    while True:
+        names = list(pending)
+        results = await asyncio.gather(*(_attempt(pending[n][0], timeout) for n in names))
+        for name, result in zip(names, results):
+            state.checks[name] = result
+            if result == "ok" or not pending[name][1]:
+                del pending[name]
+            else:
+                logger.warning(f"Warmup check {name} failed: {result}")
+        if not pending:
+            break
+        await asyncio.sleep(retry_seconds)
+    state.ready = True
+    elapsed = time.monotonic() - started
+    metrics.observe("warmup_seconds", elapsed)
+    logger.info(f"Warmup finished in {elapsed:.2f}s: {state.checks}")
+
+def warm_up_worker(timeout: float = WARMUP_TIMEOUT_SECONDS) -> None:
+    """
+    Warm a freshly forked Celery worker process: text pipeline, DNS and the
+    Redis connections for results and the reply pool. Runs in a thread joined
+    for at most `timeout`, since worker_process_init itself is time-limited.
+    """
+    from app.results import result_store
+    from app.services.pool import reply_pool
+
+    checks = {
+        "text_pipeline": warm_text_pipeline,
+        "dns": lambda: socket.getaddrinfo(UPSTREAM_HOST, 443, type=socket.SOCK_STREAM),
+        "result_store": result_store.ping,
+        "reply_pool": lambda: reply_pool.store.size("general"),
+    }
+
+    def work():
+        started = time.monotonic()
+        for name, fn in checks.items():
+            try:
+                fn()
+            except Exception as e:
+                logger.warning(f"Worker warmup check {name} failed: {e}")
+        logger.info(f"Worker warmup finished in {time.monotonic() - started:.2f}s")
+
+    thread = threading.Thread(target=work, name="warmup", daemon=True)
+    thread.start()
+    thread.join(timeout)
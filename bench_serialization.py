@@ -0,0 +1,82 @@
+"""
+Benchmark wire formats: Celery task messages (json vs msgpack) and API
+response encoding (stdlib json vs orjson).
+
+    python bench_serialization.py [-n 20000]
+"""
+import argparse
+import json
+import time
+
+from kombu.serialization import dumps, loads, prepare_accept_content
+
+# A typical generate_reply payload: thread, target and three history replies
+PAYLOAD = {
+    "original": {
+        "username": "urban_explorer22",
+        "text": "Caught the city skyline from the rooftop lounge tonight—could use "
+                "a partner in crime for the next late-night adventure 😏",
+    },
+    "target": {
+        "username": "city_siren",
+        "text": "Count me in! I know a hidden speakeasy with your name on it 🥂 #RooftopRomance",
+    },
+    "history": [
+        {"username": f"user{i}", "text": "That view is unreal, where is this?? 🌆"}
+        for i in range(3)
+    ],
+    "postId": "system-generated",
+}
+
+# Celery protocol v2 message body: (args, kwargs, embed)
+TASK_BODY = ((PAYLOAD,), {"store_result": True},
+             {"callbacks": None, "errbacks": None, "chain": None, "chord": None})
+
+ACCEPT = prepare_accept_content(["json", "msgpack"])
+
+RESPONSE = {"status": "done", "reply": "Lead the way—I'm always up for secret hideouts! 🥂"}
+
+def timed(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+def bench_task_messages(n):
+    print("Celery task message (serialize + deserialize):")
+    baseline = None
+    for name in ("json", "msgpack"):
+        try:
+            content_type, encoding, data = dumps(TASK_BODY, serializer=name)
+        except Exception as e:
+            print(f"  {name:8s} unavailable ({e})")
+            continue
+
+        def round_trip():
+            _, _, body = dumps(TASK_BODY, serializer=name)
+            loads(body, content_type, encoding, accept=ACCEPT)
+
+        us = timed(round_trip, n)
+        size = len(data)
+        baseline = baseline or (size, us)
+        print(f"  {name:8s} {size:5d} bytes ({size / baseline[0]:.0%})  "
+              f"{us:7.2f} µs/task ({us / baseline[1]:.0%})")
+
+def bench_responses(n):
+    print("API response encoding:")
+    us_json = timed(lambda: json.dumps(RESPONSE, ensure_ascii=False).encode("utf-8"), n)
+    print(f"  json     {us_json:7.2f} µs/response")
+    try:
+        import orjson
+    except ImportError:
+        print("  orjson   unavailable")
+        return
+    us_orjson = timed(lambda: orjson.dumps(RESPONSE), n)
+    print(f"  orjson   {us_orjson:7.2f} µs/response ({us_orjson / us_json:.0%})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark wire formats")
+    parser.add_argument("-n", type=int, default=20000, help="Iterations per case")
+    args = parser.parse_args()
+    bench_task_messages(args.n)
+    bench_responses(args.n)
@@ -1,6 +1,15 @@
 import os
 from dotenv import load_dotenv
 from celery import Celery
+from kombu import Exchange, Queue
+
+from app.config import (
+    CELERY_SERIALIZER,
+    DEFAULT_LANE,
+    REPLY_LANES,
+    REPLY_POOL_REFILL_SECONDS,
+    RESULT_TTL_SECONDS,
+)
 
 # Load your .env (must contain CELERY_BROKER_URL and CELERY_RESULT_BACKEND)
 load_dotenv()
@@ -14,6 +23,14 @@ REDIS_DB = os.getenv("REDIS_DB", "0")
 broker_url = os.getenv("CELERY_BROKER_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
 backend_url = os.getenv("CELERY_RESULT_BACKEND", broker_url)
 
+# Compact binary messages when enabled and msgpack is installed, JSON otherwise
+serializer = CELERY_SERIALIZER
+if serializer == "msgpack":
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        serializer = "json"
+
 # This is the Celery "app" instance
 celery_app = Celery(
     "reply_bot",
@@ -25,14 +42,36 @@ celery_app = Celery(
 celery_app.conf.update(
     task_soft_time_limit=60,
     task_time_limit=120,
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    task_serializer=serializer,
+    accept_content=["msgpack", "json"],
+    result_serializer=serializer,
+    result_accept_content=["msgpack", "json"],
+    # Replies are kept in app.results; nothing else needs Celery's backend
+    task_ignore_result=True,
+    result_expires=RESULT_TTL_SECONDS,
     timezone="UTC",
     enable_utc=True,
     worker_prefetch_multiplier=1,  # Prevents worker from taking too many tasks
     task_acks_late=True,  # Tasks are acknowledged after execution
     task_reject_on_worker_lost=True,  # Requeue tasks if worker dies
+    # One queue per priority lane; the API picks the lane per request
+    task_queues=[Queue(lane, Exchange(lane), routing_key=lane) for lane in REPLY_LANES],
+    task_default_queue=DEFAULT_LANE,
+    task_routes={"refill_reply_pool": {"queue": "bulk"}},
+    # A worker consuming several lanes alternates between them instead of
+    # draining the first queue before looking at the next
+    broker_transport_options={"queue_order_strategy": "round_robin"},
+    # Used with `worker --autoscale=MAX,MIN`: sizes pools from queue depth,
+    # task latency and upstream 429s instead of the reserved-task count
+    worker_autoscaler="app.autoscaler:ReplyAutoscaler",
+    # Periodic reply-pool top-up; needs `celery -A celery_app beat`
+    beat_schedule={
+        "refill-reply-pool": {
+            "task": "refill_reply_pool",
+            "schedule": float(REPLY_POOL_REFILL_SECONDS),
+            "kwargs": {"scheduled": True},
+        },
+    },
 )
 
 # Windows-specific settings
@@ -0,0 +1,305 @@
+"""
+Query chat_logs.jsonl (written by the root main.py) through a sidecar index.
+
+    python chat_logs.py get <request_id>
+    python chat_logs.py range --since "2024-05-01 10:00" [--until "2024-05-01 11:00"]
+    python chat_logs.py count [--bucket minute|hour|day] [--since ...] [--until ...]
+    python chat_logs.py index [--watch 2]
+
+The index (<log>.idx) holds one fixed-size record per log line: request id
+hash, byte offset and length, and the timestamp as a sortable integer
+(YYYYMMDDHHMMSS). Every command first indexes only the bytes appended since
+the last run, then answers from the index and reads matching lines straight
+out of the memory-mapped log, so the log is never rescanned. A log that was
+truncated or replaced is reindexed from the start.
+"""
+import argparse
+import bisect
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOG_FILE = "chat_logs.jsonl"
+
+# magic, log inode, bytes of the log indexed, records, timestamps sorted
+_HEADER = struct.Struct("<8sQQQ?")
+_MAGIC = b"CHATIDX1"
+# request id hash first, so lookups can mmap.find() it at record boundaries
+_RECORD = struct.Struct("<8sQQI")
+BUCKETS = {"minute": 100, "hour": 10000, "day": 1000000}
+
+def _lock(f) -> None:
+    """Exclusive lock on an open file: flock, or a one-byte msvcrt lock on Windows."""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    pos = f.tell()
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # retries for ~10s itself
+            break
+        except OSError:
+            pass
+    f.seek(pos)
+
+def _unlock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    pos = f.tell()
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.seek(pos)
+
+def id_hash(request_id: str) -> bytes:
+    return hashlib.blake2b(str(request_id).encode(), digest_size=8).digest()
+
+def ts_key(timestamp: str) -> int:
+    """"2024-05-01 10:00:05" (or any prefix of it) -> 20240501100005."""
+    digits = "".join(ch for ch in timestamp if ch.isdigit())[:14]
+    return int(digits.ljust(14, "0")) if digits else 0
+
+def format_key(key: int, bucket: str = "second") -> str:
+    s = str(key).rjust(14, "0")
+    text = f"{s[0:4]}-{s[4:6]}-{s[6:8]} {s[8:10]}:{s[10:12]}:{s[12:14]}"
+    return {"minute": text[:16], "hour": text[:13], "day": text[:10]}.get(bucket, text)
+
+class ChatLogIndex:
+    """Sidecar offset index over an append-only JSONL chat log."""
+
+    def __init__(self, log_path: str = LOG_FILE, index_path: Optional[str] = None):
+        self.log_path = log_path
+        self.index_path = index_path or f"{log_path}.idx"
+        self.count = 0
+        self.sorted = True
+        self._mm: Optional[mmap.mmap] = None
+        self._end = _HEADER.size
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __enter__(self) -> "ChatLogIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def refresh(self) -> int:
+        """Index lines appended since the last refresh; returns how many were added."""
+        fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+b") as idx:
+            _lock(idx)  # one writer at a time
+            self.close()  # Windows cannot truncate a file that is still mapped
+            st = os.stat(self.log_path)
+            header = idx.read(_HEADER.size)
+            if len(header) == _HEADER.size:
+                magic, inode, covered, count, is_sorted = _HEADER.unpack(header)
+            else:
+                magic, inode, covered, count, is_sorted = _MAGIC, st.st_ino, 0, 0, True
+            if magic != _MAGIC or inode != st.st_ino or covered > st.st_size:
+                inode, covered, count, is_sorted = st.st_ino, 0, 0, True  # new log
+            # Records past the header count were written by an interrupted refresh
+            idx.truncate(_HEADER.size + count * _RECORD.size)
+            last_ts = self._last_ts(idx, count)
+
+            added = []
+            if st.st_size > covered:
+                with open(self.log_path, "rb") as log, \
+                        mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    end = mm.rfind(b"\n", covered) + 1  # complete lines only
+                    pos = covered
+                    while pos < end:
+                        nl = mm.find(b"\n", pos, end) + 1
+                        entry = _parse(mm[pos:nl])
+                        if entry is not None:
+                            ts = ts_key(entry.get("timestamp", ""))
+                            is_sorted = is_sorted and ts >= last_ts
+                            last_ts = ts
+                            added.append(_RECORD.pack(id_hash(entry.get("request_id", "")),
+                                                      pos, ts, nl - pos))
+                        pos = nl
+                    covered = max(covered, end)
+            idx.seek(_HEADER.size + count * _RECORD.size)
+            idx.write(b"".join(added))
+            idx.flush()
+            os.fsync(idx.fileno())
+            count += len(added)
+            idx.seek(0)
+            idx.write(_HEADER.pack(_MAGIC, inode, covered, count, is_sorted))
+            idx.flush()
+            self._mm = mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ)
+            # The mmap holds a dup of this descriptor, so unlock explicitly
+            _unlock(idx)
+        self.count, self.sorted = count, is_sorted
+        self._end = _HEADER.size + count * _RECORD.size
+        return len(added)
+
+    @staticmethod
+    def _last_ts(idx, count: int) -> int:
+        if not count:
+            return 0
+        idx.seek(_HEADER.size + (count - 1) * _RECORD.size)
+        return _RECORD.unpack(idx.read(_RECORD.size))[2]
+
+    def _record(self, i: int) -> Tuple[bytes, int, int, int]:
+        return _RECORD.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)
+
+    def _find_ids(self, request_id: str) -> Iterator[int]:
+        """Record numbers whose id hash matches, via a C-level byte search."""
+        needle, pos = id_hash(request_id), _HEADER.size
+        while True:
+            pos = self._mm.find(needle, pos, self._end)
+            if pos < 0:
+                return
+            i, misaligned = divmod(pos - _HEADER.size, _RECORD.size)
+            if not misaligned:
+                yield i
+            pos += 1
+
+    def _range(self, since: int, until: int) -> Iterator[Tuple[int, int, int]]:
+        """(offset, length, ts) of records with since <= ts <= until."""
+        lo, hi = 0, self.count
+        if self.sorted:
+            column = _Column(self)
+            lo = bisect.bisect_left(column, since)
+            hi = bisect.bisect_right(column, until, lo)
+        chunk = self._mm[_HEADER.size + lo * _RECORD.size:_HEADER.size + hi * _RECORD.size]
+        for _, offset, ts, length in _RECORD.iter_unpack(chunk):
+            if since <= ts <= until:
+                yield offset, length, ts
+
+    def _read(self, spans: List[Tuple[int, int]]) -> List[Dict]:
+        if not spans:
+            return []
+        with open(self.log_path, "rb") as log, \
+                mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [e for e in (_parse(mm[o:o + n]) for o, n in spans) if e is not None]
+
+    def get(self, request_id: str) -> List[Dict]:
+        """Every entry logged for `request_id`, in log order."""
+        spans = []
+        for i in self._find_ids(request_id):
+            _, offset, _, length = self._record(i)
+            spans.append((offset, length))
+        # A hash collision would surface a different id: drop it
+        return [e for e in self._read(spans) if str(e.get("request_id")) == str(request_id)]
+
+    def range(self, since: str = "", until: str = "") -> List[Dict]:
+        """Entries with timestamps between `since` and `until` (inclusive prefixes)."""
+        lo, hi = _bounds(since, until)
+        return self._read([(o, n) for o, n, _ in self._range(lo, hi)])
+
+    def counts(self, bucket: str = "minute", since: str = "", until: str = "") -> Dict[int, int]:
+        """Requests per minute/hour/day, from the index alone."""
+        div = BUCKETS[bucket]
+        since_key, until_key = _bounds(since, until)
+        if not self.sorted:
+            counts = Counter(ts // div for _, _, ts in self._range(since_key, until_key))
+            return dict(sorted(counts.items()))
+        # Sorted: one bisect per bucket instead of a pass over every record
+        column, counts = _Column(self), {}
+        i = bisect.bisect_left(column, since_key)
+        end = bisect.bisect_right(column, until_key, i)
+        while i < end:
+            key = column[i] // div
+            j = bisect.bisect_left(column, (key + 1) * div, i, end)
+            counts[key] = j - i
+            i = j
+        return counts
+
+class _Column:
+    """The timestamp column as a sequence, for bisect."""
+
+    def __init__(self, index: ChatLogIndex):
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.index.count
+
+    def __getitem__(self, i: int) -> int:
+        return self.index._record(i)[2]
+
+def _parse(line: bytes) -> Optional[Dict]:
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+def _bounds(since: str, until: str) -> Tuple[int, int]:
+    """Inclusive ts keys; a partial `until` like "2024-05-01 10" covers that whole hour."""
+    hi = 99999999999999
+    if until:
+        digits = "".join(ch for ch in until if ch.isdigit())[:14]
+        hi = int(digits.ljust(14, "9"))
+    return (ts_key(since) if since else 0), hi
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Query chat_logs.jsonl through a sidecar index")
+    parser.add_argument("-f", "--file", default=LOG_FILE, help="Chat log path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    get = sub.add_parser("get", help="Entries for one request id")
+    get.add_argument("request_id")
+    for name, help_text in (("range", "Entries within a time range"),
+                            ("count", "Requests per time bucket, as CSV")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("--since", default="", help='e.g. "2024-05-01 10:00"')
+        cmd.add_argument("--until", default="", help="inclusive; prefixes cover the whole unit")
+        if name == "count":
+            cmd.add_argument("--bucket", choices=list(BUCKETS), default="minute")
+    index_cmd = sub.add_parser("index", help="Bring the index up to date")
+    index_cmd.add_argument("--watch", type=float, metavar="SECONDS",
+                           help="Keep indexing new lines at this interval")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.file):
+        sys.exit(f"Chat log not found: {args.file}")
+    index = ChatLogIndex(args.file)
+    try:
+        added = index.refresh()
+        if args.command == "index":
+            print(f"{index.count} entries indexed ({added} new)", file=sys.stderr)
+            while args.watch:
+                time.sleep(args.watch)
+                added = index.refresh()
+                if added:
+                    print(f"{index.count} entries indexed ({added} new)", file=sys.stderr)
+        elif args.command == "get":
+            entries = index.get(args.request_id)
+            if not entries:
+                sys.exit(f"No entries for request id {args.request_id}")
+            for entry in entries:
+                print(json.dumps(entry, ensure_ascii=False))
+        elif args.command == "range":
+            for entry in index.range(args.since, args.until):
+                print(json.dumps(entry, ensure_ascii=False))
+        else:
+            writer = csv.writer(sys.stdout)
+            writer.writerow([args.bucket, "requests"])
+            for key, n in index.counts(args.bucket, args.since, args.until).items():
+                writer.writerow([format_key(key * BUCKETS[args.bucket], args.bucket), n])
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        sys.stderr.close()
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for the API:
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master (preload_app) and workers are forked
+from it, so modules, compiled regexes and config are shared copy-on-write
+instead of being imported again per worker. No connections or process pools
+are opened at import time; each worker warms its own after the fork (see app.warmup) and
+reports ready on /readyz once done.
+"""
+import gc
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+def when_ready(server):
+    # Move everything the preloaded app allocated into the permanent
+    # generation: the cyclic GC then never touches (and so never copies)
+    # those pages in the forked workers.
+    gc.freeze()
@@ -0,0 +1,61 @@
+"""
+Import-time report for the API and worker entry points, to keep cold starts
+in check (python -X importtime under the hood).
+
+    python profile_imports.py [--module app.main] [--top 15] [--max-ms 1500]
+
+Exits non-zero when the total import time exceeds --max-ms, so it can run
+as a CI guard.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# "import time: self [us] | cumulative | imported package"
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_times(module):
+    """[(module, self_us, cumulative_us, depth)] for one fresh interpreter."""
+    env = dict(os.environ)
+    env.setdefault("DEEPSEEK_API_KEY", "import-profile")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+def report(module, top):
+    rows = import_times(module)
+    total_ms = sum(r[1] for r in rows) / 1000
+    print(f"{module}: {total_ms:.0f} ms total across {len(rows)} modules")
+    print(f"  {'cumulative':>10s} {'self':>8s}  module")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f}ms {self_us / 1000:6.1f}ms  {name}")
+    return total_ms
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile import time of the entry points")
+    parser.add_argument("--module", action="append",
+                        help="Module to import (default: app.main and celery_app)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if any module's total import time exceeds this")
+    args = parser.parse_args()
+    failed = False
+    for module in args.module or ["app.main", "celery_app"]:
+        total_ms = report(module, args.top)
+        if args.max_ms is not None and total_ms > args.max_ms:
+            print(f"  ✗ over budget ({args.max_ms:.0f} ms)")
+            failed = True
+        print()
+    sys.exit(1 if failed else 0)
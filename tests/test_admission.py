@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from app.admission import AdmissionController, QueueStats, estimate_wait
+
+def controller(depth, avg, fetches):
+    ctl = AdmissionController(["celery"], slo_seconds=10, concurrency=2, cache_seconds=60)
+
+    async def fake_fetch():
+        fetches.append(1)
+        return QueueStats(depth, avg, time.monotonic())
+
+    ctl._fetch = fake_fetch
+    return ctl
+
+def test_estimate_wait():
+    assert estimate_wait(10, 3.0, 2) == 15.0
+    assert estimate_wait(10, 3.0, 0) == 30.0
+
+@pytest.mark.asyncio
+async def test_admits_under_slo_and_caches_stats():
+    fetches = []
+    ctl = controller(depth=4, avg=2.0, fetches=fetches)
+    for _ in range(5):
+        assert (await ctl.check()).admit
+    assert len(fetches) == 1
+
+@pytest.mark.asyncio
+async def test_sheds_over_slo_with_retry_after():
+    ctl = controller(depth=20, avg=2.0, fetches=[])
+    decision = await ctl.check()
+    assert not decision.admit
+    assert decision.estimated_wait == 20.0
+    assert decision.retry_after == 10
+
+@pytest.mark.asyncio
+async def test_fails_open_when_redis_is_down():
+    ctl = AdmissionController(["celery"], cache_seconds=60)
+
+    async def broken_fetch():
+        raise ConnectionError("redis down")
+
+    ctl._fetch = broken_fetch
+    assert (await ctl.check()).admit
+
+@pytest.mark.asyncio
+async def test_gauges_are_kept_per_lane():
+    from app.metrics import metrics
+    for lane, depth in (("interactive", 3), ("bulk", 40)):
+        async def fetch(depth=depth):
+            return QueueStats(depth, 1.0, time.monotonic())
+        await AdmissionController([lane], fetch=fetch).check()
+    gauges = metrics.snapshot()["gauges"]
+    assert gauges["queue_depth_interactive"] == 3
+    assert gauges["queue_depth_bulk"] == 40
+
+class FakeRedis:
+    """Async pipeline over canned replies, enough for AdmissionController._fetch."""
+
+    def __init__(self, depth, hosts, targets):
+        self.depth, self.hosts, self.targets = depth, hosts, targets
+
+    def pipeline(self, transaction=True):
+        redis, results = self, []
+
+        class Pipeline:
+            def __getattr__(self, command):
+                return lambda *args: results.append(redis.reply(command, args))
+
+            async def execute(self):
+                return results
+        return Pipeline()
+
+    def reply(self, command, args):
+        if command == "llen":
+            return self.depth
+        if command == "zrangebyscore":
+            return self.hosts
+        if command == "lrange":
+            return [b"2.0"]
+        if command == "hget":
+            return self.targets.get(args[0])
+
+@pytest.mark.asyncio
+async def test_uses_the_live_autoscaled_pool_size():
+    ctl = AdmissionController(["interactive"], slo_seconds=10, concurrency=4, max_concurrency=16)
+    ctl._client = FakeRedis(40, [b"a@h", b"b@h"],
+                            {"reply:autoscaler:a@h": b"12", "reply:autoscaler:b@h": b"8"})
+    decision = await ctl.check()
+    assert decision.estimated_wait == 4.0  # 40 tasks × 2s over 20 processes
+
+@pytest.mark.asyncio
+async def test_assumes_the_max_pool_size_without_autoscaler_state():
+    ctl = AdmissionController(["interactive"], slo_seconds=10, concurrency=4, max_concurrency=16)
+    ctl._client = FakeRedis(40, [], {})
+    assert (await ctl.check()).estimated_wait == 5.0
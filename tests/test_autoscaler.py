@@ -0,0 +1,152 @@
+import time
+
+from app.autoscaler import ReplyAutoscaler, ScaleSignals, ScalingPolicy
+
+def signals(depth=0, reserved=0, avg=2.0, throttled=0, workers=1):
+    return ScaleSignals({"interactive": depth}, reserved, avg, throttled, {"interactive": workers})
+
+def policy(**kwargs):
+    options = dict(down_delay=60, throttle_backoff=0.5, throttle_cooldown=30)
+    options.update(kwargs)
+    return ScalingPolicy(2, 16, target_wait=10, **options)
+
+def test_wanted_grows_with_backlog_and_latency():
+    p = policy()
+    assert p.wanted(signals(depth=20, avg=2.0)) == 4
+    # Slower upstream: more calls in flight for the same backlog
+    assert p.wanted(signals(depth=20, avg=4.0)) == 8
+    assert p.wanted(signals(depth=20, avg=2.0, reserved=3)) == 7
+    # The backlog is shared between the autoscaling workers
+    assert p.wanted(signals(depth=20, avg=4.0, workers=2)) == 4
+    assert p.wanted(signals(depth=0)) == 2
+    assert p.wanted(signals(depth=1000)) == 16
+
+def test_each_queue_is_split_among_its_own_consumers():
+    s = ScaleSignals({"interactive": 20, "bulk": 30}, 0, 2.0, 0,
+                     {"interactive": 2, "bulk": 3})
+    assert s.depth == 50
+    assert s.share == 20
+    assert policy().wanted(s) == 4
+
+def test_scales_up_immediately():
+    assert policy().decide(2, signals(depth=30), now=0) == (6, "backlog")
+
+def test_scale_down_waits_then_steps_by_half():
+    p = policy()
+    assert p.decide(12, signals(), now=0) == (12, "hysteresis")
+    assert p.decide(12, signals(), now=59) == (12, "hysteresis")
+    assert p.decide(12, signals(), now=60) == (7, "idle")
+    assert p.decide(7, signals(), now=61) == (7, "hysteresis")
+    assert p.decide(7, signals(), now=120) == (5, "idle")
+
+def test_backlog_resets_the_scale_down_delay():
+    p = policy()
+    p.decide(12, signals(), now=0)
+    assert p.decide(12, signals(depth=60), now=30) == (12, "steady")
+    assert p.decide(12, signals(), now=70) == (12, "hysteresis")
+
+def test_throttling_backs_off_and_blocks_growth_for_the_cooldown():
+    p = policy()
+    assert p.decide(10, signals(depth=100, throttled=3), now=0) == (5, "throttled")
+    assert p.decide(5, signals(depth=100), now=10) == (5, "cooldown")
+    assert p.decide(5, signals(depth=100), now=31) == (16, "backlog")
+    assert p.decide(2, signals(throttled=1), now=40) == (2, "throttled")
+
+def test_one_burst_of_429s_backs_off_once():
+    p = policy()
+    burst = signals(depth=100, throttled=5)
+    procs = 12
+    for now in range(0, 30, 5):  # the burst stays in the window for six decisions
+        procs, _ = p.decide(procs, burst, now)
+    assert procs == 6
+    assert p.decide(procs, burst, now=31) == (3, "throttled")
+
+class FakePool:
+    def __init__(self, processes):
+        self.num_processes = processes
+
+    def grow(self, n):
+        self.num_processes += n
+
+    def shrink(self, n):
+        self.num_processes -= n
+
+class FakeAutoscaler(ReplyAutoscaler):
+    def __init__(self, pool, fake_signals):
+        super().__init__(pool, 16, 2, keepalive=0.001)
+        self.policy = policy()
+        self.fake_signals = fake_signals
+
+    def signals(self):
+        if isinstance(self.fake_signals, Exception):
+            raise self.fake_signals
+        return self.fake_signals
+
+    def _redis(self):
+        raise ConnectionError("no redis in tests")
+
+def test_autoscaler_applies_and_records_decisions():
+    pool = FakePool(2)
+    scaler = FakeAutoscaler(pool, signals(depth=30))
+    assert scaler._maybe_scale()
+    assert pool.num_processes == 6
+    assert scaler.last["action"] == "up" and scaler.last["reason"] == "backlog"
+    assert scaler.info()["last_decision"]["target"] == 6
+
+def test_autoscaler_falls_back_to_reserved_count_without_redis():
+    pool = FakePool(4)
+    scaler = FakeAutoscaler(pool, ConnectionError("down"))
+    scaler._last_scale_up = time.monotonic() - 1
+    scaler._maybe_scale()  # no reserved tasks: stock behaviour shrinks to min
+    assert pool.num_processes == 2
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis, self.results = redis, []
+
+    def __getattr__(self, command):
+        def call(*args):
+            self.results.append(self.redis.reply(command, args))
+        return call
+
+    def execute(self):
+        return self.results
+
+class FakeRedis:
+    """Sorted sets, list lengths and latency samples, enough for signals()."""
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.zsets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def reply(self, command, args):
+        if command == "zadd":
+            self.zsets.setdefault(args[0], set()).update(args[1])
+        elif command == "zcard":
+            return len(self.zsets.get(args[0], ()))
+        elif command == "llen":
+            return self.lengths.get(args[0], 0)
+        elif command == "lrange":
+            return ["2.0"]
+        elif command == "mget":
+            return [None] * len(args[0])
+
+def test_two_lanes_do_not_count_each_others_workers():
+    redis = FakeRedis({"interactive": 12, "bulk": 40})
+
+    def scaler(hostname, queue):
+        s = ReplyAutoscaler(FakePool(2), 16, 2, keepalive=0.001)
+        s.hostname, s._queues, s._client = hostname, [queue], redis
+        return s
+
+    interactive = [scaler(f"interactive{i}@h", "interactive") for i in range(2)]
+    bulk = scaler("bulk@h", "bulk")
+    for s in interactive + [bulk]:
+        s.signals()
+    assert interactive[0].signals().workers == {"interactive": 2}
+    assert interactive[0].signals().share == 6
+    assert bulk.signals().workers == {"bulk": 1}
+    assert bulk.signals().share == 40
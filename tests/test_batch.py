@@ -0,0 +1,93 @@
+import asyncio
+import io
+import json
+import random
+
+import pytest
+
+from app.batch import Checkpoint, RateLimiter, UpstreamUnavailable, run_batch
+from app.services.reply import NoReply
+
+def thread(i):
+    return {"postId": f"p{i}", "original": {"username": "op", "text": f"post {i}"},
+            "target": {"username": "tg", "text": f"reply {i}"}}
+
+def write_input(path, n):
+    lines = [json.dumps(thread(i)) for i in range(n)]
+    lines.insert(3, "")                 # blank lines are skipped
+    lines.insert(5, '{"postId": 1}')    # invalid requests become error records
+    path.write_text("\n".join(lines) + "\n")
+
+def fake_reply(calls):
+    async def reply(payload):
+        calls.append(payload["postId"])
+        await asyncio.sleep(random.random() / 1000)  # finish out of order
+        return f"re {payload['target']['text']}"
+    return reply
+
+def run(tmp_path, calls, **kwargs):
+    return asyncio.run(run_batch(str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"),
+                                 concurrency=4, rate=0, reply_fn=fake_reply(calls),
+                                 out=io.StringIO(), **kwargs))
+
+def test_results_are_written_in_input_order(tmp_path):
+    write_input(tmp_path / "in.jsonl", 20)
+    calls = []
+    state = run(tmp_path, calls)
+    records = [json.loads(l) for l in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert [r["line"] for r in records] == [l for l in range(1, 23) if l != 4]
+    assert records[4]["line"] == 6 and "error" in records[4]
+    assert [r["reply"] for r in records if "reply" in r] == [f"re reply {i}" for i in range(20)]
+    assert (state.lines, state.ok, state.failed) == (22, 20, 1)
+
+def test_interrupted_run_resumes_without_redoing_work(tmp_path):
+    write_input(tmp_path / "in.jsonl", 20)
+    first, second = [], []
+    state = run(tmp_path, first, limit=10)
+    assert state.lines == 10
+    saved = Checkpoint.load(str(tmp_path / "out.jsonl.ckpt"))
+    assert saved.output_offset == (tmp_path / "out.jsonl").stat().st_size
+
+    # A partial line written after the checkpoint is discarded on resume
+    with open(tmp_path / "out.jsonl", "a") as f:
+        f.write('{"line": 11, "rep')
+    state = run(tmp_path, second)
+    assert not set(first) & set(second)
+    assert len(first) + len(second) == 20
+    lines = [json.loads(l)["line"] for l in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert lines == [l for l in range(1, 23) if l != 4]
+
+def test_upstream_outage_stops_before_the_line_and_resume_retries_it(tmp_path):
+    write_input(tmp_path / "in.jsonl", 20)
+    calls = []
+    outage = fake_reply(calls)
+
+    async def flaky(payload):
+        if payload["postId"] == "p8":
+            raise NoReply("upstream 503", retryable=True)
+        if payload["postId"] == "p2":
+            raise NoReply("no usable candidate")
+        return await outage(payload)
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(run_batch(str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"),
+                              concurrency=4, rate=0, reply_fn=flaky, out=io.StringIO()))
+    saved = Checkpoint.load(str(tmp_path / "out.jsonl.ckpt"))
+    assert saved.lines == 10  # p8 is line 11: nothing from it onwards is checkpointed
+    assert saved.failed == 2  # the invalid line and p2
+
+    state = run(tmp_path, [])
+    records = [json.loads(l) for l in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert [r["line"] for r in records] == [l for l in range(1, 23) if l != 4]
+    assert records[9] == {"line": 11, "postId": "p8", "reply": "re reply 8"}
+    assert (state.lines, state.ok, state.failed) == (22, 19, 2)
+
+def test_rate_limiter_spaces_acquisitions():
+    async def go():
+        limiter = RateLimiter(rate=200, burst=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(5):
+            await limiter.acquire()
+        return loop.time() - start
+    assert asyncio.run(go()) >= 4 / 200 * 0.9
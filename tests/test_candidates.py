@@ -0,0 +1,27 @@
+from app.services.candidates import candidate_request, parse_candidates, select_best
+
+def test_list_mode_request_and_parse():
+    body = {"messages": [{"role": "system", "content": "s"},
+                         {"role": "user", "content": "u"}], "max_tokens": 100}
+    req = candidate_request(body, 3, "list")
+    assert "3 different replies" in req["messages"][-1]["content"]
+    assert body["messages"][-1]["content"] == "u"
+
+    js = {"choices": [{"message": {"content": '1. "First one 🔥"\n2) Second ✨\n\n- Third'}}]}
+    assert parse_candidates(js, "list") == ["First one 🔥", "Second ✨", "Third"]
+
+def test_n_mode_parses_every_choice():
+    assert candidate_request({"messages": []}, 3, "n")["n"] == 3
+    js = {"choices": [{"message": {"content": "a 🔥"}}, {"message": {"content": "b ✨"}}]}
+    assert parse_candidates(js, "n") == ["a 🔥", "b ✨"]
+
+def test_select_best_prefers_fresh_single_emoji_reply():
+    posted = ["Love this vibe 😍"]
+    candidates = [
+        None,
+        "Love this vibe 😍",
+        "no emoji here at all",
+        "Lead the way, secret hideouts are my thing 🥂",
+    ]
+    assert select_best(candidates, posted) == "Lead the way, secret hideouts are my thing 🥂"
+    assert select_best([None, None]) is None
@@ -0,0 +1,76 @@
+import importlib
+import json
+import sys
+import types
+
+from chat_logs import ChatLogIndex, format_key
+
+def entry(i, ts, rid=None):
+    return {"timestamp": ts, "request_id": rid or str(i), "message": f"m{i}", "response": f"r{i}"}
+
+def append(path, *entries, partial=""):
+    with open(path, "a", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        f.write(partial)
+
+def test_incremental_index_answers_lookups(tmp_path):
+    log = tmp_path / "chat_logs.jsonl"
+    append(log, entry(1, "2024-05-01 10:00:05"), entry(2, "2024-05-01 10:00:40"),
+           entry(3, "2024-05-01 10:01:10"), partial='{"timestamp": "2024-05-01 10:0')
+    with ChatLogIndex(str(log)) as index:
+        assert index.refresh() == 3  # the half-written line waits
+        assert index.get("2")[0]["message"] == "m2"
+        assert index.get("nope") == []
+
+        with open(log, "a") as f:
+            f.write('2:00", "request_id": "4", "message": "m4", "response": "r4"}\n')
+        append(log, entry(5, "2024-05-01 10:02:30", rid="2"))
+        assert index.refresh() == 2
+        assert index.refresh() == 0
+        assert [e["message"] for e in index.get("2")] == ["m2", "m5"]
+        assert [e["message"] for e in index.range("2024-05-01 10:01", "2024-05-01 10:02")] == \
+            ["m3", "m4", "m5"]
+        assert index.counts("minute") == {202405011000: 2, 202405011001: 1, 202405011002: 2}
+        assert index.counts("hour", since="2024-05-01 10:01") == {2024050110: 3}
+
+def test_out_of_order_timestamps_fall_back_to_a_scan(tmp_path):
+    log = tmp_path / "chat_logs.jsonl"
+    append(log, entry(1, "2024-05-01 10:05:00"), entry(2, "2024-05-01 10:01:00"))
+    with ChatLogIndex(str(log)) as index:
+        index.refresh()
+        assert not index.sorted
+        assert [e["message"] for e in index.range(until="2024-05-01 10:02")] == ["m2"]
+        assert index.counts("minute") == {202405011001: 1, 202405011005: 1}
+
+def test_replaced_log_is_reindexed(tmp_path):
+    log = tmp_path / "chat_logs.jsonl"
+    append(log, entry(1, "2024-05-01 10:00:00"), entry(2, "2024-05-01 10:00:01"))
+    with ChatLogIndex(str(log)) as index:
+        index.refresh()
+    log.write_text(json.dumps(entry(9, "2024-05-02 00:00:00")) + "\n")
+    with ChatLogIndex(str(log)) as index:
+        index.refresh()
+        assert index.count == 1 and index.get("9") and not index.get("1")
+
+def test_format_key():
+    assert format_key(20240501100005) == "2024-05-01 10:00:05"
+    assert format_key(202405011000 * 100, "minute") == "2024-05-01 10:00"
+
+def test_locks_with_msvcrt_without_fcntl(tmp_path, monkeypatch):
+    calls = []
+    msvcrt = types.SimpleNamespace(LK_LOCK=1, LK_UNLCK=0,
+                                   locking=lambda fd, mode, n: calls.append(mode))
+    monkeypatch.setitem(sys.modules, "fcntl", None)  # as on Windows
+    monkeypatch.setitem(sys.modules, "msvcrt", msvcrt)
+    monkeypatch.delitem(sys.modules, "chat_logs")
+    windows = importlib.import_module("chat_logs")
+    monkeypatch.delitem(sys.modules, "chat_logs")  # later imports get the real one
+
+    log = tmp_path / "chat_logs.jsonl"
+    append(log, entry(1, "2024-05-01 10:00:05"))
+    with windows.ChatLogIndex(str(log)) as index:
+        assert index.refresh() == 1
+        assert index.refresh() == 0
+        assert index.get("1")[0]["message"] == "m1"
+    assert calls == [1, 0, 1, 0]
@@ -0,0 +1,36 @@
+from app.services.candidates import select_best
+from app.services.dedup import NearDuplicateIndex, choose_bands, shingles
+
+def test_shingles_ignore_emoji_and_case():
+    assert shingles("Love this view 😍") == shingles("love this VIEW 🔥!")
+
+def test_choose_bands_splits_all_permutations():
+    bands, rows = choose_bands(32, 0.6)
+    assert bands * rows == 32
+    assert (1 / bands) ** (1 / rows) < 0.6
+
+def test_finds_near_duplicates_only():
+    index = NearDuplicateIndex(threshold=0.6, capacity=100)
+    index.add("Count me in, that rooftop view is unreal 😍")
+    match = index.query("count me in that rooftop view is unreal 🔥")
+    assert match == ("Count me in, that rooftop view is unreal 😍", 1.0)
+    assert "Count me in, that rooftop view is totally unreal ✨" in index
+    assert "Gym goals, that deadlift form is clean 💪" not in index
+
+def test_window_is_bounded():
+    index = NearDuplicateIndex(capacity=3)
+    replies = [f"reply number {n} about sunsets and coffee" for n in
+               ("one", "two", "three", "four")]
+    for reply in replies:
+        index.add(reply)
+    assert len(index) == 3
+    assert replies[0] not in index._texts.values()
+    assert index.query(replies[-1])[0] == replies[-1]
+    assert all(len(table) <= 3 for table in index._tables)
+
+def test_select_best_skips_near_duplicates():
+    index = NearDuplicateIndex()
+    index.add("Main character energy right here ✨")
+    best = select_best(["main character energy right here 🔥", "Okay this outfit is everything 😍"],
+                       index)
+    assert best == "Okay this outfit is everything 😍"
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from app.services.emoji import (
+    count_emoji,
+    emoji_in,
+    fit_reply,
+    graphemes,
+    is_emoji,
+    truncate_graphemes,
+)
+
+SEQUENCES = ["❤️", "👨‍👩‍👧", "🇯🇵", "1️⃣", "👍🏽", "🏴\U000E0067\U000E0062\U000E0065\U000E006E\U000E0067\U000E007F"]
+
+@pytest.mark.parametrize("emoji", SEQUENCES)
+def test_multi_codepoint_emoji_are_one_cluster(emoji):
+    assert graphemes(f"a{emoji}b") == ["a", emoji, "b"]
+    assert emoji_in(f"so {emoji} good") == [emoji]
+
+def test_accents_and_text_symbols_are_not_emoji():
+    assert count_emoji("Café naïve résumé") == 0
+    assert count_emoji("© 2024 ™") == 0
+    assert count_emoji("©️ 🔥") == 2
+    assert graphemes("é!") == ["é", "!"]
+
+def test_scan_agrees_with_grapheme_classification():
+    text = "Love " + " x ".join(SEQUENCES) + " café ✨"
+    assert emoji_in(text) == [c for c in graphemes(text) if is_emoji(c)]
+
+def test_truncate_never_splits_a_cluster():
+    assert truncate_graphemes("abc 👨‍👩‍👧", 6) == "abc"
+    assert truncate_graphemes("abc ❤️", 6) == "abc ❤️"
+
+def test_fit_reply_keeps_exactly_one_emoji():
+    rng = random.Random(0)
+    assert fit_reply("Café vibes", 80, ["✨"], rng) == "Café vibes ✨"
+    assert fit_reply("So good 🔥🔥 wow 😍", 80, ["✨"], rng) == "So good 🔥 wow"
+
+def test_fit_reply_keeps_the_emoji_when_truncating():
+    reply = fit_reply("word " * 20 + "❤️", 80, ["✨"])
+    assert len(reply) <= 80
+    assert reply.endswith(" word ❤️")
+    assert count_emoji(reply) == 1
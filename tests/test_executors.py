@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.executors import AsyncioExecutor, ExecutorFull, ProcessExecutor, get_executor
+
+async def wait_done(executor, task_id):
+    for _ in range(100):
+        status = await executor.status(task_id)
+        if status["status"] != "pending":
+            return status
+        await asyncio.sleep(0.01)
+    return status
+
+@pytest.mark.asyncio
+async def test_asyncio_executor_runs_and_reads_once(mocker):
+    mocker.patch("app.services.reply.make_reply", return_value="Love this 😍")
+    executor = AsyncioExecutor()
+    try:
+        task_id = await executor.submit({"postId": "1"}, "interactive")
+        assert await wait_done(executor, task_id) == {"status": "done", "reply": "Love this 😍"}
+        assert await executor.status(task_id) == {"status": "pending"}
+    finally:
+        await executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_asyncio_executor_reports_failures_and_skips_unfetched(mocker):
+    mocker.patch("app.services.reply.make_reply", side_effect=RuntimeError("boom"))
+    executor = AsyncioExecutor()
+    try:
+        failed = await executor.submit({}, "bulk")
+        assert await wait_done(executor, failed) == {"status": "failure", "error": "boom"}
+        ignored = await executor.submit({}, "bulk", store_result=False)
+        await asyncio.sleep(0.05)
+        assert ignored not in executor.results._results
+    finally:
+        await executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_asyncio_executor_rejects_when_full(mocker):
+    mocker.patch("app.services.reply.make_reply", side_effect=lambda p: asyncio.sleep(1))
+    executor = AsyncioExecutor(maxsize=1)
+    try:
+        with pytest.raises(ExecutorFull):
+            for _ in range(10):
+                await executor.submit({}, "interactive")
+    finally:
+        await executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_process_pool_is_created_after_fork_on_first_job(mocker):
+    # Built at import time, a preloading gunicorn master would share it with every worker
+    executor = ProcessExecutor()
+    assert executor.pool is None
+    pool = mocker.patch("app.executors.ProcessPoolExecutor").return_value
+    mocker.patch.object(asyncio.get_running_loop(), "run_in_executor",
+                        return_value=asyncio.get_running_loop().create_future())
+    await executor.submit({}, "interactive")
+    assert executor.pool is pool
+    await executor.shutdown()
+    pool.shutdown.assert_called_once()
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_executor("threads")
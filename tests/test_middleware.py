@@ -0,0 +1,58 @@
+import logging
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.logging_config import request_id_var
+from app.middleware import AccessLogMiddleware
+
+def make_client(**kwargs):
+    app = FastAPI()
+    app.add_middleware(AccessLogMiddleware, **kwargs)
+
+    @app.get("/ok")
+    async def ok():
+        return {"request_id": request_id_var.get()}
+
+    @app.get("/missing")
+    async def missing():
+        raise HTTPException(status_code=404)
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return TestClient(app, raise_server_exceptions=False)
+
+def access_lines(caplog):
+    return [r for r in caplog.records if r.name == "app.access"]
+
+def test_request_id_is_propagated_and_echoed(caplog):
+    caplog.set_level(logging.INFO, logger="app.access")
+    client = make_client(sample_rate=1.0)
+    r = client.get("/ok", headers={"X-Request-ID": "abc123"})
+    assert r.json() == {"request_id": "abc123"}
+    assert r.headers["x-request-id"] == "abc123"
+    [line] = access_lines(caplog)
+    assert "method=GET path=/ok status=200" in line.getMessage()
+    assert "request_id=abc123" in line.getMessage()
+
+@pytest.mark.parametrize("path,level", [("/missing", logging.WARNING),
+                                        ("/boom", logging.ERROR)])
+def test_errors_are_always_logged(caplog, path, level):
+    caplog.set_level(logging.INFO, logger="app.access")
+    client = make_client(sample_rate=0.0)
+    client.get("/ok")
+    client.get(path)
+    [line] = access_lines(caplog)
+    assert line.levelno == level
+    assert f"path={path}" in line.getMessage()
+
+def test_slow_requests_bypass_sampling(caplog):
+    caplog.set_level(logging.INFO, logger="app.access")
+    client = make_client(sample_rate=0.0, slow_seconds=0.0)
+    client.get("/ok")
+    [line] = access_lines(caplog)
+    assert line.levelno == logging.WARNING
+    assert line.getMessage().endswith("slow=1")
@@ -0,0 +1,55 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.middleware import BodySizeLimitMiddleware
+from app.models import ReplyRequest
+
+def test_payload_keeps_known_fields_only():
+    request = ReplyRequest.model_validate({
+        "original": {"username": "a", "text": "hi", "followers": 10,
+                     "images": [{"url": "https://x.test/a.jpg", "width": 3}]},
+        "target": {"text": "yo"},
+        "priority": "bulk",
+    })
+    assert request.payload() == {
+        "original": {"username": "a", "text": "hi",
+                     "images": [{"url": "https://x.test/a.jpg"}]},
+        "target": {"username": "unknown", "text": "yo"},
+        "history": [],
+        "postId": "system-generated",
+    }
+
+@pytest.mark.parametrize("body", [
+    {"original": {"text": "x" * 5000}, "target": {}},
+    {"original": {}, "target": {}, "history": [{}] * 51},
+    {"original": {"images": ["https://x.test/a.jpg"] * 11}, "target": {}},
+    {"original": {"text": 5}, "target": {}},
+    {"original": {}},
+])
+def test_rejects_oversized_or_malformed_requests(body):
+    with pytest.raises(ValidationError):
+        ReplyRequest.model_validate(body)
+
+def make_client(max_bytes):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=max_bytes)
+
+    @app.post("/echo")
+    async def echo(request: ReplyRequest):
+        return request.payload()
+
+    return TestClient(app)
+
+def test_body_limit_rejects_by_content_length():
+    client = make_client(100)
+    body = {"original": {"text": "x" * 200}, "target": {}}
+    assert client.post("/echo", json=body).status_code == 413
+    assert client.post("/echo", json={"original": {}, "target": {}}).status_code == 200
+
+def test_body_limit_rejects_streamed_bodies():
+    client = make_client(100)
+    chunks = (b'{"original": {"text": "' + b"x" * 60 + b'"}, ' if i == 0 else b" " * 60
+              for i in range(3))
+    assert client.post("/echo", content=chunks).status_code == 413
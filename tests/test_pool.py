@@ -0,0 +1,26 @@
+from app.services.pool import LocalPoolStore, ReplyPool, classify_topic
+
+def test_classify_topic():
+    assert classify_topic("Just finished a 10K run and feeling amazing!") == "fitness"
+    assert classify_topic("Made the most delicious pasta carbonara tonight!") == "food"
+    assert classify_topic("hello there") == "general"
+
+def test_take_consumes_and_falls_back_to_general():
+    pool = ReplyPool(LocalPoolStore(), low_watermark=0, target_size=5)
+    pool.add("food", ["Chef's kiss 😘"])
+    pool.add("general", ["Love this 😍"])
+
+    assert pool.take("food") == "Chef's kiss 😘"
+    assert pool.take("food") == "Love this 😍"
+    assert pool.take("food") is None
+    assert pool.deficits(["food"]) == {"food": 5}
+
+def test_low_watermark_requests_one_refill():
+    requested = []
+    pool = ReplyPool(LocalPoolStore(), low_watermark=2, target_size=5)
+    pool.on_low_watermark = requested.append
+    pool.add("pets", ["a 🐶", "b 🐱", "c 🐾"])
+
+    pool.take("pets")
+    pool.take("pets")
+    assert requested == ["pets"]
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware import SlowRequestProfilerMiddleware
+from app.profiler import SamplingProfiler
+
+def slow_work(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(100))
+
+def profiler_in(tmp_path, **kwargs):
+    kwargs.setdefault("threshold", 0.1)
+    return SamplingProfiler(str(tmp_path), interval=0.002, window=5, **kwargs)
+
+def test_slow_work_is_captured_as_collapsed_stacks(tmp_path):
+    profiler = profiler_in(tmp_path)
+    profiler.configure(enabled=True)
+    try:
+        assert profiler.finish(profiler.begin(), "task", "fast") is None
+        token = profiler.begin()
+        slow_work(0.2)
+        name = profiler.finish(token, "task", "generate_reply")
+    finally:
+        profiler.configure(enabled=False)
+    assert name.endswith(".folded") and "-task-generate_reply-" in name
+    lines = profiler.read(name).splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 10
+    assert stack.startswith("MainThread;") and "slow_work (test_profiler.py:" in stack
+    assert [c["name"] for c in profiler.captures()] == [name]
+    assert profiler.read("../settings.json") is None
+
+def test_disabled_profiler_does_not_sample(tmp_path):
+    profiler = profiler_in(tmp_path)
+    assert profiler.begin() is None
+    assert not any(t.name == "sampling-profiler" for t in threading.enumerate())
+
+def test_settings_reach_other_processes(tmp_path):
+    writer, other = profiler_in(tmp_path), profiler_in(tmp_path, threshold=9)
+    writer.configure(enabled=True, threshold=0.5, sample_here=False)
+    assert other.begin() is not None
+    assert other.threshold == 0.5
+    other.configure(enabled=False)
+
+def test_only_the_newest_captures_are_kept(tmp_path):
+    profiler = profiler_in(tmp_path, threshold=0.02, keep=2)
+    profiler.configure(enabled=True)
+    try:
+        for i in range(3):
+            token = profiler.begin()
+            slow_work(0.05)
+            profiler.finish(token, "task", f"t{i}")
+            time.sleep(0.01)
+    finally:
+        profiler.configure(enabled=False)
+    assert [c["name"].split("-")[4] for c in profiler.captures()] == ["t2", "t1"]
+
+def test_middleware_profiles_slow_requests(tmp_path):
+    profiler = profiler_in(tmp_path)
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        slow_work(0.2)
+        return {}
+
+    app.add_middleware(SlowRequestProfilerMiddleware, profiler=profiler)
+    profiler.configure(enabled=True)
+    try:
+        TestClient(app).get("/slow")
+    finally:
+        profiler.configure(enabled=False)
+    name = profiler.captures()[0]["name"]
+    assert name.split("-")[3:5] == ["request", "GET_slow"]
+    # The sync endpoint ran in a thread pool worker, which is in the capture too
+    assert "slow_work (test_profiler.py:" in profiler.read(name)
+
+def test_middleware_writes_captures_off_the_event_loop(tmp_path, monkeypatch):
+    profiler = profiler_in(tmp_path)
+    threads = []
+    finish = profiler.finish
+    monkeypatch.setattr(profiler, "finish",
+                        lambda *a: threads.append(threading.get_ident()) or finish(*a))
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        threads.append(threading.get_ident())
+        slow_work(0.2)
+        return {}
+
+    app.add_middleware(SlowRequestProfilerMiddleware, profiler=profiler)
+    profiler.configure(enabled=True)
+    try:
+        TestClient(app).get("/slow")
+    finally:
+        profiler.configure(enabled=False)
+    loop_thread, finish_thread = threads
+    assert finish_thread != loop_thread
+    assert profiler.captures()
@@ -0,0 +1,41 @@
+from app.services.prompt import build_prompt, estimate_tokens, truncate_to_tokens
+
+def test_short_text_is_untouched():
+    text = "Caught the skyline tonight 😏"
+    assert truncate_to_tokens(text, 50) is text
+
+def test_truncation_keeps_head_and_tail():
+    text = "start " + "filler " * 300 + "final question?"
+    short = truncate_to_tokens(text, 30)
+    assert short.startswith("start")
+    assert short.endswith("question?")
+    assert estimate_tokens(short) <= 32
+
+def test_build_prompt_enforces_total_budget():
+    p = {
+        "postId": "1",
+        "original": {"username": "a", "text": "long post " * 400},
+        "target": {"username": "b", "text": "Count me in!"},
+        "history": [{"username": "c", "text": "reply " * 100}] * 5,
+    }
+    built = build_prompt(p, max_tokens=200)
+    assert built.total_tokens <= 200
+    assert "original" in built.truncated
+    assert 'TARGET by @b: "Count me in!"' in built.prompt
+    assert built.prompt.count("@c:") <= 3
+
+def test_system_prompt_is_a_stable_prefix():
+    a = build_prompt({"original": {"username": "a", "text": "x"},
+                      "target": {"username": "b", "text": "y"}})
+    b = build_prompt({"original": {"username": "c", "text": "z"},
+                      "target": {"username": "d", "text": "w"}})
+    assert a.messages()[0] == b.messages()[0]
+    assert a.prompt.endswith("Reply to @b.")
+
+def test_record_cache_usage_reads_deepseek_and_openai_fields():
+    from app.services.reply import record_cache_usage
+    assert record_cache_usage(
+        {"prompt_cache_hit_tokens": 75, "prompt_cache_miss_tokens": 25}) == 0.75
+    assert record_cache_usage(
+        {"prompt_tokens": 100, "prompt_tokens_details": {"cached_tokens": 50}}) == 0.5
+    assert record_cache_usage({"prompt_tokens": 100}) is None
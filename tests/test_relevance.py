@@ -0,0 +1,25 @@
+from app.services.relevance import bm25_scores, select_history, term_counts
+
+def test_term_counts_drop_stopwords():
+    assert term_counts("The speakeasy and THE speakeasy lol") == {"speakeasy": 2}
+
+def test_bm25_only_scores_matching_docs():
+    docs = [term_counts(t) for t in ("great coffee", "rooftop speakeasy", "speakeasy speakeasy")]
+    scores = bm25_scores(["speakeasy"], docs)
+    assert set(scores) == {1, 2}
+    assert scores[2] > scores[1]
+
+def test_relevant_old_reply_beats_recent_chatter():
+    texts = ["that hidden speakeasy downtown is the best"] + [f"nice pic {i}" for i in range(30)]
+    docs = [term_counts(t) for t in texts]
+    picked = select_history("Know any speakeasy around?", docs, [8] * len(texts), k=3, budget=100)
+    assert picked[0] == 0
+    assert picked[1:] == [29, 30]  # the rest are the newest, oldest first
+
+def test_budget_and_k_are_respected():
+    docs = [term_counts(f"reply {i}") for i in range(10)]
+    tokens = [50, 5, 5, 5, 5, 5, 5, 5, 5, 50]
+    picked = select_history("hello", docs, tokens, k=4, budget=20)
+    assert len(picked) == 4 and sum(tokens[i] for i in picked) <= 20
+    assert picked == sorted(picked)
+    assert select_history("hello", [], [], k=4, budget=20) == []
@@ -1,7 +1,9 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, patch
 import aiohttp
-from app.services.reply import make_reply
+from app.services.reply import NoReply, make_reply
 from app.config import FALLBACK_COMMENTS
 
 @pytest.fixture
@@ -26,3 +28,38 @@ async def test_api_error_fallback(mocker, mock_post):
     
     response = await make_reply(mock_post)
     assert response in FALLBACK_COMMENTS
+
+@pytest.mark.asyncio
+async def test_no_fallback_raises_instead(mocker, mock_post):
+    mock_session = AsyncMock()
+    mock_session.post = AsyncMock(side_effect=aiohttp.ClientError())
+    mocker.patch("aiohttp.ClientSession", return_value=mock_session)
+    with pytest.raises(NoReply) as e:
+        await make_reply(mock_post, allow_fallback=False)
+    assert e.value.retryable
+
+    with pytest.raises(NoReply) as e:
+        await make_reply({"postId": "1"}, allow_fallback=False)
+    assert not e.value.retryable
+
+@pytest.mark.asyncio
+async def test_captioning_is_cancelled_when_prompt_building_fails(mocker, mock_post):
+    from app.services import reply, vision
+    started = []
+
+    def start(images):
+        tasks = vision.start_captioning(images)
+        started.extend(task for _, task in tasks)
+        return tasks
+
+    async def slow_describe(urls, size):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(vision, "describe_images", slow_describe)
+    mocker.patch.object(reply, "start_captioning", start)
+    mocker.patch.object(reply, "build_prompt", side_effect=ValueError("bad thread"))
+    mock_post["target"]["image_url"] = "https://x/c.webp"
+
+    assert await make_reply(mock_post) in FALLBACK_COMMENTS
+    await asyncio.sleep(0)
+    assert started and all(task.cancelled() for task in started)
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.results import ResultStore, decode_result, encode_result
+
+def test_round_trip():
+    assert decode_result(encode_result("Love this 😍")) == {"status": "done", "reply": "Love this 😍"}
+    assert decode_result(encode_result(error="boom")) == {"status": "failure", "error": "boom"}
+    assert decode_result(None) == {"status": "pending"}
+
+def test_save_uses_ttl_and_notifies():
+    store = ResultStore(ttl=30)
+    store._sync = MagicMock()
+    pipe = store._sync.pipeline.return_value
+    store.save("abc", "Hi ✨")
+    pipe.set.assert_called_once_with("reply:result:abc", "1:Hi ✨", ex=30)
+    pipe.publish.assert_called_once_with("reply:results", "+abc 1:Hi ✨")
+    pipe.execute.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_fetch_is_read_once():
+    store = ResultStore(read_once=True, cache_entries=0)
+    store._async = MagicMock()
+    store._async.getdel = AsyncMock(side_effect=["1:Hi ✨", None])
+
+    assert await store.fetch("abc") == {"status": "done", "reply": "Hi ✨"}
+    assert await store.fetch("abc") == {"status": "pending"}
+    store._async.getdel.assert_awaited_with("reply:result:abc")
+
+class FakePubSub:
+    """Just enough of redis.asyncio's PubSub for the listener."""
+
+    def __init__(self, messages: asyncio.Queue):
+        self.messages = messages
+
+    async def subscribe(self, channel):
+        self.channel = channel
+
+    async def listen(self):
+        while True:
+            data = await self.messages.get()
+            if isinstance(data, Exception):
+                raise data
+            yield {"type": "message", "data": data}
+
+    async def aclose(self):
+        pass
+
+async def listening_store(**kwargs):
+    store = ResultStore(**kwargs)
+    messages = asyncio.Queue()
+    store._async = MagicMock()
+    store._async.pubsub.side_effect = lambda **_: FakePubSub(messages)
+    store._async.getdel = AsyncMock(return_value=None)
+    store._async.pipeline.return_value.execute = AsyncMock(return_value=[1, 1])
+    store._async.publish = AsyncMock()
+    await store.listen()
+    return store, messages
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+@pytest.mark.asyncio
+async def test_notified_results_are_served_from_memory():
+    store, messages = await listening_store(read_once=True)
+    messages.put_nowait("+abc 1:Hi ✨")
+    await settle()
+
+    assert await store.fetch("abc") == {"status": "done", "reply": "Hi ✨"}
+    store._async.getdel.assert_not_awaited()
+    # Read-once: deleted in Redis and dropped from the other processes' caches
+    pipe = store._async.pipeline.return_value
+    pipe.unlink.assert_called_once_with("reply:result:abc")
+    pipe.publish.assert_called_once_with("reply:results", "-abc")
+    assert await store.fetch("abc") == {"status": "pending"}
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_cached_results_are_served_once_across_processes():
+    store, messages = await listening_store(read_once=True)
+    messages.put_nowait("+abc 1:Hi ✨")
+    await settle()
+
+    # Another API process deleted the key first: it serves the reply, not us
+    store._async.pipeline.return_value.execute.return_value = [0, 1]
+    assert await store.fetch("abc") == {"status": "pending"}
+    assert await store.fetch("abc") == {"status": "pending"}
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_results_read_from_redis_are_not_revived_by_a_late_notification():
+    store, messages = await listening_store(read_once=True)
+    store._async.getdel.return_value = "1:Hi ✨"
+    assert await store.fetch("abc") == {"status": "done", "reply": "Hi ✨"}
+    await settle()
+    store._async.publish.assert_awaited_once_with("reply:results", "-abc")
+    store._async.pipeline.return_value.unlink.assert_not_called()
+
+    store._async.getdel.return_value = None
+    messages.put_nowait("+abc 1:Hi ✨")
+    await settle()
+    assert await store.fetch("abc") == {"status": "pending"}
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_pending_is_checked_in_redis_once_while_subscribed():
+    store, messages = await listening_store()
+    for _ in range(3):
+        assert await store.fetch("abc") == {"status": "pending"}
+    assert store._async.getdel.await_count == 1
+
+    messages.put_nowait("+abc 0:boom")
+    await settle()
+    assert await store.fetch("abc") == {"status": "failure", "error": "boom"}
+    assert store._async.getdel.await_count == 1
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_pending_entries_are_dropped_when_the_subscription_breaks():
+    store, messages = await listening_store()
+    await store.fetch("abc")
+    messages.put_nowait(ConnectionError("gone"))
+    await settle()
+    assert not store.listening
+    await store.fetch("abc")
+    assert store._async.getdel.await_count == 2
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_consumed_notifications_and_size_bound():
+    store, messages = await listening_store(cache_entries=2)
+    for task_id in ("a", "b", "c"):
+        messages.put_nowait(f"+{task_id} 1:hi")
+    messages.put_nowait("-c")
+    messages.put_nowait("-d")
+    messages.put_nowait("+d 1:hi")  # consumed elsewhere before the worker's notification
+    await settle()
+    assert list(store._cache) == ["b"]
+    await store.stop()
@@ -0,0 +1,80 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from tenacity import wait_none
+
+from app.services.reply import post_chat
+from app.services.retry import (
+    RetryableUpstreamError,
+    RetryBudget,
+    TerminalUpstreamError,
+    error_for_status,
+    parse_retry_after,
+    retry_if_budget,
+)
+
+def fake_session(*responses):
+    """ClientSession stand-in whose post() returns the given responses in order."""
+    session = MagicMock()
+    session.__aenter__ = AsyncMock(return_value=session)
+    session.__aexit__ = AsyncMock(return_value=False)
+    session.post = AsyncMock(side_effect=list(responses))
+    return session
+
+def fake_response(status, body=None, headers=None):
+    resp = MagicMock()
+    resp.status = status
+    resp.headers = headers or {}
+    resp.text = AsyncMock(return_value="error")
+    resp.json = AsyncMock(return_value=body or {})
+    return resp
+
+def test_status_classification():
+    assert isinstance(error_for_status(429), RetryableUpstreamError)
+    assert isinstance(error_for_status(503), RetryableUpstreamError)
+    assert isinstance(error_for_status(400), TerminalUpstreamError)
+    assert isinstance(error_for_status(401), TerminalUpstreamError)
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_withdraw()
+
+@pytest.mark.asyncio
+async def test_post_chat_retries_503_then_succeeds(mocker):
+    session = fake_session(
+        fake_response(503, headers={"Retry-After": "0"}),
+        fake_response(200, {"choices": []}),
+    )
+    mocker.patch("aiohttp.ClientSession", return_value=session)
+
+    assert await post_chat({}) == {"choices": []}
+    assert session.post.await_count == 2
+
+@pytest.mark.asyncio
+async def test_post_chat_does_not_retry_terminal(mocker):
+    session = fake_session(fake_response(400))
+    mocker.patch("aiohttp.ClientSession", return_value=session)
+
+    with pytest.raises(TerminalUpstreamError) as e:
+        await post_chat.retry_with(wait=wait_none())({})
+    assert session.post.await_count == 1
+    assert e.value.__cause__ is not e.value  # already classified: not chained to itself
+
+@pytest.mark.asyncio
+async def test_post_chat_stops_when_budget_empty(mocker):
+    session = fake_session(fake_response(429), fake_response(429))
+    mocker.patch("aiohttp.ClientSession", return_value=session)
+    empty = RetryBudget(ratio=0.0, max_tokens=0)
+
+    with pytest.raises(RetryableUpstreamError):
+        await post_chat.retry_with(wait=wait_none(), retry=retry_if_budget(empty, 3))({})
+    assert session.post.await_count == 1
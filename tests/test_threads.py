@@ -0,0 +1,48 @@
+from app.services.prompt import build_prompt
+from app.services.threads import ThreadContextStore
+
+def payload(history, target="Count me in!", post_id="t1"):
+    return {
+        "postId": post_id,
+        "original": {"username": "op", "text": "Caught the skyline from the rooftop"},
+        "target": {"username": "tg", "text": target},
+        "history": [{"username": f"u{i}", "text": text} for i, text in history],
+    }
+
+def test_history_is_appended_incrementally():
+    store = ThreadContextStore()
+    state = store.observe(payload([(0, "first"), (1, "second")]))
+    assert [e.text for e in state.recent] == ["first", "second", "Count me in!"]
+    store.observe(payload([(0, "first"), (1, "second"), (2, "third")], target="Me too"))
+    assert [e.text for e in state.recent] == ["first", "second", "Count me in!",
+                                              "third", "Me too"]
+
+def test_old_replies_roll_into_a_summary():
+    store = ThreadContextStore()
+    state = store.observe(payload([(i, f"speakeasy tip number {i}") for i in range(60)]))
+    assert len(state.recent) == 50
+    assert state.summary().startswith("11 earlier replies from @u0")
+    assert "speakeasy" in state.summary()
+
+    built = build_prompt(payload([]), thread=state)
+    assert "(11 earlier replies" in built.prompt
+    assert 'TARGET by @tg: "Count me in!"' in built.prompt
+    assert '@tg: "Count me in!"\n  @' not in built.prompt  # target not repeated as history
+
+def test_placeholder_post_ids_get_no_state():
+    store = ThreadContextStore()
+    assert store.observe(payload([], post_id="system-generated")) is None
+    assert len(store) == 0
+
+def test_idle_threads_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.threads.time.monotonic", lambda: now[0])
+    store = ThreadContextStore(idle_seconds=60, max_threads=2)
+    store.observe(payload([], post_id="a"))
+    now[0] += 30
+    store.observe(payload([], post_id="b"))
+    now[0] += 45
+    store.observe(payload([], post_id="c"))
+    assert list(store._threads) == ["b", "c"]
+    store.observe(payload([], post_id="d"))
+    assert list(store._threads) == ["c", "d"]
@@ -0,0 +1,77 @@
+import io
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import pytest
+
+import view_logs
+from view_logs import follow, make_matcher, reverse_lines, scan_all, tail_records
+
+def record(i, level="INFO", name="app.api", rid="-"):
+    return f"2026-01-01 00:00:{i % 60:02d},000 - {name} - {level} - {rid} - message {i}"
+
+@pytest.fixture
+def logs(tmp_path):
+    """app.log.2 (oldest) .. app.log with a traceback split by a rotation."""
+    path = tmp_path / "app.log"
+    (tmp_path / "app.log.2").write_text("\n".join(record(i) for i in range(3)) + "\n")
+    (tmp_path / "app.log.1").write_text(
+        "\n".join([record(3), record(4, "ERROR", "app.services.reply", "r1"),
+                   "Traceback (most recent call last):"]) + "\n")
+    path.write_text("\n".join(['  File "x.py", line 1', "ValueError: boom",
+                               record(5, name="app.access", rid="r1"), record(6)]) + "\n")
+    return str(path)
+
+def test_reverse_lines_across_small_blocks(tmp_path):
+    path = tmp_path / "f"
+    path.write_bytes(b"one\ntwo\nthree\n")
+    with open(path, "rb") as f:
+        assert list(reverse_lines(f, block_size=3)) == [b"", b"three", b"two", b"one"]
+
+def test_tail_without_filters_stays_in_the_newest_file(logs):
+    records = tail_records(logs, 2, make_matcher())
+    assert records == [[record(5, name="app.access", rid="r1")], [record(6)]]
+
+def test_filters_search_backups_and_keep_tracebacks_whole(logs):
+    errors = tail_records(logs, 5, make_matcher(level="warning"))
+    assert errors == [[record(4, "ERROR", "app.services.reply", "r1"),
+                       "Traceback (most recent call last):", '  File "x.py", line 1',
+                       "ValueError: boom"]]
+    by_request = tail_records(logs, 5, make_matcher(request_id="r1"))
+    assert [r[0] for r in by_request] == [record(4, "ERROR", "app.services.reply", "r1"),
+                                          record(5, name="app.access", rid="r1")]
+    assert len(tail_records(logs, 5, make_matcher(logger="app.services"))) == 1
+    assert tail_records(logs, 5, make_matcher(logger="app.serv")) == []
+
+def test_scan_all_streams_oldest_first(logs):
+    out = io.StringIO()
+    scan_all(logs, make_matcher(logger="app"), out)
+    lines = out.getvalue().splitlines()
+    assert lines[0] == record(0) and lines[-1] == record(6) and len(lines) == 10
+
+@pytest.mark.parametrize("watcher", ["inotify", "poll"])
+def test_follow_survives_rotation(tmp_path, monkeypatch, watcher):
+    if watcher == "poll":
+        monkeypatch.setattr(view_logs, "_watcher", lambda path: view_logs._Poller(0.01))
+    path = tmp_path / "app.log"
+    handler = RotatingFileHandler(path, maxBytes=300, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    out = io.StringIO()
+    done = threading.Event()
+    thread = threading.Thread(target=follow, args=(str(path), make_matcher(level="ERROR"), out),
+                              kwargs={"stop": done.is_set, "timeout": 0.05})
+    thread.start()
+    time.sleep(0.1)
+    for i in range(20):
+        handler.emit(logging.makeLogRecord({"msg": record(i, "ERROR" if i % 2 else "INFO")}))
+        time.sleep(0.005)
+    handler.close()
+    deadline = time.monotonic() + 2
+    while out.getvalue().count("\n") < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    done.set()
+    thread.join()
+    assert (tmp_path / "app.log.1").exists()  # it did rotate
+    assert out.getvalue().splitlines() == [record(i, "ERROR") for i in range(1, 20, 2)]
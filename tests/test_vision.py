@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import vision
+from app.services.vision import (
+    collect_captions,
+    describe_images,
+    find_image_urls,
+    parse_numbered_captions,
+    start_captioning,
+)
+
+def test_find_image_urls_in_fields_and_text():
+    p = {
+        "original": {"text": "sunset https://cdn.example.com/a.jpg?w=600", "images": [{"url": "https://x/b.png"}]},
+        "target": {"text": "wow", "image_url": "https://x/c.webp"},
+        "history": [{"username": "u", "text": "same https://cdn.example.com/a.jpg?w=600"}],
+    }
+    assert find_image_urls(p) == [
+        ("target reply", "https://x/c.webp"),
+        ("original post", "https://x/b.png"),
+        ("original post", "https://cdn.example.com/a.jpg?w=600"),
+    ]
+    assert len(find_image_urls(p, limit=1)) == 1
+
+@pytest.mark.asyncio
+async def test_captions_over_budget_are_skipped(monkeypatch):
+    async def fake_describe(url):
+        await asyncio.sleep(0.5 if "slow" in url else 0)
+        return f"caption of {url}"
+
+    monkeypatch.setattr(vision, "describe_image", fake_describe)
+    started = time.monotonic()
+    pending = start_captioning([("target reply", "https://x/fast.jpg"),
+                                ("original post", "https://x/slow.jpg")], batch_size=1)
+    captions = await collect_captions(pending, started, budget=0.1)
+
+    assert captions == [("target reply", "caption of https://x/fast.jpg")]
+    assert time.monotonic() - started < 0.4
+
+def test_parse_numbered_captions():
+    assert parse_numbered_captions("1. A dog\n2) A beach", 2) == ["A dog", "A beach"]
+    assert parse_numbered_captions("1. A dog", 2) is None
+    assert parse_numbered_captions("1. A dog\n1. Again", 2) is None
+
+@pytest.mark.asyncio
+async def test_describe_images_batches_and_falls_back(monkeypatch):
+    calls = []
+
+    async def fake_call(content, max_tokens):
+        calls.append(len(content) - 1)
+        return "1. first\n2. second" if len(content) == 3 else "garbage"
+
+    async def fake_describe(url):
+        return f"single {url}"
+
+    monkeypatch.setattr(vision, "_vision_call", fake_call)
+    monkeypatch.setattr(vision, "describe_image", fake_describe)
+
+    assert await describe_images(["https://x/1.jpg", "https://x/2.jpg"], 2) == ["first", "second"]
+    assert calls == [2]
+
+    captions = await describe_images(["https://x/1.jpg", "https://x/2.jpg", "https://x/3.jpg"], 3)
+    assert captions == ["single https://x/1.jpg", "single https://x/2.jpg", "single https://x/3.jpg"]
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from app.warmup import Readiness, run_checks
+
+@pytest.mark.asyncio
+async def test_ready_once_required_checks_pass():
+    attempts = {"redis": 0}
+
+    async def redis():
+        attempts["redis"] += 1
+        if attempts["redis"] < 3:
+            raise ConnectionError("refused")
+
+    async def dns():
+        raise OSError("no network")
+
+    state = Readiness()
+    await run_checks({"redis": (redis, True), "dns": (dns, False)},
+                     state, timeout=1, retry_seconds=0)
+    assert state.ready
+    assert attempts["redis"] == 3
+    assert state.snapshot() == {"status": "ready",
+                                "checks": {"redis": "ok", "dns": "OSError: no network"}}
+
+@pytest.mark.asyncio
+async def test_not_ready_while_a_required_check_hangs():
+    async def hang():
+        await asyncio.sleep(10)
+
+    state = Readiness()
+    task = asyncio.create_task(run_checks({"broker": (hang, True)}, state,
+                                          timeout=0.01, retry_seconds=0.01))
+    await asyncio.sleep(0.05)
+    assert not state.ready
+    assert state.snapshot()["checks"] == {"broker": "TimeoutError"}
+    task.cancel()
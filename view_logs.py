@@ -1,60 +1,260 @@
+"""
+View, filter and follow the application logs.
+
+    python view_logs.py [-n 50] [-t] [--level WARNING] [--logger app.api] [--request-id ID]
+
+The last N records are found by reading the files backwards in blocks, so
+large logs are never loaded whole; when filters are given the search goes on
+into the rotated app.log.1 ... app.log.N files. Follow mode (-t) waits for
+file-change notifications (inotify on Linux, stat polling elsewhere) and
+switches to the new file when the handler rotates. A record is a header line
+plus any continuation lines (tracebacks), and filters apply to whole records.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import itertools
 import os
+import re
+import select
 import sys
-import argparse
+import time
+from typing import IO, Callable, Iterator, List, Optional
+
+BLOCK_SIZE = 64 * 1024
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
 
-def view_logs(log_file='logs/app.log', lines=50, follow=False):
+# "asctime - name - level - request_id - message"; files written before
+# request ids were logged have no request id field
+RECORD_RE = re.compile(
+    r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} - (?P<name>\S+) - "
+    r"(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL) - (?:(?P<request_id>[\w.:-]+) - )?"
+)
+
+Matcher = Callable[[Optional[re.Match]], bool]
+
+def make_matcher(level: Optional[str] = None, logger: Optional[str] = None,
+                 request_id: Optional[str] = None) -> Matcher:
+    """
+    Predicate on a header match: at least `level`, from `logger` or one of
+    its children, with `request_id`. Lines before the first header match
+    only when no filter is set.
     """
-    View the latest log entries
-    
+    min_level = LEVELS[level.upper()] if level else 0
+    if not (min_level or logger or request_id):
+        return lambda m: True
+
+    def match(m: Optional[re.Match]) -> bool:
+        if m is None:
+            return False
+        if LEVELS[m["level"]] < min_level:
+            return False
+        if logger and not (m["name"] == logger or m["name"].startswith(logger + ".")):
+            return False
+        return not request_id or m["request_id"] == request_id
+    return match
+
+def log_files(path: str) -> List[str]:
+    """The log and its RotatingFileHandler backups, newest first."""
+    files = [path] if os.path.exists(path) else []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        files.append(f"{path}.{n}")
+        n += 1
+    return files
+
+def _decode(line: bytes) -> str:
+    return line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+
+def reverse_lines(f: IO[bytes], block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Lines of a binary file from last to first, reading fixed-size blocks backwards."""
+    pos = f.seek(0, os.SEEK_END)
+    rest = b""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + rest).split(b"\n")
+        rest = lines.pop(0)  # may continue in the previous block
+        for line in reversed(lines):
+            yield line
+    yield rest
+
+def tail_records(path: str, count: int, match: Matcher) -> List[List[str]]:
+    """The last `count` matching records across the log and its backups, oldest first."""
+    if count <= 0:
+        return []
+    found: List[List[str]] = []
+    # Newest-first lines not yet claimed by a header; kept across files since
+    # a rotation can split a traceback from its header line
+    continuation: List[str] = []
+    for name in log_files(path):
+        with open(name, "rb") as f:
+            lines = reverse_lines(f)
+            last = next(lines)
+            if last:  # no trailing newline: the handler is mid-write
+                lines = itertools.chain([last], lines)
+            for raw in lines:
+                line = _decode(raw)
+                m = RECORD_RE.match(line)
+                if m is None:
+                    continuation.append(line)
+                    continue
+                if match(m):
+                    found.append([line] + continuation[::-1])
+                    if len(found) == count:
+                        return found[::-1]
+                continuation = []
+    if continuation and match(None):
+        found.append(continuation[::-1])
+    return found[::-1]
+
+class RecordStream:
+    """Feeds lines in order and yields those of matching records as they arrive."""
+
+    def __init__(self, match: Matcher):
+        self.match = match
+        self.current = match(None)
+
+    def feed(self, line: str) -> bool:
+        m = RECORD_RE.match(line)
+        if m is not None:
+            self.current = self.match(m)
+        return self.current
+
+def scan_all(path: str, match: Matcher, out: IO[str] = sys.stdout) -> None:
+    """Every matching record across the backups and the log, oldest first."""
+    stream = RecordStream(match)
+    for name in reversed(log_files(path)):
+        with open(name, "rb") as f:
+            for raw in f:
+                line = _decode(raw)
+                if stream.feed(line):
+                    print(line, file=out)
+
+class _Inotify:
+    """Directory change notifications through the Linux inotify API."""
+
+    _MASK = 0x2 | 0x40 | 0x80 | 0x100 | 0x200  # MODIFY, MOVED_FROM/TO, CREATE, DELETE
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0 or libc.inotify_add_watch(self.fd, os.fsencode(directory), self._MASK) < 0:
+            raise OSError(ctypes.get_errno(), "inotify unavailable")
+
+    def wait(self, timeout: float) -> None:
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class _Poller:
+    """Fallback: wake up on a short interval."""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(min(timeout, self.interval))
+
+    def close(self) -> None:
+        pass
+
+def _watcher(path: str):
+    if sys.platform.startswith("linux"):
+        try:
+            return _Inotify(os.path.dirname(os.path.abspath(path)))
+        except (OSError, AttributeError):
+            pass
+    return _Poller()
+
+def follow(path: str, match: Matcher, out: IO[str] = sys.stdout,
+           stop: Optional[Callable[[], bool]] = None, timeout: float = 1.0) -> None:
+    """
+    Print matching records appended to `path` until `stop()` is true (or
+    forever). After a rotation the old file is drained before the new one is
+    opened, so no lines are lost.
+    """
+    watcher = _watcher(path)
+    stream = RecordStream(match)
+    f = open(path, "rb")
+    f.seek(0, os.SEEK_END)
+    partial = b""
+    try:
+        while stop is None or not stop():
+            chunk = f.read()
+            if chunk:
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for raw in lines:
+                    line = _decode(raw)
+                    if stream.feed(line):
+                        print(line, file=out, flush=True)
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None  # mid-rotation
+            if st is not None and (st.st_ino != os.fstat(f.fileno()).st_ino
+                                   or st.st_size < f.tell()):
+                f.close()
+                f = open(path, "rb")
+                continue
+            watcher.wait(timeout)
+    finally:
+        f.close()
+        watcher.close()
+
+def view_logs(log_file='logs/app.log', lines=50, follow_logs=False, level=None,
+              logger=None, request_id=None, show_all=False):
+    """
+    View the latest log records
+
     Args:
         log_file: Path to log file
-        lines: Number of lines to display
-        follow: Whether to follow the log file (like tail -f)
+        lines: Number of records to display
+        follow_logs: Whether to follow the log file (like tail -f)
+        level, logger, request_id: Only show records matching these
+        show_all: Show every matching record in the log and its backups
     """
     if not os.path.exists(log_file):
         print(f"Log file not found: {log_file}")
         print("Make sure the server has been started at least once.")
         return
 
-    if follow:
-        # Follow the log file (similar to tail -f)
-        import time
-        from collections import deque
-        
-        # Show last N lines first
-        with open(log_file, 'r') as f:
-            last_lines = deque(f, lines)
-            for line in last_lines:
-                print(line.strip())
-        
-        # Then follow new entries
-        with open(log_file, 'r') as f:
-            f.seek(0, 2)  # Go to the end of the file
-            print(f"\n--- Following log file (Ctrl+C to stop) ---\n")
-            try:
-                while True:
-                    line = f.readline()
-                    if line:
-                        print(line.strip())
-                    else:
-                        time.sleep(0.1)
-            except KeyboardInterrupt:
-                print("\nStopped following log file.")
-    else:
-        # Just display the last N lines
-        try:
-            with open(log_file, 'r') as f:
-                lines_list = f.readlines()
-                for line in lines_list[-lines:]:
-                    print(line.strip())
-        except Exception as e:
-            print(f"Error reading log file: {e}")
+    match = make_matcher(level, logger, request_id)
+    try:
+        if show_all:
+            scan_all(log_file, match)
+        else:
+            for record in tail_records(log_file, lines, match):
+                print("\n".join(record))
+        if follow_logs:
+            print("\n--- Following log file (Ctrl+C to stop) ---\n")
+            follow(log_file, match)
+    except KeyboardInterrupt:
+        print("\nStopped following log file.")
+    except BrokenPipeError:
+        sys.stderr.close()  # piped into head & co.
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="View application logs")
     parser.add_argument('-f', '--file', default='logs/app.log', help='Log file path')
-    parser.add_argument('-n', '--lines', type=int, default=50, help='Number of lines to display')
+    parser.add_argument('-n', '--lines', type=int, default=50, help='Number of records to display')
     parser.add_argument('-t', '--tail', action='store_true', help='Follow the log file (like tail -f)')
-    
+    parser.add_argument('-l', '--level', type=str.upper, choices=list(LEVELS),
+                        help='Minimum level to show')
+    parser.add_argument('--logger', help='Only records from this logger or its children')
+    parser.add_argument('-r', '--request-id', help='Only records for this request id')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='Every matching record in the log and its backups, oldest first')
+
     args = parser.parse_args()
-    view_logs(args.file, args.lines, args.tail) 
\ No newline at end of file
+    view_logs(args.file, args.lines, args.tail, args.level, args.logger,
+              args.request_id, args.all)